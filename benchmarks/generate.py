@@ -0,0 +1,132 @@
+###########################################################################
+# Python (v3.8.5) script generate.py (v1.0) to generate synthetic T3E datasets
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import sys
+import argparse
+import os
+import time
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from genome import read_genome
+
+## Set parameters
+parser = argparse.ArgumentParser(description='T3E: Generate a synthetic dataset (TE annotation, control and sample BED files)')
+parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+parser.add_argument('--genome', action='store', metavar = 'genome', help='chromosome sizes [references/hg38.genome or references/mm10.genome]')
+parser.add_argument('--reads', action='store', metavar = 'reads', default='1000000', help='number of reads of the control and of the sample (e.g. 1M, 5M, 20M) [default: 1M]')
+parser.add_argument('--readlen', action='store', metavar = 'readlen', default='76', help='read length in base pairs [default: 76]')
+parser.add_argument('--multimapping', action='store', metavar = 'multimapping', default='0.2', help='fraction of multimapping reads [default: 0.2]')
+parser.add_argument('--maxmappings', action='store', metavar = 'maxmappings', default='10', help='maximum number of alignments of a multimapping read [default: 10]')
+parser.add_argument('--families', action='store', metavar = 'families', default='1000', help='number of TE families/subfamilies [default: 1000]')
+parser.add_argument('--tedensity', action='store', metavar = 'tedensity', default='1000', help='TE copies per Mb [default: 1000]')
+parser.add_argument('--enriched', action='store', metavar = 'enriched', default='10', help='number of TE families enriched in the sample [default: 10]')
+parser.add_argument('--enrichment', action='store', metavar = 'enrichment', default='0.02', help='fraction of the sample reads placed in the enriched families [default: 0.02]')
+parser.add_argument('--seed', action='store', metavar = 'seed', default='1', help='seed of the random number generator [default: 1]')
+parser.add_argument('--outputfolder', action='store', metavar = 'outputfolder', help='output folder (rmsk.bed, control.bed and sample.bed)')
+args = parser.parse_args()
+
+if (len(sys.argv) == 1):
+	parser.print_help()
+	parser.exit()
+
+read_len = int(args.readlen)
+multimapping = float(args.multimapping)
+max_mappings = int(args.maxmappings)
+num_families = int(args.families)
+te_density = float(args.tedensity)
+outputfolder = args.outputfolder
+
+## Number of lines formatted at once when writing BED files
+WRITE_CHUNK = 1 << 20
+
+## Define functions
+# Reads given as 1000000, 1M or 2.5M
+def parse_count(value):
+	value = value.upper()
+	if value.endswith("M"):
+		return int(float(value[:-1]) * 1000000)
+	if value.endswith("K"):
+		return int(float(value[:-1]) * 1000)
+	return int(value)
+
+# Write sorted (chromosome, start, end, name) rows as a BED file
+def write_bed(bed_file, names, chroms, starts, ends, labels):
+	order = np.lexsort((starts, chroms))
+	with open(bed_file, "w") as o:
+		for first in range(0, len(order), WRITE_CHUNK):
+			sel = order[first:first + WRITE_CHUNK]
+			o.write("".join(f'{names[c]}\t{s}\t{e}\t{l}\n' for c, s, e, l in zip(chroms[sel].tolist(), starts[sel].tolist(), ends[sel].tolist(), labels(sel))))
+
+# rmsk-like annotation: Zipf-distributed family sizes, log-normal copy lengths
+def make_repeats(rng, sizes):
+	num_copies = np.maximum(1, (sizes * te_density / 1e6).astype(np.int64))
+	chroms = np.repeat(np.arange(len(sizes)), num_copies)
+	lengths = np.clip(rng.lognormal(np.log(300), 0.8, len(chroms)).astype(np.int64), 20, 6000)
+	starts = (rng.random(len(chroms)) * (sizes[chroms] - lengths)).astype(np.int64)
+	weights = 1 / np.arange(1, num_families + 1) ** 1.1
+	fams = rng.choice(num_families, len(chroms), p=weights / weights.sum())
+	return chroms, starts, starts + lengths, fams
+
+# Reads of a library: unique reads uniformly on the genome, multimapping reads on
+# several copies of one TE family, and (sample only) extra reads in enriched families
+def make_reads(rng, sizes, repeats, num_reads, enriched, enrichment):
+	te_chroms, te_starts, te_ends, te_fams = repeats
+	copies = np.argsort(te_fams, kind="stable")
+	fam_offsets = np.searchsorted(te_fams[copies], np.arange(num_families + 1))
+	present = np.flatnonzero(np.diff(fam_offsets) > 0)
+	fam_weights = np.diff(fam_offsets)[present] / len(te_fams)
+	# Alignments per read
+	mappings = np.ones(num_reads, dtype=np.int64)
+	multi = rng.random(num_reads) < multimapping
+	mappings[multi] = np.minimum(max_mappings, 2 + rng.geometric(0.5, int(multi.sum())) - 1)
+	read_ids = np.repeat(np.arange(num_reads), mappings)
+	chroms = np.zeros(len(read_ids), dtype=np.int64)
+	starts = np.zeros(len(read_ids), dtype=np.int64)
+	# Reads placed in TE copies: multimappers (one family per read) and enriched reads
+	in_te = multi.copy()
+	read_fams = np.full(num_reads, -1, dtype=np.int64)
+	read_fams[multi] = present[rng.choice(len(present), int(multi.sum()), p=fam_weights)]
+	if (len(enriched) > 0):
+		boost = (~multi) & (rng.random(num_reads) < enrichment)
+		read_fams[boost] = rng.choice(enriched, int(boost.sum()))
+		in_te = in_te | boost
+	aln_te = in_te[read_ids]
+	fam = read_fams[read_ids[aln_te]]
+	copy = copies[fam_offsets[fam] + (rng.random(len(fam)) * (fam_offsets[fam + 1] - fam_offsets[fam])).astype(np.int64)]
+	chroms[aln_te] = te_chroms[copy]
+	starts[aln_te] = te_starts[copy] + (rng.random(len(copy)) * (te_ends[copy] - te_starts[copy])).astype(np.int64) - read_len // 2
+	unique = ~aln_te
+	chroms[unique] = rng.choice(len(sizes), int(unique.sum()), p=sizes / sizes.sum())
+	starts[unique] = (rng.random(int(unique.sum())) * (sizes[chroms[unique]] - read_len)).astype(np.int64)
+	starts = np.clip(starts, 0, sizes[chroms] - read_len)
+	return chroms, starts, read_ids
+
+## Main code
+start_time = time.time()
+rng = np.random.default_rng(int(args.seed))
+num_reads = parse_count(args.reads)
+names, sizes = read_genome(args.genome)
+sizes = np.array(sizes, dtype=np.int64)
+os.makedirs(outputfolder, exist_ok=True)
+repeats = make_repeats(rng, sizes)
+family_names = [f'TE{f:04d}' for f in range(num_families)]
+write_bed(os.path.join(outputfolder, "rmsk.bed"), names, repeats[0], repeats[1], repeats[2], lambda sel: [family_names[f] for f in repeats[3][sel].tolist()])
+enriched = rng.choice(np.unique(repeats[3]), min(int(args.enriched), len(np.unique(repeats[3]))), replace=False)
+time_point_a = time.time()
+print(f'[REPEATS] {len(repeats[0])} copies of {num_families} families: {time_point_a - start_time:.2f}s')
+for (library, library_enriched, fraction) in (("control", [], 0.0), ("sample", enriched, float(args.enrichment))):
+	time_point_a = time.time()
+	chroms, starts, read_ids = make_reads(rng, sizes, repeats, num_reads, library_enriched, fraction)
+	prefix = f'SYN:{library}:H00000:1'
+	write_bed(os.path.join(outputfolder, library + ".bed"), names, chroms, starts, starts + read_len, lambda sel: [f'{prefix}:{11101 + r % 1000}:{r}' for r in read_ids[sel].tolist()])
+	time_point_b = time.time()
+	print(f'[{library.upper()}] {num_reads} reads, {len(starts)} alignments: {time_point_b - time_point_a:.2f}s')
+with open(os.path.join(outputfolder, "enriched.txt"), "w") as o:
+	for f in sorted(enriched.tolist()):
+		print(family_names[f], file=o)
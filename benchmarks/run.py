@@ -0,0 +1,227 @@
+###########################################################################
+# Python (v3.8.5) script run.py (v1.0) to benchmark the T3E pipeline
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import sys
+import argparse
+import os
+import json
+import time
+import platform
+import shutil
+import subprocess
+import numpy as np
+
+## Set parameters
+parser = argparse.ArgumentParser(description='T3E: Benchmark the pipeline on synthetic datasets')
+parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+parser.add_argument('--scales', action='store', metavar = 'scales', default='1M', help='numbers of reads of the control and the sample, separated by commas [default: 1M, Example: 1M,5M,20M]')
+parser.add_argument('--species', action='store', metavar = 'species', default='hg38', help='hg38 (Homo sapiens) or mm10 (Mus musculus), chromosome sizes from references/<species>.genome [default: hg38]')
+parser.add_argument('--multimapping', action='store', metavar = 'multimapping', default='0.2', help='fraction of multimapping reads [default: 0.2]')
+parser.add_argument('--readlen', action='store', metavar = 'readlen', default='76', help='read length in base pairs [default: 76]')
+parser.add_argument('--iter', action='store', metavar = 'iter', default='10', help='number of iterations of t3e.py [default: 10]')
+parser.add_argument('--workers', action='store', metavar = 'workers', default='1', help='number of processes of t3e.py [default: 1]')
+parser.add_argument('--seed', action='store', metavar = 'seed', default='1', help='seed of the datasets and of the simulations [default: 1]')
+parser.add_argument('--data', action='store', metavar = 'data', default='benchmarks/data', help='folder of the synthetic datasets, generated once and reused [default: benchmarks/data]')
+parser.add_argument('--output', action='store', metavar = 'output', default='benchmarks/results.json', help='JSON report [default: benchmarks/results.json]')
+parser.add_argument('--compare', action='store', metavar = 'compare', help='earlier JSON report: print the change of every stage and flag regressions')
+parser.add_argument('--tolerance', action='store', metavar = 'tolerance', default='1.2', help='ratio of wall time (or peak memory) above which a stage is a regression [default: 1.2]')
+args = parser.parse_args()
+
+if (len(sys.argv) == 1):
+	parser.print_help()
+	parser.exit()
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+WORKDIR = os.path.dirname(BENCHDIR)
+CODEDIR = os.path.join(WORKDIR, "scripts")
+read_len = args.readlen
+num_iter = args.iter
+tolerance = float(args.tolerance)
+
+## Changes below these are never regressions (timing noise of short stages)
+MIN_WALL_S = 1.0
+MIN_RSS_MB = 50.0
+
+## Define functions
+# Run a command and measure it: wall time, CPU time and peak RSS of the process (from
+# wait4, so each stage gets its own high-water mark)
+def run_stage(name, command, items):
+	print(f'[BENCHMARK] {name}: {" ".join(command)}')
+	start = time.time()
+	process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+	output = process.stdout.read()
+	(pid, status, usage) = os.wait4(process.pid, 0)
+	process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status >> 8
+	wall = time.time() - start
+	if (process.returncode != 0):
+		print(output)
+		sys.exit(f'[ERROR] {name} failed!')
+	stage = {
+		"wall_s": round(wall, 3),
+		"cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+		"peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+		"items": items,
+		"items_per_s": round(items / wall, 1) if (wall > 0) else None,
+	}
+	print(f'[BENCHMARK] {name}: {wall:.2f}s, {stage["peak_rss_mb"]} MB')
+	return stage, output
+
+# Phases of a JSON-lines trace (--trace of the scripts): wall and CPU time and items
+# summed over chromosomes and workers, peak RSS of the phase
+def trace_phases(trace):
+	phases = {}
+	with open(trace, "r") as t:
+		for line in t:
+			record = json.loads(line)
+			phase = phases.setdefault(record["phase"], {"wall_s": 0.0, "cpu_s": 0.0, "items": 0, "peak_rss_mb": 0.0})
+			phase["wall_s"] = round(phase["wall_s"] + record["wall"], 3)
+			phase["cpu_s"] = round(phase["cpu_s"] + record["cpu"], 3)
+			phase["items"] = phase["items"] + record["items"]
+			phase["peak_rss_mb"] = max(phase["peak_rss_mb"], record["rss_mb"])
+	return phases
+
+# Number of alignments and reads of a read table
+def table_info(table):
+	info = {}
+	with open(os.path.join(table, "info.txt"), "r") as f:
+		for line in f:
+			(key, value) = line.rstrip("\n").split("\t")
+			info[key] = int(value)
+	return info
+
+# Dataset of one scale: generated once, reused by later runs with the same parameters
+def dataset(scale):
+	folder = os.path.join(args.data, f'{args.species}_{scale}_m{args.multimapping}_rl{read_len}_s{args.seed}')
+	if not os.path.isfile(os.path.join(folder, "enriched.txt")):
+		subprocess.run([sys.executable, os.path.join(BENCHDIR, "generate.py"), "--genome", os.path.join(WORKDIR, "references", args.species + ".genome"), "--reads", scale, "--readlen", read_len, "--multimapping", args.multimapping, "--seed", args.seed, "--outputfolder", folder], check=True)
+	return folder
+
+# All the stages of the pipeline on one dataset
+def benchmark(scale):
+	folder = dataset(scale)
+	repeats = os.path.join(folder, "rmsk.bed")
+	out = os.path.join(folder, "run")
+	os.makedirs(os.path.join(out, "probabilities"), exist_ok=True)
+	python = [sys.executable, "-u"]
+	stages = {}
+	tables = {}
+	info = {}
+	for library in ("control", "sample"):
+		tables[library] = os.path.join(out, library + ".reads")
+		stages[f'ingest_{library}'], output = run_stage(f'ingest_{library}', python + [os.path.join(CODEDIR, "ingest.py"), "--input", os.path.join(folder, library + ".bed"), "--output", tables[library], "--readlen", read_len], 0)
+		info[library] = table_info(tables[library])
+		stages[f'ingest_{library}']["items"] = info[library]["num_alignments"]
+		stages[f'ingest_{library}']["items_per_s"] = round(info[library]["num_alignments"] / stages[f'ingest_{library}']["wall_s"], 1)
+	for library in ("control", "sample"):
+		stages[f'count_{library}'], output = run_stage(f'count_{library}', python + [os.path.join(CODEDIR, "count.py"), "--bed", tables[library], "--repeat", repeats, "--readlen", read_len, "--output", os.path.join(out, library + "_counts.txt")], info[library]["num_alignments"])
+	stages["probabilities"], output = run_stage("probabilities", python + [os.path.join(CODEDIR, "probabilities.py"), "--control", tables["control"], "--readlen", read_len, "--species", args.species, "--outputfolder", os.path.join(out, "probabilities"), "--trace", os.path.join(out, "probabilities_trace.jsonl")], info["control"]["num_alignments"])
+	# The control index is built by the first run: time it separately from the simulations
+	shutil.rmtree(os.path.join(out, "control_index"), ignore_errors=True)
+	t3e = python + [os.path.join(CODEDIR, "t3e.py"), "--repeat", repeats, "--sample", tables["sample"], "--readlen", read_len, "--control", tables["control"], "--controlcounts", os.path.join(out, "control_counts.txt"), "--probability", os.path.join(out, "probabilities"), "--iter", num_iter, "--species", args.species, "--seed", args.seed, "--workers", args.workers, "--outputfolder", out, "--outputprefix", "sample", "--trace", os.path.join(out, "t3e_trace.jsonl")]
+	stages["t3e_first_run"], output = run_stage("t3e_first_run", t3e, info["sample"]["num_reads"] * int(num_iter))
+	stages["t3e"], output = run_stage("t3e", t3e, info["sample"]["num_reads"] * int(num_iter))
+	phases = trace_phases(os.path.join(out, "t3e_trace.jsonl"))
+	families = sum(1 for line in open(os.path.join(out, "sample_counts.txt"), "r"))
+	stages["enrichment"], output = run_stage("enrichment", python + [os.path.join(CODEDIR, "enrichment.py"), "--background", os.path.join(out, "sample_background.npz"), "--signal", os.path.join(out, "sample_counts.txt"), "--alpha", "0.05", "--enrichment", "1.0", "--outputfolder", out, "--outputprefix", "sample"], families * int(num_iter))
+	stages["expected"], output = run_stage("expected", python + [os.path.join(CODEDIR, "expected.py"), "--repeat", repeats, "--sample", tables["sample"], "--readlen", read_len, "--control", tables["control"], "--probability", os.path.join(out, "probabilities"), "--species", args.species, "--signal", os.path.join(out, "sample_counts.txt"), "--outputfolder", out, "--outputprefix", "sample"], info["control"]["num_alignments"])
+	return {
+		"scale": scale,
+		"control": info["control"],
+		"sample": info["sample"],
+		"stages": stages,
+		"t3e_phases": phases,
+		"probabilities_phases": trace_phases(os.path.join(out, "probabilities_trace.jsonl")),
+		"expected_validation": validate_expected(os.path.join(out, "sample_background.npz"), os.path.join(out, "sample_expected.txt"), os.path.join(folder, "enriched.txt")),
+	}
+
+# Analytical background (expected.py) against the simulations (t3e.py) of one dataset:
+# distance of the expected mean to the simulated mean in standard errors (within 3 for
+# about 99.7% of the families if both agree), relative errors of the mean and standard
+# deviation, and the families called at p < 1 / iterations (the smallest p-value of the
+# simulations) by both, and their recall of the enriched families of the dataset
+def validate_expected(background, expected, enriched):
+	with np.load(background) as b:
+		matrix = b["background"]
+		column = dict((str(f), i) for i, f in enumerate(b["families"]))
+	rows = [line.rstrip("\n").split("\t") for line in open(expected, "r")][1:]
+	rows = [row for row in rows if row[0] in column and matrix[:, column[row[0]]].mean() > 0]
+	num_iter = len(matrix)
+	mc = matrix[:, [column[row[0]] for row in rows]]
+	mc_mean = mc.mean(axis=0)
+	mc_sd = mc.std(axis=0, ddof=1)
+	observed = np.array([float(row[1]) for row in rows])
+	mean = np.array([float(row[2]) for row in rows])
+	sd = np.array([float(row[3]) for row in rows])
+	z = (mean - mc_mean) / np.maximum(mc_sd / np.sqrt(num_iter), 1e-12)
+	mc_called = set(row[0] for row, count in zip(rows, np.sum(mc > observed, axis=0)) if count == 0)
+	called = set(row[0] for row in rows if float(row[4]) < 1 / num_iter)
+	truth = set(line.strip() for line in open(enriched, "r") if line.strip())
+	validation = {
+		"families": len(rows),
+		"iterations": num_iter,
+		"mean_within_3_se": round(float(np.mean(np.abs(z) <= 3)), 4),
+		"mean_relative_error_median": round(float(np.median(np.abs(mean / mc_mean - 1))), 6),
+		"mean_relative_error_max": round(float(np.max(np.abs(mean / mc_mean - 1))), 6),
+		"sd_ratio_median": round(float(np.median(sd / np.maximum(mc_sd, 1e-12))), 4),
+		"called_simulations": len(mc_called),
+		"called_expected": len(called),
+		"called_both": len(called & mc_called),
+		"enriched_recall_simulations": round(len(mc_called & truth) / max(len(truth), 1), 4),
+		"enriched_recall_expected": round(len(called & truth) / max(len(truth), 1), 4),
+	}
+	print(f'[VALIDATION] {validation["families"]} families, {num_iter} iterations: expected mean within 3 standard errors of the simulations for {validation["mean_within_3_se"]:.1%}, median relative error {validation["mean_relative_error_median"]:.2e}, median sd ratio {validation["sd_ratio_median"]:.3f}')
+	print(f'[VALIDATION] Called at p < 1/{num_iter}: {validation["called_simulations"]} by the simulations, {validation["called_expected"]} by expected.py, {validation["called_both"]} by both; recall of the enriched families {validation["enriched_recall_simulations"]:.2f} and {validation["enriched_recall_expected"]:.2f}')
+	return validation
+
+# Current commit of the repository (if it is a git checkout)
+def code_version():
+	try:
+		return subprocess.run(["git", "-C", WORKDIR, "describe", "--always", "--dirty"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+	except OSError:
+		return None
+
+# Print the change of every stage against an earlier report
+def compare(report, previous):
+	old = dict((result["scale"], result) for result in previous["results"])
+	regressions = 0
+	for result in report["results"]:
+		if (result["scale"] not in old):
+			continue
+		for name, stage in result["stages"].items():
+			before = old[result["scale"]]["stages"].get(name)
+			if (before is None):
+				continue
+			wall_ratio = stage["wall_s"] / max(before["wall_s"], 1e-3)
+			rss_ratio = stage["peak_rss_mb"] / max(before["peak_rss_mb"], 1e-3)
+			slower = wall_ratio > tolerance and stage["wall_s"] - before["wall_s"] > MIN_WALL_S
+			larger = rss_ratio > tolerance and stage["peak_rss_mb"] - before["peak_rss_mb"] > MIN_RSS_MB
+			flag = "[REGRESSION] " if (slower or larger) else ""
+			regressions = regressions + (1 if flag else 0)
+			print(f'{flag}{result["scale"]} {name}: wall {before["wall_s"]}s -> {stage["wall_s"]}s (x{wall_ratio:.2f}), peak RSS {before["peak_rss_mb"]} -> {stage["peak_rss_mb"]} MB (x{rss_ratio:.2f})')
+	return regressions
+
+## Main code
+report = {
+	"version": code_version(),
+	"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+	"python": platform.python_version(),
+	"numpy": np.__version__,
+	"platform": platform.platform(),
+	"parameters": {"species": args.species, "multimapping": float(args.multimapping), "readlen": int(read_len), "iter": int(num_iter), "workers": int(args.workers), "seed": int(args.seed)},
+	"results": [benchmark(scale) for scale in args.scales.split(",")],
+}
+os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+with open(args.output, "w") as o:
+	json.dump(report, o, indent=1)
+print(f'[BENCHMARK] Report: {args.output}')
+if args.compare:
+	with open(args.compare, "r") as f:
+		regressions = compare(report, json.load(f))
+	if (regressions > 0):
+		sys.exit(f'[ERROR] {regressions} regression(s) above x{tolerance}')
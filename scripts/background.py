@@ -0,0 +1,67 @@
+###########################################################################
+# Python (v3.8.5) script background.py (v1.0) for background and shard files
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import sys
+import glob
+import numpy as np
+
+## Define functions
+# Background of one sample: iterations x families matrix and family names (NumPy
+# archive <background>.npz), and with 'text' the same values as
+# iter<TAB>family<TAB>count lines (<background>.txt)
+def write_background(background, matrix, families, text=False):
+	np.savez(background + '.npz', background=matrix, families=np.array(families))
+	if text:
+		with open(background + '.txt', "w") as backg:
+			for iteration in range(len(matrix)):
+				for f, family in enumerate(families):
+					print(f'iter{iteration + 1}\t{family}\t{matrix[iteration, f]}', file=backg)
+
+# Partial background of the chromosomes of a shard (named after its first chromosome,
+# shards are disjoint)
+def shard_file(background, chromosomes):
+	return f'{background}.{chromosomes[0]}.shard.npz'
+
+# Shard files of a background
+def find_shards(background):
+	return sorted(glob.glob(glob.escape(background) + ".*.shard.npz"))
+
+# Write a shard: one iterations x families matrix per chromosome (chromosomes x
+# iterations x families), with the chromosomes of the whole run and the seed, so that
+# the merge can check that the shards belong together
+def save_shard(path, counts, chromosomes, all_chromosomes, families, seed):
+	np.savez(path, counts=counts, chromosomes=np.array(chromosomes), all_chromosomes=np.array(all_chromosomes), families=np.array(families), seed=np.array(str(seed)))
+
+# Sum the shards of one run into the background matrix (iterations x families). The
+# chromosomes are added in the order of the run, as t3e.py does without shards, so the
+# background is identical to that of a single run with the same seed.
+def merge_shards(paths):
+	parts = {}
+	reference = None
+	for path in paths:
+		with np.load(path) as shard:
+			header = ([str(c) for c in shard["all_chromosomes"]], [str(f) for f in shard["families"]], str(shard["seed"]), shard["counts"].shape[1])
+			if reference is None:
+				reference = header
+			elif (header != reference):
+				sys.exit(f'[ERROR] Shard {path} does not belong to the same run (chromosomes, families, seed or iterations differ)!')
+			for c, chromosome in enumerate(shard["chromosomes"]):
+				if str(chromosome) in parts:
+					sys.exit(f'[ERROR] Chromosome {chromosome} is in more than one shard!')
+				parts[str(chromosome)] = shard["counts"][c]
+	if reference is None:
+		sys.exit("[ERROR] No shards to merge!")
+	(all_chromosomes, families, seed, num_iter) = reference
+	missing = [chromosome for chromosome in all_chromosomes if chromosome not in parts]
+	if missing:
+		sys.exit(f'[ERROR] No shard for chromosome(s): {",".join(missing)}')
+	matrix = np.zeros((num_iter, len(families)))
+	for chromosome in all_chromosomes:
+		matrix += parts[chromosome]
+	return matrix, families
@@ -0,0 +1,183 @@
+###########################################################################
+# Python (v3.8.5) script control_index.py (v1.0) for the binary control index
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import os
+import shutil
+import hashlib
+import socket
+import numpy as np
+from collections import OrderedDict
+from readtable import load_reads, is_read_table, index_dtype, read_rows
+
+## Index format version (part of the key and written in version.txt, bump it when the
+## layout changes)
+INDEX_VERSION = 4
+INDEX_FILES = ["positions", "chrom_offsets", "aln_chroms", "read_ids", "map_counts", "read_offsets", "read_alignments", "multi_slots", "multi_offsets", "multi_chroms", "multi_positions"]
+
+## Define functions
+# Content hash of the control (BED file or read table) and read length
+def control_key(control_file, read_len):
+	h = hashlib.sha1()
+	h.update(f'v{INDEX_VERSION};readlen={read_len};'.encode())
+	if is_read_table(control_file):
+		files = [os.path.join(control_file, name) for name in sorted(os.listdir(control_file))]
+	else:
+		files = [control_file]
+	for name in files:
+		with open(name, "rb") as f:
+			for chunk in iter(lambda: f.read(1 << 20), b""):
+				h.update(chunk)
+	return h.hexdigest()
+
+# Default index folder: next to the control probabilities folder
+def default_index_folder(prob_path):
+	return os.path.join(os.path.dirname(os.path.normpath(prob_path)), "control_index")
+
+# Build the index arrays of a control BED file or read table:
+#   positions        start of each alignment (file order, sorted by chromosome)
+#   chrom_offsets    first alignment of each chromosome (plus the total at the end)
+#   aln_chroms       chromosome of each alignment
+#   read_ids         read of each alignment
+#   map_counts       number of alignments of each read
+#   read_offsets     CSR row pointer: alignments of read r are
+#   read_alignments  read_alignments[read_offsets[r]:read_offsets[r + 1]]
+# and the multimapper table, which holds the alignments of the reads with more than one
+# (the other reads only have the alignment that refers to them):
+#   multi_slots      row of the read of each alignment in the table (-1: one alignment)
+#   multi_offsets    CSR row pointer: alignments of row m are
+#   multi_chroms     multi_chroms[multi_offsets[m]:multi_offsets[m + 1]] (chromosome)
+#   multi_positions  multi_positions[multi_offsets[m]:multi_offsets[m + 1]] (start)
+def build_control_index(control_file):
+	chrom_names, chroms, starts, ends, reads, num_reads = load_reads(control_file)
+	num_aln = len(starts)
+	map_counts = np.bincount(reads, minlength=num_reads)
+	read_offsets = np.zeros(num_reads + 1, dtype=np.int64)
+	np.cumsum(map_counts, out=read_offsets[1:])
+	arrays = {
+		"positions": starts.astype(index_dtype(int(starts.max()) if num_aln else 0)),
+		"chrom_offsets": np.searchsorted(chroms, np.arange(len(chrom_names) + 1)).astype(np.int64),
+		"aln_chroms": chroms,
+		"read_ids": reads.astype(index_dtype(num_reads)),
+		"map_counts": map_counts.astype(np.int32),
+		"read_offsets": read_offsets,
+		"read_alignments": np.argsort(reads, kind="stable").astype(index_dtype(num_aln)),
+	}
+	multi = map_counts > 1
+	slots = np.full(num_reads, -1, dtype=np.int64)
+	slots[multi] = np.arange(int(np.sum(multi)))
+	multi_alignments = arrays["read_alignments"][multi[reads[arrays["read_alignments"]]]]
+	arrays["multi_slots"] = slots[reads].astype(index_dtype(int(np.sum(multi))))
+	arrays["multi_offsets"] = np.concatenate(([0], np.cumsum(map_counts[multi]))).astype(np.int64)
+	arrays["multi_chroms"] = chroms[multi_alignments]
+	arrays["multi_positions"] = arrays["positions"][multi_alignments]
+	return chrom_names, arrays
+
+# Save an index to folder/<key> (written in a temporary folder and renamed,
+# so concurrent runs, also on other machines sharing the folder, never see a
+# half-written index)
+def save_control_index(folder, key, chrom_names, arrays):
+	final = os.path.join(folder, key)
+	tmp = final + f'.tmp{socket.gethostname()}.{os.getpid()}'
+	os.makedirs(tmp, exist_ok=True)
+	with open(os.path.join(tmp, "chromosomes.txt"), "w") as o:
+		for chrom in chrom_names:
+			print(chrom, file=o)
+	for name in INDEX_FILES:
+		np.save(os.path.join(tmp, name + ".npy"), arrays[name])
+	with open(os.path.join(tmp, "version.txt"), "w") as o:
+		print(INDEX_VERSION, file=o)
+	try:
+		os.rename(tmp, final)
+	except OSError:
+		shutil.rmtree(tmp, ignore_errors=True)
+		# A concurrent run saved the same index first, else the rename itself failed
+		if not complete_control_index(final):
+			raise
+	return final
+
+# Whether a saved index has all its files and the current version
+def complete_control_index(path):
+	version_file = os.path.join(path, "version.txt")
+	if not os.path.isfile(version_file):
+		return False
+	with open(version_file, "r") as f:
+		if (f.read().strip() != str(INDEX_VERSION)):
+			return False
+	return os.path.isfile(os.path.join(path, "chromosomes.txt")) and all(os.path.isfile(os.path.join(path, name + ".npy")) for name in INDEX_FILES)
+
+# Open a saved index with memory mapping
+def open_control_index(path):
+	with open(os.path.join(path, "chromosomes.txt"), "r") as f:
+		chrom_names = [line.rstrip("\n") for line in f]
+	arrays = {}
+	for name in INDEX_FILES:
+		arrays[name] = np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+	return chrom_names, arrays
+
+# Open the index of a control BED file or read table, building it first if it does not exist yet
+def load_control_index(control_file, read_len, folder):
+	key = control_key(control_file, read_len)
+	path = os.path.join(folder, key)
+	if not os.path.isdir(path):
+		chrom_names, arrays = build_control_index(control_file)
+		path = save_control_index(folder, key, chrom_names, arrays)
+	return open_control_index(path)
+
+# All alignments of the given reads (CSR expansion): returns the alignment indices and,
+# for each of them, the position of its read in 'reads'
+def read_alignments_of(read_offsets, read_alignments, reads):
+	first = read_offsets[reads]
+	counts = read_offsets[reads + 1] - first
+	owner = np.repeat(np.arange(len(reads)), counts)
+	within = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+	return read_alignments[first[owner] + within], owner
+
+# Chromosomes (indices) whose control reads can reach the chromosomes marked in
+# 'targets' (e.g. those with TE copies): the targets, and the chromosomes with an
+# alignment of a read that also has an alignment on a target
+def reachable_chromosomes(arrays, targets):
+	targets = np.array(targets, dtype=bool)
+	reachable = set(np.flatnonzero(targets).tolist())
+	multi_offsets = np.asarray(arrays["multi_offsets"])
+	if (len(multi_offsets) > 1):
+		multi_chroms = np.asarray(arrays["multi_chroms"])
+		on_target = np.logical_or.reduceat(targets[multi_chroms], multi_offsets[:-1])
+		reachable.update(np.unique(multi_chroms[np.repeat(on_target, np.diff(multi_offsets))]).tolist())
+	return sorted(reachable)
+
+# Rows [first, last) of an index array, read from its file (the arrays of
+# open_control_index are memory maps of the .npy files) without mapping the rest
+def index_rows(arrays, name, first, last):
+	return read_rows(arrays[name].filename, first, last)
+
+# Least recently used cache of blocks (dictionaries of arrays, e.g. the control reads and
+# probabilities of one chromosome) loaded on demand, holding at most max_bytes; a block
+# larger than that is loaded for each use and not kept
+class BlockCache:
+	def __init__(self, load, max_bytes):
+		self.load = load
+		self.max_bytes = max_bytes
+		self.blocks = OrderedDict()
+		self.size = 0
+		self.loads = 0
+
+	def get(self, key):
+		if key in self.blocks:
+			self.blocks.move_to_end(key)
+			return self.blocks[key]
+		block = self.load(key)
+		self.loads = self.loads + 1
+		size = sum(array.nbytes for array in block.values() if array is not None)
+		while (self.blocks and self.size + size > self.max_bytes):
+			(old_key, old_block) = self.blocks.popitem(last=False)
+			self.size = self.size - sum(array.nbytes for array in old_block.values() if array is not None)
+		if (size <= self.max_bytes):
+			self.blocks[key] = block
+			self.size = self.size + size
+		return block
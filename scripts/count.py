@@ -0,0 +1,58 @@
+###########################################################################
+# Python (v3.8.5) script count.py (v1.0) to count for TE families/subfamilies
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import sys
+import argparse
+import time
+import numpy as np
+from readtable import load_reads
+from overlap import read_te_index, family_overlaps
+
+## Set parameters
+parser = argparse.ArgumentParser(description='T3E: Count for TE families/subfamilies')
+parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+parser.add_argument('--bed', action='store', metavar = 'bed_file', help='ChIP-seq experiment sorted by coordinates [BED format or read table folder]')
+parser.add_argument('--repeat', action='store', metavar = 'repeat_file', help='transposable elements annotation sorted by coordinates [rmsk_hg38.bed (Homo sapiens) or rmsk_mm10.bed (Mus musculus)]')
+parser.add_argument('--readlen', action='store', metavar = 'readlen', help='ChIP-seq experiment read length in base pairs [Example --readlen 36]')
+parser.add_argument('--output', action='store', metavar = 'output', help='output counts file [default: standard output]')
+args = parser.parse_args()
+
+if (len(sys.argv) == 1):
+	parser.print_help()
+	parser.exit()
+
+bed = args.bed
+repeats = args.repeat
+read_len = int(args.readlen)
+
+## Main code
+# Each alignment of a read with 'frequency' alignments contributes
+# overlap / (frequency * read_len) to the family of every TE copy it overlaps; the
+# overlaps are computed chromosome by chromosome with the same engine as t3e.py
+time_point_a = time.time()
+chrom_names, chroms, starts, ends, reads, num_reads = load_reads(bed)
+frequency = np.bincount(reads, minlength=num_reads)
+read_weights = 1 / (frequency[reads] * read_len)
+groups, te_index = read_te_index(repeats)
+time_point_b = time.time()
+print(f'[COUNT] Read {len(starts)} alignments of {num_reads} reads: {time_point_b - time_point_a:.2f}s', file=sys.stderr)
+counts = np.zeros(len(groups))
+chrom_offsets = np.searchsorted(chroms, np.arange(len(chrom_names) + 1))
+for c, chrom in enumerate(chrom_names):
+	first = chrom_offsets[c]
+	last = chrom_offsets[c + 1]
+	counts += family_overlaps(te_index.get(chrom), starts[first:last], ends[first:last] - 1, read_weights[first:last], len(groups))
+time_point_c = time.time()
+print(f'[COUNT] Count for TE families/subfamilies: {time_point_c - time_point_b:.2f}s', file=sys.stderr)
+out = open(args.output, "w") if args.output else sys.stdout
+for repeat in sorted(groups):
+	if (counts[groups[repeat]] > 0):
+		print(f'{repeat}\t{counts[groups[repeat]]:.15g}', file=out)
+if args.output:
+	out.close()
@@ -1,6 +1,6 @@
 ###########################################################################
-# Python (v3.8.5) script enrichment.py (v1.0) to calculate enrichments
-# Last update: 2022_06_07
+# Python (v3.8.5) script enrichment.py (v1.1) to calculate enrichments
+# Last update: 2026_10_18
 # Author: Michelle Almeida da Paz
 ###########################################################################
 
@@ -10,65 +10,143 @@ import math
 import argparse
 import os
 import sys
+import numpy as np
+from sequential import stop_exceedances, sequential_counts
+from metrics import Metrics
 
 parser = argparse.ArgumentParser(description='T3E: Enrichment')
-parser.add_argument('--version', action='version', version='%(prog)s 1.0')
-parser.add_argument('--background', action='store', metavar = 'background', help='background file created by T3E [Example: sample001_background.txt]')
-parser.add_argument('--signal', action='store', metavar = 'signal', help='ChIP-seq sample experiment counts [.txt format]')
-parser.add_argument('--iter', action='store', metavar = 'iter', help='number of interations [Example: 100]')
+parser.add_argument('--version', action='version', version='%(prog)s 1.1')
+parser.add_argument('--background', action='store', metavar = 'background', help='background file created by T3E [.npz or .txt format], one per sample separated by commas [Example: sample001_background.npz]')
+parser.add_argument('--signal', action='store', metavar = 'signal', help='ChIP-seq sample experiment counts [.txt format], one per sample separated by commas')
+parser.add_argument('--iter', action='store', metavar = 'iter', help='number of interations requested from t3e.py, for the stopping rule of --exceedances (p-values use the iterations in the background) [Example: 100, default: iterations in the background]')
 parser.add_argument('--alpha', action='store', metavar = 'alpha', help='level of significance to report enrichment [Example: 0.05]')
+parser.add_argument('--exceedances', action='store', metavar = 'exceedances', help='sequential p-values: a family stops at this number of background counts above its count (as t3e.py --signal) and its effective number of iterations is reported [default: fixed number of iterations]')
 parser.add_argument('--enrichment', action='store', metavar = 'enrichment', help='log2FC threshold to report enrichment [Example: 1.0]')
-parser.add_argument('--outputfolder', action='store', metavar = 'outputfolder', help='output folder path [Example: /results]')
-parser.add_argument('--outputprefix', action='store', metavar = 'outputprefix', help='prefix name of your analysis [Example: sample001]')
+parser.add_argument('--quantiles', action='store', metavar = 'quantiles', default='0.05,0.5,0.95', help='background quantiles of the combined table [default: 0.05,0.5,0.95]')
+parser.add_argument('--combined', action='store', metavar = 'combined', help='combined enrichment table of all samples (one line per sample and family, with background mean, sd and quantiles)')
+parser.add_argument('--trace', action='store', metavar = 'trace', help='write wall time, CPU time, items and peak memory of every sample [.jsonl: JSON lines, .json: Chrome trace format]')
+parser.add_argument('--profile', action='store', metavar = 'profile', help='profile the enrichment of every sample with cProfile and write the statistics to this file [read with: python -m pstats <file>]')
+parser.add_argument('--outputfolder', action='store', metavar = 'outputfolder', help='output folder path, one for all samples or one per sample separated by commas [Example: /results]')
+parser.add_argument('--outputprefix', action='store', metavar = 'outputprefix', help='prefix name of your analysis, one per sample separated by commas [Example: sample001]')
 args = parser.parse_args()
 
 if (len(sys.argv) == 1):
 	parser.print_help()
 	parser.exit()
 
-background = args.background
-signal = args.signal
-num_iter = int(args.iter)
+backgrounds = args.background.split(",")
+signals = args.signal.split(",")
 alpha = float(args.alpha)
 enrichment = float(args.enrichment)
-outputprefix = args.outputprefix
-output = args.outputfolder + os.path.sep + outputprefix + '_enrichment.txt'
+quantiles = [float(q) for q in args.quantiles.split(",")]
+outputprefixes = args.outputprefix.split(",")
+outputfolders = args.outputfolder.split(",")
+if (len(outputfolders) == 1):
+	outputfolders = outputfolders * len(backgrounds)
+if (len(signals) != len(backgrounds) or len(outputprefixes) != len(backgrounds) or len(outputfolders) != len(backgrounds)):
+	sys.exit("[ERROR] Give one background, signal file, output prefix (and one output folder or a single one) per sample!")
+metrics = Metrics("enrichment", args.trace, args.profile)
 
+# Observed counts (family -> count) in file order
 def open_signal(sample):
+	repeats_counts = {}
 	with open(sample, "r") as s:
 		for line in s:
 			line = line.rstrip()
 			(repeat, counts) = line.split("\t")
-			repeats_counts[repeat] = counts
-			qt[repeat] = 0
-			sum_backg[repeat] = 0
+			repeats_counts[repeat] = float(counts)
 	return repeats_counts
-	
-def open_iterations(iterations):
-	with open(iterations, "r") as i:
-		for line in i:
-			line = line.rstrip()
-			(iterate, repeat, counts) = line.split("\t")
-			if repeat in repeats_counts:
-				if (float(counts) > float(repeats_counts[repeat])):
-					qt[repeat] += 1
-				sum_backg[repeat] += float(counts)
-	return qt, sum_backg
 
-repeats_counts = {}
-qt = {}
-sum_backg = {}
-repeats_counts = open_signal(signal)
+# Background matrix (iterations x families) and family names, from the binary file of
+# t3e.py or from the text format (iter<TAB>family<TAB>count, families in the same order
+# in every iteration)
+def open_background(background):
+	if background.endswith(".npz"):
+		with np.load(background) as b:
+			return b["background"], [str(f) for f in b["families"]]
+	families = {}
+	values = []
+	with open(background, "r") as i:
+		for line in i:
+			(iterate, repeat, counts) = line.rstrip().split("\t")
+			families.setdefault(repeat, len(families))
+			values.append(float(counts))
+	return np.array(values).reshape(-1, len(families)), list(families)
 
-qt, sum_backg = open_iterations(background)
+# P-values, background statistics and log2FC of the families of one sample (in the
+# order of the signal file, families without background are left out)
+def sample_enrichment(background, signal):
+	matrix, families = open_background(background)
+	repeats_counts = open_signal(signal)
+	column = {repeat: f for f, repeat in enumerate(families)}
+	repeats = [repeat for repeat in repeats_counts if repeat in column]
+	matrix = matrix[:, [column[repeat] for repeat in repeats]]
+	observed = np.array([repeats_counts[repeat] for repeat in repeats])
+	num_iter = int(args.iter) if args.iter else len(matrix)
+	# Sums in iteration order, as the per-line sums of the text format. With --signal,
+	# t3e.py stops simulating the families once they are decided: their later iterations
+	# are NaN, and the statistics use the iterations simulated.
+	total = np.zeros(len(repeats))
+	for row in matrix:
+		total += np.nan_to_num(row)
+	simulated = np.sum(~np.isnan(matrix), axis=0)
+	if args.exceedances:
+		# The background holds the iterations run by t3e.py (fewer when it stopped early)
+		qt, effective, decided = sequential_counts(matrix, observed, stop_exceedances(alpha, num_iter, int(args.exceedances)))
+		effective = np.where(decided, effective, simulated)
+		pvalue = qt / np.maximum(effective, 1)
+		mean = total / np.maximum(simulated, 1)
+	elif np.isnan(matrix).any():
+		# Fixed iterations on a sequential background: each family over its simulated iterations
+		effective = simulated
+		pvalue = np.sum(matrix > observed, axis=0) / np.maximum(effective, 1)
+		mean = total / np.maximum(effective, 1)
+	else:
+		# The iterations in the background, also when t3e.py --signal stopped before --iter
+		effective = np.full(len(repeats), len(matrix))
+		pvalue = np.sum(matrix > observed, axis=0) / max(len(matrix), 1)
+		mean = total / max(len(matrix), 1)
+	stats = {
+		"repeats": repeats,
+		"count": observed,
+		"mean": mean,
+		"sd": np.nanstd(matrix, axis=0, ddof=1) if (len(matrix) > 1) else np.zeros(len(repeats)),
+		"quantiles": np.nanquantile(matrix, quantiles, axis=0) if len(matrix) else np.zeros((len(quantiles), len(repeats))),
+		"pvalue": pvalue,
+		"effective": effective,
+		"iterations": len(matrix),
+	}
+	stats["log2fc"] = np.array([math.log(count / m, 2) if (count > 0 and m > 0) else math.nan for count, m in zip(observed, mean)])
+	return stats
 
-with open(output, "w") as o:
-	for repeat in sum_backg.keys():
-		pvalue = qt[repeat]/num_iter
-		mean = sum_backg[repeat]/num_iter
-		if (mean > 0):
-			foldchange = float(repeats_counts[repeat])/mean
-			log2fc = math.log(foldchange,2)
-			if ((pvalue <= alpha) and (log2fc >= enrichment)):
-				print(repeat, pvalue, log2fc)
-			print(repeat, "\t", pvalue, "\t", log2fc, file=o)
+combined = open(args.combined, "w") if args.combined else None
+if combined:
+	header = ["sample", "family", "count", "mean", "sd"] + [f'q{q:g}' for q in quantiles] + ["pvalue", "log2fc", "iterations"]
+	print("\t".join(header), file=combined)
+for s, background in enumerate(backgrounds):
+	phase = metrics.start()
+	stats = metrics.call(sample_enrichment, background, signals[s])
+	metrics.stop("enrichment", phase, stats["iterations"] * len(stats["repeats"]), sample=outputprefixes[s], families=len(stats["repeats"]))
+	phase = metrics.start()
+	output = outputfolders[s] + os.path.sep + outputprefixes[s] + '_enrichment.txt'
+	if (len(backgrounds) > 1):
+		print(f'[ENRICHED] {outputprefixes[s]}')
+	with open(output, "w") as o:
+		for f, repeat in enumerate(stats["repeats"]):
+			mean = stats["mean"][f]
+			if (mean > 0):
+				pvalue = float(stats["pvalue"][f])
+				log2fc = float(stats["log2fc"][f])
+				if ((pvalue <= alpha) and (log2fc >= enrichment)):
+					print(repeat, pvalue, log2fc)
+				if args.exceedances:
+					print(repeat, "\t", pvalue, "\t", log2fc, "\t", int(stats["effective"][f]), file=o)
+				else:
+					print(repeat, "\t", pvalue, "\t", log2fc, file=o)
+			if combined:
+				row = [outputprefixes[s], repeat, stats["count"][f], mean, stats["sd"][f]] + list(stats["quantiles"][:, f]) + [stats["pvalue"][f], stats["log2fc"][f], stats["effective"][f]]
+				print("\t".join(f'{value:.6g}' if isinstance(value, float) else str(value) for value in row), file=combined)
+	metrics.stop("output", phase, len(stats["repeats"]), sample=outputprefixes[s])
+if combined:
+	combined.close()
+metrics.report()
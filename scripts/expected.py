@@ -0,0 +1,350 @@
+###########################################################################
+# Python (v3.8.5) script expected.py (v1.0) to compute the expected background of T3E
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import sys
+import argparse
+import os
+import math
+import time
+import numpy as np
+from sampler import load_probabilities, candidate_weights
+from control_index import default_index_folder, load_control_index, read_alignments_of, reachable_chromosomes
+from overlap import read_te_index, read_families
+from readtable import load_reads
+from metrics import Metrics
+from genome import load_chromosomes
+
+## Set parameters
+parser = argparse.ArgumentParser(description='T3E: Expected background of the simulations of t3e.py (mean and variance of every TE family/subfamily), with approximate p-values, to screen samples and families before the simulations')
+parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+parser.add_argument('--repeat', action='store', metavar = 'repeat_file', help='transposable elements annotation [rmsk_hg38.bed (Homo sapiens) or rmsk_mm10.bed (Mus musculus)]')
+parser.add_argument('--sample', action='store', metavar = 'sample_file', help='ChIP-seq sample experiment [BED format or read table folder], several samples separated by commas')
+parser.add_argument('--readlen', action='store', metavar = 'readlen', help='ChIP-seq input control experiment read length in base pairs [Example --readlen 36]')
+parser.add_argument('--control', action='store', metavar = 'control_file', help='ChIP-seq input control experiment [BED format or read table folder]')
+parser.add_argument('--probability', action='store', metavar = 'probability_folder', help='probability folder path [Example: /control/probability/]')
+parser.add_argument('--controlindex', action='store', metavar = 'control_index_folder', help='folder for the binary control index [default: control_index next to the probability folder]')
+parser.add_argument('--species', action='store', metavar = 'species', help='assembly with a .genome file in the references folder, e.g. hg38 (Homo sapiens) or mm10 (Mus musculus) [Example --species hg38]')
+parser.add_argument('--genome', action='store', metavar = 'genome', help='chromosome sizes of the assembly [.genome file; default: references/<species>.genome, or all chromosomes of the control without --species]')
+parser.add_argument('--signal', action='store', metavar = 'signal', help='ChIP-seq sample experiment counts [.txt format], one per sample separated by commas')
+parser.add_argument('--test', action='store', metavar = 'test', default='normal', help='approximate p-values: normal (mean and variance of the background) or poisson (mean only) [default: normal]')
+parser.add_argument('--alpha', action='store', metavar = 'alpha', default='0.05', help='level of significance to report enrichment [default: 0.05]')
+parser.add_argument('--enrichment', action='store', metavar = 'enrichment', default='1.0', help='log2FC threshold to report enrichment [default: 1.0]')
+parser.add_argument('--screen', action='store', metavar = 'screen', help='also write the families with an approximate p-value at or below this level (<outputprefix>_screen.txt, for t3e.py --families)')
+parser.add_argument('--families', action='store', metavar = 'families', help='only these TE families/subfamilies, separated by commas or in a file with one family per line [default: all families]')
+parser.add_argument('--trace', action='store', metavar = 'trace', help='write wall time, CPU time, items and peak memory of every phase and chromosome [.jsonl: JSON lines, .json: Chrome trace format]')
+parser.add_argument('--profile', action='store', metavar = 'profile', help='profile every chromosome with cProfile and write the statistics to this file [read with: python -m pstats <file>]')
+parser.add_argument('--outputfolder', action='store', metavar = 'outputfolder', help='output folder path, one for all samples or one per sample separated by commas [Example: /results]')
+parser.add_argument('--outputprefix', action='store', metavar = 'outputprefix', help='prefix name of your analysis, one per sample separated by commas [Example: sample001]')
+args = parser.parse_args()
+
+if (len(sys.argv) == 1):
+	parser.print_help()
+	parser.exit()
+
+repeats = args.repeat
+samples = args.sample.split(",")
+read_len = int(args.readlen)
+half_len = int(read_len/2)
+control = args.control
+prob_path = args.probability
+control_index = args.controlindex if args.controlindex else default_index_folder(prob_path)
+species = args.species
+signals = args.signal.split(",")
+alpha = float(args.alpha)
+enrichment = float(args.enrichment)
+outputprefixes = args.outputprefix.split(",")
+outputfolders = args.outputfolder.split(",")
+if (len(outputfolders) == 1):
+	outputfolders = outputfolders * len(samples)
+if (len(signals) != len(samples) or len(outputprefixes) != len(samples) or len(outputfolders) != len(samples)):
+	sys.exit("[ERROR] Give one signal file, output prefix (and one output folder or a single one) per sample!")
+if (args.test not in ("normal", "poisson")):
+	sys.exit("[ERROR] --test should be normal or poisson!")
+metrics = Metrics("expected", args.trace, args.profile)
+
+## Control reads handled at once (each with all its alignments and nearby TE copies)
+CANDIDATE_BLOCK = 1 << 16
+## Positions of the probabilities read at once
+BLOCK_SIZE = 1 << 22
+## Change of the probability between neighbouring positions, in units of the rounding
+## error of the cumulative probabilities, that starts a new segment (the probabilities
+## are piecewise constant up to rounding)
+SEGMENT_TOLERANCE = 1000
+
+## Define functions
+# Expected number of sample reads per chromosome: each read counts 1/k on each of its
+# k alignments (t3e.py assigns it to one of them at random)
+def expected_reads(sample):
+	chrom_names, chroms, starts, ends, reads, num_reads = load_reads(sample)
+	freq = np.bincount(reads, minlength=num_reads)
+	per_chr = np.bincount(chroms, weights=1 / freq[reads], minlength=len(chrom_names))
+	ids = chromosomes.lookup(chrom_names)
+	chr_reads = np.zeros(len(chromosomes))
+	chr_reads[ids[ids >= 0]] = per_chr[ids >= 0]
+	return chr_reads
+
+# Alignments [first, last) of the control index on a chromosome (by id)
+def control_range(c):
+	return int(chrom_offsets[control_of[c]]), int(chrom_offsets[control_of[c] + 1])
+
+# Probability of drawing each position of a chromosome (inverse-CDF draw of t3e.py: the
+# first position has none) as piecewise-constant segments [start, end), block by block
+def probability_segments(position_list, cumprob_list):
+	tolerance = SEGMENT_TOLERANCE * np.finfo(np.float64).eps * float(cumprob_list[-1])
+	parts = []
+	previous = None
+	for first in range(1, len(position_list), BLOCK_SIZE):
+		positions = np.asarray(position_list[first:first + BLOCK_SIZE], dtype=np.int64)
+		prob = np.diff(np.asarray(cumprob_list[first - 1:first + BLOCK_SIZE], dtype=np.float64))
+		new = np.ones(len(prob), dtype=bool)
+		new[1:] = (np.diff(positions) != 1) | (np.abs(np.diff(prob)) > tolerance)
+		if previous is not None:
+			new[0] = (positions[0] - previous[0] != 1) or (abs(prob[0] - previous[1]) > tolerance)
+		# The first segment of a block may continue the last one of the previous block
+		starts = np.flatnonzero(new)
+		if (len(starts) == 0 or starts[0] != 0):
+			starts = np.append(0, starts)
+		ends = np.append(starts[1:], len(prob))
+		parts.append((positions[starts], positions[ends - 1] + 1, np.add.reduceat(prob, starts), np.append(not new[0], np.zeros(len(starts) - 1, dtype=bool))))
+		previous = (positions[-1], prob[-1])
+	if not parts:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+	seg_starts, seg_ends, seg_mass, continued = [np.concatenate(column) for column in zip(*parts)]
+	segment = np.cumsum(~continued) - 1
+	last = np.append(np.flatnonzero(~continued)[1:], len(segment)) - 1
+	seg_mass = np.bincount(segment, weights=seg_mass)
+	seg_starts = seg_starts[~continued]
+	seg_ends = seg_ends[last]
+	return seg_starts, seg_ends, seg_mass / (seg_ends - seg_starts) / (float(cumprob_list[-1]) - float(cumprob_list[0]))
+
+# Ratio R(r) of the probability of drawing position r to the total weight W(r) of the
+# control reads starting in [r - read_len, r] (a candidate c is then chosen with
+# probability p(r) * w_c / W(r)), as piecewise-constant values from breakpoints
+def selection_ratio(position_list, cumprob_list, cand_starts, cand_cum):
+	seg_starts, seg_ends, seg_prob = probability_segments(position_list, cumprob_list)
+	breakpoints = np.unique(np.concatenate((seg_starts, seg_ends, cand_starts, cand_starts + read_len + 1)))
+	k = np.searchsorted(seg_starts, breakpoints, side="right") - 1
+	prob = np.where((k >= 0) & (breakpoints < seg_ends[np.maximum(k, 0)]), seg_prob[np.maximum(k, 0)], 0.0)
+	lo = np.searchsorted(cand_starts, breakpoints - read_len, side="left")
+	hi = np.searchsorted(cand_starts, breakpoints, side="right")
+	weight = cand_cum[hi] - cand_cum[lo]
+	ratio = np.where(weight > 0, prob / np.where(weight > 0, weight, 1), 0.0)
+	return breakpoints, ratio
+
+# TE copies (global index, sorted by chromosome and start) that a read placed at
+# [start + d, start + d + read_len - 1] can overlap for some shift d in
+# [-read_len/2, read_len - read_len/2], for the given control alignments. Returns the
+# copies and, for each of them, the position of its alignment in 'alignments'.
+def nearby_copies(alignments):
+	chroms = control_te_chr[control_aln_chroms[alignments]]
+	owners = np.flatnonzero(chroms >= 0)
+	chroms = chroms[owners]
+	positions = np.asarray(control_positions[alignments[owners]], dtype=np.int64)
+	lo = positions - half_len
+	hi = lo + 2 * read_len - 1
+	first = np.searchsorted(te_keys, (chroms << 32) + np.maximum(lo - te_span, 0), side="left")
+	last = np.searchsorted(te_keys, (chroms << 32) + np.maximum(hi, 0), side="right")
+	counts = np.maximum(last - first, 0)
+	owner = np.repeat(np.arange(len(owners)), counts)
+	copies = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))
+	near = te_ends[copies] >= lo[owner]
+	return copies[near], owners[owner[near]]
+
+# Mean and second moment, per family, of the background count added by one read drawn
+# on a chromosome (by id). A draw is a position r and a control read c starting on the
+# chromosome at p_c in [r - read_len, r], chosen with probability p(r) * w_c / W(r)
+# (w_c = 1 / its number of alignments k); all k alignments are shifted by
+# d = r - read_len/2 - p_c and each adds overlap(read, copy) / (k * read_len) to the
+# family of every copy it overlaps. Both moments are exact sums over the control reads
+# of the chromosome and the read_len + 1 shifts.
+def chromosome_moments(c):
+	position_list, cumprob_list = load_probabilities(prob_path, chromosomes.names[c])
+	first, last = control_range(c)
+	cand_starts = np.asarray(control_positions[first:last], dtype=np.int64)
+	cand_cum = candidate_weights(control_map_counts[control_read_ids[first:last]])
+	mean = np.zeros(len(groups))
+	square = np.zeros(len(groups))
+	if (len(position_list) < 2):
+		return mean, square
+	breakpoints, ratio = selection_ratio(position_list, cumprob_list, cand_starts, cand_cum)
+	for block in range(0, last - first, CANDIDATE_BLOCK):
+		candidates = np.arange(block, min(block + CANDIDATE_BLOCK, last - first))
+		reads = control_read_ids[first + candidates].astype(np.int64)
+		alignments, read_index = read_alignments_of(control_read_offsets, control_read_alignments, reads)
+		copies, owner = nearby_copies(alignments)
+		if (len(copies) == 0):
+			continue
+		candidate = read_index[owner]
+		starts = np.asarray(control_positions[alignments[owner]], dtype=np.int64)
+		# One count per candidate and family: all the copies of the family overlapped
+		# by the alignments of the same read add up before the count is squared
+		pairs, pair_index = np.unique(candidate * len(groups) + te_fams[copies], return_inverse=True)
+		order = np.argsort(pair_index, kind="stable")
+		pair_first = np.searchsorted(pair_index[order], np.arange(len(pairs)))
+		pair_candidate = pairs // len(groups)
+		pair_weight = 1 / control_map_counts[reads[pair_candidate]].astype(np.float64)
+		# Copy ends and starts relative to the alignment start: a read shifted by d
+		# overlaps min(end - d, read_len - 1) - max(start - d, 0) + 1 bases
+		copy_ends = (te_ends[copies] - starts)[order].astype(np.int32)
+		copy_starts = (te_starts[copies] - starts)[order].astype(np.int32)
+		# Positions r = p_c + read_len/2 + d of the pairs, and their ratio segments
+		# (advanced along with d)
+		r = cand_starts[candidates[pair_candidate]] - 1
+		segment = np.searchsorted(breakpoints, r + 1, side="right") - 1
+		pair_mean = np.zeros(len(pairs))
+		pair_square = np.zeros(len(pairs))
+		for d in range(-half_len, read_len - half_len + 1):
+			r += 1
+			segment += (segment + 1 < len(breakpoints)) & (breakpoints[np.minimum(segment + 1, len(breakpoints) - 1)] <= r)
+			overlap = np.minimum(copy_ends - d, read_len - 1) - np.maximum(copy_starts - d, 0) + 1
+			count = np.add.reduceat(np.maximum(overlap, 0), pair_first) * (pair_weight / read_len)
+			probability = pair_weight * ratio[segment]
+			pair_mean += probability * count
+			pair_square += probability * count * count
+		mean += np.bincount(pairs % len(groups), weights=pair_mean, minlength=len(groups))
+		square += np.bincount(pairs % len(groups), weights=pair_square, minlength=len(groups))
+	return mean, square
+
+# Regularized lower incomplete gamma function P(a, x) (series for x < a + 1, continued
+# fraction otherwise)
+def gamma_p(a, x):
+	if (x <= 0):
+		return 0.0
+	log_prefix = a * math.log(x) - x - math.lgamma(a)
+	if (x < a + 1):
+		term = 1.0 / a
+		total = term
+		n = a
+		while (abs(term) > abs(total) * 1e-15):
+			n = n + 1
+			term = term * x / n
+			total = total + term
+		return min(1.0, total * math.exp(log_prefix))
+	b = x + 1 - a
+	c = 1e300
+	d = 1 / b
+	h = d
+	i = 1
+	while True:
+		an = -i * (i - a)
+		b = b + 2
+		d = an * d + b
+		d = d if (abs(d) > 1e-300) else 1e-300
+		c = b + an / c
+		c = c if (abs(c) > 1e-300) else 1e-300
+		d = 1 / d
+		delta = d * c
+		h = h * delta
+		i = i + 1
+		if (abs(delta - 1) < 1e-15):
+			break
+	return max(0.0, 1.0 - math.exp(log_prefix) * h)
+
+# Approximate p-value of an observed count: probability of a background count above it,
+# as the simulations (normal with the background mean and variance, or Poisson)
+def approximate_pvalue(observed, mean, variance):
+	if (args.test == "poisson"):
+		return gamma_p(math.floor(observed) + 1, mean) if (mean > 0) else 0.0
+	if (variance <= 0):
+		return 1.0 if (observed < mean) else 0.0
+	return 0.5 * math.erfc((observed - mean) / math.sqrt(2 * variance))
+
+## Main code
+start_time = time.time()
+phase = metrics.start()
+control_chromosomes, control_arrays = load_control_index(control, read_len, control_index)
+chrom_offsets = np.array(control_arrays["chrom_offsets"])
+control_positions = control_arrays["positions"]
+control_aln_chroms = control_arrays["aln_chroms"]
+control_read_ids = control_arrays["read_ids"]
+control_map_counts = control_arrays["map_counts"]
+control_read_offsets = control_arrays["read_offsets"]
+control_read_alignments = control_arrays["read_alignments"]
+chromosomes = load_chromosomes(args.genome, species, control_chromosomes)
+control_ids = chromosomes.lookup(control_chromosomes)
+control_of = np.full(len(chromosomes), -1, dtype=np.int64)
+control_of[control_ids[control_ids >= 0]] = np.flatnonzero(control_ids >= 0)
+control_alignments = np.zeros(len(chromosomes), dtype=np.int64)
+control_alignments[control_ids[control_ids >= 0]] = np.diff(chrom_offsets)[control_ids >= 0]
+metrics.stop("control_index", phase, len(control_positions))
+phase = metrics.start()
+sample_reads = np.array([expected_reads(sample) for sample in samples])
+metrics.stop("sample_reads", phase, int(sample_reads.sum()), samples=len(samples))
+
+## TE copies of all chromosomes in one array, sorted by (chromosome, start), with the
+## TE chromosome number of every control chromosome (-1 without copies)
+phase = metrics.start()
+selected_families = read_families(args.families) if args.families else None
+groups, te_index = read_te_index(repeats, selected_families)
+if selected_families is not None:
+	unknown = sorted(selected_families - set(groups))
+	if unknown:
+		sys.exit(f'[ERROR] Families not in {repeats}: {",".join(unknown)}')
+te_chromosomes = [c for c in control_chromosomes if c in chromosomes.ids and c in te_index]
+control_te_chr = np.array([te_chromosomes.index(c) if c in te_chromosomes else -1 for c in control_chromosomes], dtype=np.int64)
+te_starts = np.concatenate([te_index[c][0] for c in te_chromosomes] + [np.zeros(0, dtype=np.int64)])
+te_ends = np.concatenate([te_index[c][1] for c in te_chromosomes] + [np.zeros(0, dtype=np.int64)])
+te_fams = np.concatenate([te_index[c][2] for c in te_chromosomes] + [np.zeros(0, dtype=np.int32)]).astype(np.int64)
+te_keys = np.concatenate([(t << 32) + te_index[c][0] for t, c in enumerate(te_chromosomes)] + [np.zeros(0, dtype=np.int64)])
+te_span = max([te_index[c][3] for c in te_chromosomes] + [0])
+metrics.stop("repeats", phase, len(te_starts))
+
+## Moments of one draw per chromosome, then the background of each sample: the sum of
+## its independent draws (expected number of reads per chromosome). Chromosomes without
+## sample reads, control reads or control reads that can reach a TE copy are left out.
+reachable_ids = control_ids[np.array(reachable_chromosomes(control_arrays, control_te_chr >= 0), dtype=np.int64)]
+with_copies = np.zeros(len(chromosomes), dtype=bool)
+with_copies[reachable_ids[reachable_ids >= 0]] = True
+means = np.zeros((len(samples), len(groups)))
+variances = np.zeros((len(samples), len(groups)))
+for c in range(len(chromosomes)):
+	draws = sample_reads[:, c]
+	if (max(draws) == 0 or not with_copies[c] or control_alignments[c] == 0):
+		continue
+	phase = metrics.start()
+	mean, square = metrics.call(chromosome_moments, c)
+	for s in range(len(samples)):
+		means[s] += draws[s] * mean
+		variances[s] += draws[s] * np.maximum(square - mean * mean, 0)
+	metrics.stop("expectation", phase, int(control_alignments[c]), chromosomes.names[c])
+
+## Expected background, approximate p-value and log2FC of the families of every sample
+## (in the order of the signal file, families without background are left out)
+for s in range(len(samples)):
+	phase = metrics.start()
+	observed = {}
+	with open(signals[s], "r") as f:
+		for line in f:
+			(repeat, counts) = line.rstrip("\n").split("\t")
+			observed[repeat] = float(counts)
+	if (len(samples) > 1):
+		print(f'[ENRICHED] {outputprefixes[s]}')
+	screened = []
+	with open(outputfolders[s] + os.path.sep + outputprefixes[s] + '_expected.txt', "w") as o:
+		print("\t".join(["family", "count", "expected", "sd", "pvalue", "log2fc"]), file=o)
+		for repeat, count in observed.items():
+			if repeat not in groups:
+				continue
+			mean = float(means[s, groups[repeat]])
+			variance = float(variances[s, groups[repeat]])
+			pvalue = approximate_pvalue(count, mean, variance)
+			log2fc = math.log(count / mean, 2) if (count > 0 and mean > 0) else math.nan
+			if (mean > 0 and pvalue <= alpha and log2fc >= enrichment):
+				print(repeat, pvalue, log2fc)
+			if (args.screen and pvalue <= float(args.screen)):
+				screened.append(repeat)
+			print("\t".join([repeat] + [f'{value:.6g}' for value in (count, mean, math.sqrt(variance), pvalue, log2fc)]), file=o)
+	if args.screen:
+		with open(outputfolders[s] + os.path.sep + outputprefixes[s] + '_screen.txt', "w") as o:
+			for repeat in screened:
+				print(repeat, file=o)
+	metrics.stop("output", phase, len(observed), sample=outputprefixes[s])
+metrics.report()
+end_time = time.time()
+print(end_time - start_time, " second(s)")
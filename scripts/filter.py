@@ -0,0 +1,157 @@
+###########################################################################
+# Python (v3.8.5) script filter.py (v1.0) to filter high signal regions out
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import sys
+import argparse
+import os
+import time
+import numpy as np
+from readtable import TABLE_COLUMNS, open_read_table, index_dtype, write_table_header, finish_read_table
+from genome import read_genome
+
+## Set parameters
+parser = argparse.ArgumentParser(description='T3E: Filter out the alignments in high signal regions (artifact regions)')
+parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+parser.add_argument('--input', action='store', metavar = 'input', help='read table folder (created by ingest.py)')
+parser.add_argument('--genome', action='store', metavar = 'genome', help='chromosome sizes [references/hg38.genome or references/mm10.genome]')
+parser.add_argument('--window', action='store', metavar = 'window', default='100', help='window size in base pairs [default: 100]')
+parser.add_argument('--step', action='store', metavar = 'step', default='50', help='step between windows in base pairs [default: 50]')
+parser.add_argument('--percentile', action='store', metavar = 'percentile', default='0.99997', help='windows with a count at or above this percentile of the non-empty windows (genome-wide or of their chromosome) are high signal [default: 0.99997]')
+parser.add_argument('--output', action='store', metavar = 'output', help='filtered read table folder')
+parser.add_argument('--regions', action='store', metavar = 'regions', help='also write the high signal regions (merged windows) as a BED file')
+args = parser.parse_args()
+
+if (len(sys.argv) == 1):
+	parser.print_help()
+	parser.exit()
+
+input_table = args.input
+window = int(args.window)
+step = int(args.step)
+percentile = float(args.percentile)
+output = args.output
+
+## Define functions
+# Number of alignments [start, end) overlapping each sliding window of a chromosome
+# (windows as bedtools makewindows: [k * step, k * step + window), clipped to the
+# chromosome), from prefix counts of the sorted starts and ends
+def window_counts(starts, ends, size):
+	window_starts = np.arange(0, size, step, dtype=np.int64)
+	window_ends = np.minimum(window_starts + window, size)
+	counts = np.searchsorted(starts, window_ends, side="left") - np.searchsorted(ends, window_starts, side="right")
+	return window_starts, window_ends, counts
+
+# Quantile (R type 7, as quantile() in R) of the values counted in an integer histogram;
+# None without values
+def histogram_quantile(histogram, q):
+	n = int(histogram.sum())
+	if (n == 0):
+		return None
+	cumulative = np.cumsum(histogram)
+	index = (n - 1) * q
+	lo = int(np.floor(index))
+	hi = int(np.ceil(index))
+	x_lo = int(np.searchsorted(cumulative, lo, side="right"))
+	x_hi = int(np.searchsorted(cumulative, hi, side="right"))
+	h = index - lo
+	return (1 - h) * x_lo + h * x_hi if (x_hi != x_lo) else x_lo
+
+# Merge overlapping or adjacent windows (sorted by start) into regions
+def merge_windows(window_starts, window_ends):
+	if (len(window_starts) == 0):
+		return window_starts, window_ends
+	new_region = np.concatenate(([True], window_starts[1:] > window_ends[:-1]))
+	first = np.flatnonzero(new_region)
+	last = np.concatenate((first[1:], [len(window_starts)])) - 1
+	return window_starts[first], window_ends[last]
+
+# Alignments [start, end) overlapping any of the sorted, disjoint regions
+def in_regions(starts, ends, region_starts, region_ends):
+	k = np.searchsorted(region_ends, starts, side="right")
+	inside = k < len(region_starts)
+	inside[inside] = region_starts[k[inside]] < ends[inside]
+	return inside
+
+## Main code
+start_time = time.time()
+chrom_names, columns, info = open_read_table(input_table)
+read_len = info["read_len"]
+genome_names, genome_sizes = read_genome(args.genome)
+chrom_offsets = np.searchsorted(columns["chroms"], np.arange(len(chrom_names) + 1))
+
+# Alignments of a chromosome of the genome file (starts and ends are sorted)
+def chromosome_alignments(chromosome):
+	if chromosome not in chrom_names:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0, 0
+	c = chrom_names.index(chromosome)
+	first = int(chrom_offsets[c])
+	last = int(chrom_offsets[c + 1])
+	starts = np.asarray(columns["starts"][first:last], dtype=np.int64)
+	return starts, starts + read_len, first, last
+
+## First pass: histogram of the non-empty window counts, per chromosome and genome-wide
+histograms = {}
+for chromosome, size in zip(genome_names, genome_sizes):
+	starts, ends, first, last = chromosome_alignments(chromosome)
+	window_starts, window_ends, counts = window_counts(starts, ends, size)
+	histograms[chromosome] = np.bincount(counts[counts > 0])
+genome_histogram = np.zeros(max(len(histogram) for histogram in histograms.values()), dtype=np.int64)
+for histogram in histograms.values():
+	genome_histogram[:len(histogram)] += histogram
+threshold_all_chrs = histogram_quantile(genome_histogram, percentile)
+print(f'[FILTER] Genome-wide threshold ({percentile} percentile of {int(genome_histogram.sum())} non-empty windows): {threshold_all_chrs}', file=sys.stderr)
+time_point_a = time.time()
+print(f'[FILTER] Count reads in windows of {window} bp, steps of {step} bp: {time_point_a - start_time:.2f}s', file=sys.stderr)
+
+## Second pass: windows at or above the genome-wide threshold or the threshold of their
+## chromosome, merged into regions, and alignments overlapping a region dropped
+keep = np.ones(info["num_alignments"], dtype=bool)
+regions = open(args.regions, "w") if args.regions else None
+num_regions = 0
+for chromosome, size in zip(genome_names, genome_sizes):
+	if (threshold_all_chrs is None):
+		break
+	starts, ends, first, last = chromosome_alignments(chromosome)
+	if (first == last):
+		continue
+	threshold_this_chr = histogram_quantile(histograms[chromosome], percentile)
+	threshold = threshold_all_chrs if (threshold_this_chr is None) else min(threshold_all_chrs, threshold_this_chr)
+	window_starts, window_ends, counts = window_counts(starts, ends, size)
+	high = (counts > 0) & (counts >= threshold)
+	region_starts, region_ends = merge_windows(window_starts[high], window_ends[high])
+	keep[first:last] = ~in_regions(starts, ends, region_starts, region_ends)
+	num_regions = num_regions + len(region_starts)
+	if regions:
+		for (region_start, region_end) in zip(region_starts.tolist(), region_ends.tolist()):
+			regions.write(f'{chromosome}\t{region_start}\t{region_end}\n')
+if regions:
+	regions.close()
+time_point_b = time.time()
+print(f'[FILTER] {num_regions} high signal regions, {int(np.sum(~keep))} alignments filtered out: {time_point_b - time_point_a:.2f}s', file=sys.stderr)
+
+## Filtered read table: the reads left keep their order, with dense numbers
+kept = np.flatnonzero(keep)
+present = np.zeros(info["num_reads"], dtype=bool)
+present[columns["reads"][kept]] = True
+new_ids = np.cumsum(present) - 1
+info = {"read_len": read_len, "num_reads": int(present.sum()), "num_alignments": len(kept)}
+if output:
+	tmp = output + f'.tmp{os.getpid()}'
+	os.makedirs(tmp, exist_ok=True)
+	write_table_header(tmp, chrom_names, info)
+	for name in TABLE_COLUMNS:
+		column = columns[name][kept]
+		if (name == "reads"):
+			column = new_ids[column].astype(index_dtype(info["num_reads"]))
+		np.save(os.path.join(tmp, name + ".npy"), column)
+	finish_read_table(tmp, output)
+end_time = time.time()
+print(f'[FILTER] {info["num_alignments"]} alignments of {info["num_reads"]} reads left: {end_time - time_point_b:.2f}s', file=sys.stderr)
+for key, value in info.items():
+	print(f'{key}\t{value}')
@@ -0,0 +1,78 @@
+###########################################################################
+# Python (v3.8.5) script genome.py (v1.0) for the chromosomes of a genome assembly
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import os
+import re
+import sys
+import numpy as np
+
+## Folder of the .genome files (chromosome sizes) shipped with T3E
+REFERENCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "references")
+
+## Define functions
+# Chromosome names and sizes of a .genome file (header line skipped)
+def read_genome(genome_file):
+	names = []
+	sizes = []
+	with open(genome_file, "r") as f:
+		for line in f:
+			(chrom, size) = line.rstrip("\n").split("\t")[:2]
+			if size.isdigit():
+				names.append(chrom)
+				sizes.append(int(size))
+	return names, sizes
+
+# Natural order of chromosome names: numbers compare as numbers (chr2 before chr10,
+# numbered chromosomes before chrX and chrY, chr2L before chr2R)
+def chromosome_key(name):
+	return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.findall(r'\d+|\D+', name)]
+
+# Chromosome registry of a run: the chromosome names in natural order, their sizes (0 if
+# unknown) and their integer ids (position in the registry). The ids do not depend on
+# the order of the .genome file or of the read tables, so the random streams keyed by
+# them are the same for every input of the same assembly.
+class Chromosomes:
+	def __init__(self, names, sizes=None):
+		order = sorted(range(len(names)), key=lambda c: chromosome_key(names[c]))
+		self.names = [names[c] for c in order]
+		self.sizes = np.array([sizes[c] for c in order] if sizes is not None else [0] * len(names), dtype=np.int64)
+		self.ids = {name: c for c, name in enumerate(self.names)}
+
+	def __len__(self):
+		return len(self.names)
+
+	# Ids of a list of names (-1 for the names that are not in the registry)
+	def lookup(self, names):
+		return np.array([self.ids.get(name, -1) for name in names], dtype=np.int64)
+
+# Chromosome registry from a .genome file, else from references/<species>.genome, else
+# from the chromosomes of a read table (or control index) header
+def load_chromosomes(genome=None, species=None, table_names=None):
+	if (genome is None and species is not None):
+		genome = os.path.join(REFERENCES, species + ".genome")
+		if not os.path.isfile(genome):
+			sys.exit(f'[ERROR] No chromosome sizes for {species} ({genome}): give a .genome file with --genome!')
+	if genome is not None:
+		names, sizes = read_genome(genome)
+		return Chromosomes(names, sizes)
+	if table_names is None:
+		sys.exit("[ERROR] Give the chromosomes with --genome or --species!")
+	return Chromosomes(list(table_names))
+
+# Expected cost of the work on each chromosome: its share of the extent (genome size or
+# control alignments: probabilities and control positions) plus its share of the sample
+# reads (sampling and counting)
+def chromosome_costs(extent, reads):
+	extent = np.asarray(extent, dtype=np.float64)
+	reads = np.asarray(reads, dtype=np.float64)
+	return extent / max(extent.sum(), 1) + reads / max(reads.sum(), 1)
+
+# Chromosome ids in decreasing order of cost (ties in id order)
+def cost_order(costs):
+	return np.argsort(-np.asarray(costs), kind="stable")
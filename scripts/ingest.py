@@ -0,0 +1,331 @@
+###########################################################################
+# Python (v3.8.5) script ingest.py (v1.0) to convert alignments to read tables
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import sys
+import argparse
+import os
+import gzip
+import struct
+import shutil
+import time
+from array import array
+import numpy as np
+from readtable import TABLE_COLUMNS, intern_reads, load_reads, index_dtype, save_read_table, write_table_header, finish_read_table
+
+## Set parameters
+parser = argparse.ArgumentParser(description='T3E: Convert BAM/BED alignments to a binary read table')
+parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+parser.add_argument('--input', action='store', metavar = 'input', help='alignments [BAM file, BED file or read table folder]')
+parser.add_argument('--output', action='store', metavar = 'output', help='output read table folder [Example: sample001.reads]')
+parser.add_argument('--bed', action='store', metavar = 'bed', help='also export the alignments as a BED file')
+parser.add_argument('--readlen', action='store', metavar = 'readlen', help='read length in base pairs [default: estimated from the first 10000 alignments]')
+parser.add_argument('--buffer', action='store', metavar = 'buffer', default='50000000', help='alignments kept in memory before spilling sorted buckets and read name runs to disk [default: 50000000]')
+args = parser.parse_args()
+
+if (len(sys.argv) == 1):
+	parser.print_help()
+	parser.exit()
+
+input_file = args.input
+output = args.output
+buffer_size = int(args.buffer)
+
+## Number of alignments used to estimate the read length
+READ_LEN_SAMPLE = 10000
+## Size of the decompressed blocks parsed at once
+CHUNK_SIZE = 1 << 22
+## BAM record: block_size, refID, pos, l_read_name, mapq, bin, n_cigar_op, flag, l_seq
+RECORD = struct.Struct('<iiiBBHHHi')
+BLOCK_SIZE = struct.Struct('<i')
+RECORD_NAME = 36
+## Spilled read names: the two hashes of the name and the record number
+RUN_DTYPE = np.dtype([("a", np.int64), ("b", np.int64), ("record", np.int64)])
+
+## Define functions
+# Keep chromosomes only: no chrM, no alternative/unplaced contigs (names with "_")
+def keep_reference(name):
+	return ("chr" in name) and ("_" not in name) and ("chrM" not in name)
+
+# Stream a BAM file (BGZF is a series of gzip members) and yield, in chunks, the
+# reference id, 0-based start, read name and sequence length of the mapped records
+def bam_chunks(bam_file):
+	with gzip.open(bam_file, "rb") as f:
+		if (f.read(4) != b"BAM\1"):
+			sys.exit(f'[ERROR] {bam_file} is not a BAM file!')
+		(l_text,) = struct.unpack('<i', f.read(4))
+		f.read(l_text)
+		(n_ref,) = struct.unpack('<i', f.read(4))
+		references = []
+		for r in range(n_ref):
+			(l_name,) = struct.unpack('<i', f.read(4))
+			references.append(f.read(l_name)[:-1].decode())
+			f.read(4)
+		yield references
+		keep = [keep_reference(name) for name in references]
+		buf = b""
+		while True:
+			data = f.read(CHUNK_SIZE)
+			buf = buf + data
+			ref_ids = array('i')
+			starts = array('q')
+			lengths = array('i')
+			names = []
+			offset = 0
+			end = len(buf)
+			while offset + 4 <= end:
+				# The record may end past the buffer: refill before reading its fields
+				(block_size,) = BLOCK_SIZE.unpack_from(buf, offset)
+				if (offset + 4 + block_size > end):
+					break
+				(block_size, ref_id, pos, l_read_name, mapq, bin_, n_cigar, flag, l_seq) = RECORD.unpack_from(buf, offset)
+				if (ref_id >= 0 and not (flag & 4) and keep[ref_id]):
+					ref_ids.append(ref_id)
+					starts.append(pos)
+					lengths.append(l_seq)
+					names.append(buf[offset + RECORD_NAME:offset + RECORD_NAME + l_read_name - 1])
+				offset = offset + 4 + block_size
+			buf = buf[offset:]
+			yield ref_ids, starts, lengths, names
+			if not data:
+				if buf:
+					sys.exit(f'[ERROR] {bam_file} is truncated!')
+				break
+
+# Estimated read length: mean length of the first sequences (longer than 1 bp)
+def estimate_read_len(lengths):
+	lengths = np.asarray(lengths[:READ_LEN_SAMPLE])
+	lengths = lengths[lengths > 1]
+	if (len(lengths) == 0):
+		sys.exit("[ERROR] Cannot estimate the read length!")
+	return int(lengths.sum() / len(lengths))
+
+# Alignments buffered by chromosome; spilled to one temporary file per chromosome and
+# column when the buffer is full, so that memory is bounded by the buffer and by the
+# largest chromosome when the table is assembled (the read names go to ReadNameRuns)
+class ChromosomeBuckets:
+	def __init__(self, num_chroms, tmp_folder):
+		self.num_chroms = num_chroms
+		self.tmp_folder = tmp_folder
+		self.parts = [[] for c in range(num_chroms)]
+		self.buffered = 0
+		self.spilled = False
+
+	def add(self, chroms, starts, records):
+		order = np.argsort(chroms, kind="stable")
+		bounds = np.searchsorted(chroms[order], np.arange(self.num_chroms + 1))
+		for c in range(self.num_chroms):
+			if (bounds[c] < bounds[c + 1]):
+				sel = order[bounds[c]:bounds[c + 1]]
+				self.parts[c].append((starts[sel], records[sel]))
+		self.buffered = self.buffered + len(chroms)
+		if (self.buffered >= buffer_size):
+			self.spill()
+
+	def spill(self):
+		os.makedirs(self.tmp_folder, exist_ok=True)
+		for c in range(self.num_chroms):
+			if self.parts[c]:
+				with open(os.path.join(self.tmp_folder, f'{c}.starts'), "ab") as s, open(os.path.join(self.tmp_folder, f'{c}.records'), "ab") as r:
+					for (starts, records) in self.parts[c]:
+						starts.astype(np.int64).tofile(s)
+						records.astype(np.int64).tofile(r)
+				self.parts[c] = []
+		self.buffered = 0
+		self.spilled = True
+
+	# Alignments of one chromosome sorted by start
+	def sorted_chromosome(self, c):
+		if self.spilled:
+			starts_file = os.path.join(self.tmp_folder, f'{c}.starts')
+			if not os.path.isfile(starts_file):
+				return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+			starts = np.fromfile(starts_file, dtype=np.int64)
+			records = np.fromfile(os.path.join(self.tmp_folder, f'{c}.records'), dtype=np.int64)
+		elif self.parts[c]:
+			starts = np.concatenate([part[0] for part in self.parts[c]])
+			records = np.concatenate([part[1] for part in self.parts[c]])
+			self.parts[c] = []
+		else:
+			return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+		order = np.argsort(starts, kind="stable")
+		return starts[order], records[order]
+
+# Read name hashes (two 64-bit hashes, as intern_reads) of the alignments, by record
+# number. When the buffer is full they are spilled as a run sorted by hash; the read ids
+# are then assigned by a k-way merge of the runs into a memory-mapped array indexed by
+# record, so that memory is bounded by the buffer whatever the number of alignments.
+class ReadNameRuns:
+	def __init__(self, tmp_folder):
+		self.tmp_folder = tmp_folder
+		self.hash_a = array('q')
+		self.hash_b = array('q')
+		self.first_record = 0
+		self.runs = []
+
+	def add(self, names):
+		for name in names:
+			self.hash_a.append(hash(name))
+			self.hash_b.append(hash(name[::-1]))
+		if (len(self.hash_a) >= buffer_size):
+			self.spill()
+
+	def spill(self):
+		os.makedirs(self.tmp_folder, exist_ok=True)
+		run = np.empty(len(self.hash_a), dtype=RUN_DTYPE)
+		run["a"] = np.frombuffer(self.hash_a, dtype=np.int64)
+		run["b"] = np.frombuffer(self.hash_b, dtype=np.int64)
+		run["record"] = np.arange(self.first_record, self.first_record + len(run), dtype=np.int64)
+		run = run[np.lexsort((run["b"], run["a"]))]
+		run_file = os.path.join(self.tmp_folder, f'names.{len(self.runs)}')
+		run.tofile(run_file)
+		self.runs.append((run_file, len(run)))
+		self.first_record = self.first_record + len(run)
+		self.hash_a = array('q')
+		self.hash_b = array('q')
+
+	# Dense read id of every record (0, 1, ... in order of first appearance) and the
+	# number of reads
+	def read_ids(self, num_aln):
+		if not self.runs:
+			return intern_reads(self.hash_a, self.hash_b)
+		if self.hash_a:
+			self.spill()
+		ids = np.lib.format.open_memmap(os.path.join(self.tmp_folder, "read_ids.npy"), mode="w+", dtype=np.int64, shape=(num_aln,))
+		self.merge_runs(ids)
+		# The first record of each read gets the next id, the others the id of their
+		# first record (an earlier record, already renumbered)
+		num_reads = 0
+		for first in range(0, num_aln, buffer_size):
+			last = min(num_aln, first + buffer_size)
+			block = ids[first:last]
+			first_of = np.array(block)
+			new = first_of == np.arange(first, last)
+			block[new] = np.arange(num_reads, num_reads + int(np.sum(new)))
+			num_reads = num_reads + int(np.sum(new))
+			block[~new] = ids[first_of[~new]]
+		ids.flush()
+		return ids, num_reads
+
+	# Write the first record of its read at each record. The runs are read in blocks;
+	# the hashes below the smallest last hash of the blocks of the runs left are complete
+	# and merged, and the runs holding that hash are read further.
+	def merge_runs(self, ids):
+		block_size = max(1, buffer_size // len(self.runs))
+		loaded = [np.zeros(0, dtype=RUN_DTYPE) for run in self.runs]
+		read = [0] * len(self.runs)
+		def refill(r):
+			(run_file, run_len) = self.runs[r]
+			data = np.fromfile(run_file, dtype=RUN_DTYPE, count=min(block_size, run_len - read[r]), offset=read[r] * RUN_DTYPE.itemsize)
+			read[r] = read[r] + len(data)
+			loaded[r] = np.concatenate((loaded[r], data))
+		for r in range(len(self.runs)):
+			refill(r)
+		while any(len(part) for part in loaded):
+			left = [r for r in range(len(self.runs)) if (read[r] < self.runs[r][1])]
+			if left:
+				frontier = min((int(loaded[r]["a"][-1]), int(loaded[r]["b"][-1])) for r in left)
+				below = [(part["a"] < frontier[0]) | ((part["a"] == frontier[0]) & (part["b"] < frontier[1])) for part in loaded]
+			else:
+				below = [np.ones(len(part), dtype=bool) for part in loaded]
+			batch = np.concatenate([part[keep] for part, keep in zip(loaded, below)])
+			loaded = [part[~keep] for part, keep in zip(loaded, below)]
+			if len(batch):
+				batch = batch[np.lexsort((batch["record"], batch["b"], batch["a"]))]
+				new_read = np.ones(len(batch), dtype=bool)
+				new_read[1:] = (np.diff(batch["a"]) != 0) | (np.diff(batch["b"]) != 0)
+				starts = np.flatnonzero(new_read)
+				ids[batch["record"]] = np.repeat(batch["record"][starts], np.diff(np.append(starts, len(batch))))
+			for r in left:
+				if (len(loaded[r]) == 0 or (int(loaded[r]["a"][-1]), int(loaded[r]["b"][-1])) == frontier):
+					refill(r)
+
+# Convert a BAM file: one pass over the records; the buckets hold the record number of
+# each alignment, which is mapped to its interned read id when the table is assembled
+def ingest_bam(bam_file):
+	chunks = bam_chunks(bam_file)
+	references = next(chunks)
+	buckets = ChromosomeBuckets(len(references), output + ".buckets")
+	names_runs = ReadNameRuns(buckets.tmp_folder)
+	num_aln = 0
+	max_start = 0
+	len_sample = []
+	for (ref_ids, starts, lengths, names) in chunks:
+		if (len(len_sample) < READ_LEN_SAMPLE):
+			len_sample.extend(lengths[:READ_LEN_SAMPLE - len(len_sample)])
+		names_runs.add(names)
+		if names:
+			starts = np.frombuffer(starts, dtype=np.int64)
+			records = np.arange(num_aln, num_aln + len(names), dtype=np.int64)
+			buckets.add(np.frombuffer(ref_ids, dtype=np.int32), starts, records)
+			num_aln = num_aln + len(names)
+			max_start = max(max_start, int(starts.max()))
+	read_ids, num_reads = names_runs.read_ids(num_aln)
+	read_len = int(args.readlen) if args.readlen else estimate_read_len(len_sample)
+	info = {"read_len": read_len, "num_reads": num_reads, "num_alignments": num_aln}
+	if buckets.spilled:
+		buckets.spill()
+	tmp = output + f'.tmp{os.getpid()}'
+	os.makedirs(tmp, exist_ok=True)
+	write_table_header(tmp, references, info)
+	columns = {}
+	columns["chroms"] = np.lib.format.open_memmap(os.path.join(tmp, "chroms.npy"), mode="w+", dtype=np.int32, shape=(num_aln,))
+	columns["starts"] = np.lib.format.open_memmap(os.path.join(tmp, "starts.npy"), mode="w+", dtype=index_dtype(max_start + read_len), shape=(num_aln,))
+	columns["reads"] = np.lib.format.open_memmap(os.path.join(tmp, "reads.npy"), mode="w+", dtype=index_dtype(info["num_reads"]), shape=(num_aln,))
+	written = 0
+	for c in range(len(references)):
+		starts, records = buckets.sorted_chromosome(c)
+		columns["chroms"][written:written + len(starts)] = c
+		columns["starts"][written:written + len(starts)] = starts
+		columns["reads"][written:written + len(starts)] = read_ids[records]
+		written = written + len(starts)
+	for name in TABLE_COLUMNS:
+		columns[name].flush()
+	columns = None
+	read_ids = None
+	shutil.rmtree(buckets.tmp_folder, ignore_errors=True)
+	finish_read_table(tmp, output)
+	return info
+
+# Convert a BED file or another read table (e.g. after filtering or subsampling)
+def ingest_alignments(path):
+	chrom_names, chroms, starts, ends, reads, num_reads = load_reads(path)
+	read_len = int(args.readlen) if args.readlen else estimate_read_len(ends - starts)
+	info = {"read_len": read_len, "num_reads": num_reads, "num_alignments": len(starts)}
+	if output:
+		columns = {
+			"chroms": chroms.astype(np.int32),
+			"starts": starts.astype(index_dtype(int(ends.max()) if len(ends) else 0)),
+			"reads": reads.astype(index_dtype(num_reads)),
+		}
+		save_read_table(output, chrom_names, columns, info)
+	return info
+
+# Export a read table as a BED file (chrom, start, start + read_len, read id)
+def export_bed(path, bed_file):
+	chrom_names, chroms, starts, ends, reads, num_reads = load_reads(path)
+	with open(bed_file, "w") as o:
+		for first in range(0, len(starts), CHUNK_SIZE):
+			last = min(first + CHUNK_SIZE, len(starts))
+			for (c, start, end, read) in zip(chroms[first:last].tolist(), starts[first:last].tolist(), ends[first:last].tolist(), reads[first:last].tolist()):
+				o.write(f'{chrom_names[c]}\t{start}\t{end}\tread{read}\n')
+
+## Main code
+start_time = time.time()
+if input_file.endswith(".bam"):
+	if not output:
+		sys.exit("[ERROR] A BAM file needs an output read table (--output)!")
+	info = ingest_bam(input_file)
+else:
+	info = ingest_alignments(input_file)
+if args.bed:
+	export_bed(output if output else input_file, args.bed)
+end_time = time.time()
+print(f'[INGEST] {info["num_alignments"]} alignments of {info["num_reads"]} reads (read length {info["read_len"]}): {end_time - start_time:.2f}s', file=sys.stderr)
+for key, value in info.items():
+	print(f'{key}\t{value}')
@@ -0,0 +1,142 @@
+###########################################################################
+# Python (v3.8.5) script metrics.py (v1.0) for phase metrics, traces and profiles
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import os
+import sys
+import time
+import json
+import glob
+import resource
+import cProfile
+import pstats
+
+## Define functions
+# Peak resident memory of this process in MB (ru_maxrss is in kB on Linux)
+def peak_rss_mb():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Start of a measured phase: wall clock and CPU time of this process
+def phase_start():
+	return (time.time(), time.process_time())
+
+# Record of a finished phase (plain dict, so worker processes can return it)
+def phase_record(phase, start, items=0, chromosome=None, **fields):
+	(wall_start, cpu_start) = start
+	record = {
+		"phase": phase,
+		"start": wall_start,
+		"wall": time.time() - wall_start,
+		"cpu": time.process_time() - cpu_start,
+		"items": int(items),
+		"rss_mb": round(peak_rss_mb(), 1),
+		"pid": os.getpid(),
+	}
+	if chromosome is not None:
+		record["chromosome"] = chromosome
+	record.update(fields)
+	return record
+
+# Phase records of one script. Phases measured in worker processes are returned to the
+# main process as records and added with add(). report() prints one summary line per
+# phase (wall and CPU times summed over chromosomes and workers) and writes the trace:
+# JSON lines (one record per line), or the Chrome trace format (chrome://tracing,
+# Perfetto) if the file name ends with .json. With a profile file, the functions run
+# through call() are profiled with cProfile in every process and the statistics are
+# merged into that file (python -m pstats <file>).
+class Metrics:
+	def __init__(self, tool, trace=None, profile=None, log=sys.stdout):
+		self.tool = tool
+		self.trace = trace
+		self.profile = profile
+		self.log = log
+		self.records = []
+		self.profiler = None
+		if profile:
+			for part in glob.glob(glob.escape(profile) + ".*.part"):
+				os.remove(part)
+
+	def start(self):
+		return phase_start()
+
+	def stop(self, phase, start, items=0, chromosome=None, **fields):
+		record = phase_record(phase, start, items, chromosome, **fields)
+		self.records.append(record)
+		return record
+
+	def add(self, records):
+		self.records.extend(records)
+
+	# Run function(*arguments), under cProfile if profiling is on. The statistics of each
+	# process are kept in <profile>.<pid>.part until report() merges them.
+	def call(self, function, *arguments):
+		if not self.profile:
+			return function(*arguments)
+		if self.profiler is None or self.profiler_pid != os.getpid():
+			self.profiler = cProfile.Profile()
+			self.profiler_pid = os.getpid()
+		result = self.profiler.runcall(function, *arguments)
+		self.profiler.dump_stats(f'{self.profile}.{os.getpid()}.part')
+		return result
+
+	# Totals of every phase, in order of first appearance
+	def totals(self):
+		totals = {}
+		for record in self.records:
+			total = totals.setdefault(record["phase"], {"wall": 0.0, "cpu": 0.0, "items": 0, "rss_mb": 0.0, "records": 0})
+			total["wall"] += record["wall"]
+			total["cpu"] += record["cpu"]
+			total["items"] += record["items"]
+			total["rss_mb"] = max(total["rss_mb"], record["rss_mb"])
+			total["records"] += 1
+		return totals
+
+	# Chromosomes with the largest wall time summed over their phases
+	def slowest_chromosomes(self, number=3):
+		walls = {}
+		for record in self.records:
+			if "chromosome" in record:
+				walls[record["chromosome"]] = walls.get(record["chromosome"], 0.0) + record["wall"]
+		return sorted(walls.items(), key=lambda item: -item[1])[:number]
+
+	def write_trace(self):
+		with open(self.trace, "w") as t:
+			if self.trace.endswith(".json"):
+				events = []
+				for record in self.records:
+					name = record["phase"] + (f' {record["chromosome"]}' if "chromosome" in record else "")
+					arguments = dict((key, value) for key, value in record.items() if key not in ("phase", "start", "wall", "pid"))
+					events.append({"name": name, "cat": self.tool, "ph": "X", "ts": round(record["start"] * 1e6), "dur": round(record["wall"] * 1e6), "pid": record["pid"], "tid": record["pid"], "args": arguments})
+				json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, t)
+			else:
+				for record in self.records:
+					print(json.dumps(dict([("tool", self.tool)] + list(record.items()))), file=t)
+
+	def merge_profiles(self):
+		parts = glob.glob(glob.escape(self.profile) + ".*.part")
+		if not parts:
+			return
+		stats = pstats.Stats(*parts)
+		stats.dump_stats(self.profile)
+		for part in parts:
+			os.remove(part)
+
+	def report(self):
+		tag = f'[{self.tool.upper()}]'
+		for phase, total in self.totals().items():
+			rate = f', {total["items"] / total["wall"]:.3g}/s' if (total["items"] > 0 and total["wall"] > 0) else ""
+			print(f'{tag} {phase}: wall {total["wall"]:.2f}s, cpu {total["cpu"]:.2f}s, {total["items"]} items{rate}, peak RSS {total["rss_mb"]:.0f} MB', file=self.log)
+		slowest = self.slowest_chromosomes()
+		if slowest:
+			print(f'{tag} slowest chromosomes: ' + ", ".join(f'{chromosome} {wall:.2f}s' for chromosome, wall in slowest), file=self.log)
+		if self.trace:
+			self.write_trace()
+			print(f'{tag} trace: {self.trace}', file=self.log)
+		if self.profile:
+			self.merge_profiles()
+			print(f'{tag} profile: {self.profile}', file=self.log)
@@ -0,0 +1,138 @@
+###########################################################################
+# Python (v3.8.5) script overlap.py (v1.0) to count reads in TE families
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import os
+import numpy as np
+
+## Lines of the TE annotation parsed at once
+PARSE_BLOCK = 1 << 18
+
+## Define functions
+# Read the TE annotation (chrom, start, end, family) into a per-chromosome interval index
+# (copies sorted by start, plus the length of the longest copy). Families are numbered
+# from 0 in order of first appearance. Coordinates are inclusive, as in the original
+# sweep over TE boundaries. With 'selected' (a set of family names) only the copies of
+# these families are indexed. The lines are parsed PARSE_BLOCK at a time, each block
+# stored as arrays, so the Python lists never hold more than one block.
+def read_te_index(repeat_file, selected=None):
+	families = {}
+	te_chr = {}
+	te_blocks = {}
+	with open(repeat_file, "r") as f:
+		for n, line in enumerate(f):
+			line = line.replace("\n", "")
+			(chrom, te_start, te_end, repeat) = line.split("\t")[:4]
+			if (selected is None or repeat in selected):
+				if (repeat not in families):
+					families[repeat] = len(families)
+				te_chr.setdefault(chrom, ([], [], []))
+				te_chr[chrom][0].append(int(te_start))
+				te_chr[chrom][1].append(int(te_end))
+				te_chr[chrom][2].append(families[repeat])
+			if ((n + 1) % PARSE_BLOCK == 0):
+				store_te_block(te_chr, te_blocks)
+	store_te_block(te_chr, te_blocks)
+	te_index = {}
+	for chrom, blocks in te_blocks.items():
+		starts = np.concatenate([block[0] for block in blocks])
+		ends = np.concatenate([block[1] for block in blocks])
+		order = np.argsort(starts, kind="stable")
+		te_index[chrom] = (starts[order], ends[order], np.concatenate([block[2] for block in blocks])[order], int(np.max(ends - starts)))
+	return families, te_index
+
+# Move the parsed copies of read_te_index into arrays (one block per chromosome)
+def store_te_block(te_chr, te_blocks):
+	for chrom, (starts, ends, fams) in te_chr.items():
+		te_blocks.setdefault(chrom, []).append((np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), np.array(fams, dtype=np.int32)))
+	te_chr.clear()
+
+# Copies of a TE index that belong to the families in 'fams' (one boolean per family
+# number); the chromosomes without such copies are left out
+def family_subset(te_index, fams):
+	subset = {}
+	for chrom, (starts, ends, te_fams, span) in te_index.items():
+		keep = fams[te_fams]
+		if np.any(keep):
+			subset[chrom] = (starts[keep], ends[keep], te_fams[keep], int(np.max(ends[keep] - starts[keep])))
+	return subset
+
+# List of families: a file with one family per line (first column, '#' lines
+# skipped) or names separated by commas
+def read_families(families):
+	if not os.path.isfile(families):
+		return set(families.split(","))
+	selected = set()
+	with open(families, "r") as f:
+		for line in f:
+			family = line.rstrip("\n").split("\t")[0].strip()
+			if (family and not family.startswith("#")):
+				selected.add(family)
+	return selected
+
+# Sum, for each family, the weighted overlap (in bp, inclusive coordinates) between the
+# reads [read_start, read_end] and the TE copies of one chromosome:
+#   count[family] = sum over reads and copies of overlap(read, copy) * read_weight
+# The weighted read coverage W(x) is integrated once (F(x) = sum of W over [0, x)), so
+# the contribution of a copy [s, e] is F(e + 1) - F(s). Only the copies that can overlap
+# a read are evaluated: O((reads + nearby copies) log reads).
+def family_overlaps(te_chr, read_starts, read_ends, read_weights, num_families):
+	if (te_chr is None or len(read_starts) == 0):
+		return np.zeros(num_families)
+	te_starts, te_ends, te_fams = nearby_copies(te_chr, read_starts, read_ends)
+	coords = np.concatenate((read_starts, read_ends + 1))
+	deltas = np.concatenate((read_weights, -read_weights))
+	order = np.argsort(coords, kind="stable")
+	coords = coords[order]
+	coverage = np.cumsum(deltas[order])
+	coverage[-1] = 0.0
+	integral = np.zeros(len(coords))
+	np.cumsum(coverage[:-1] * np.diff(coords), out=integral[1:])
+	te_sum = coverage_integral(coords, coverage, integral, te_ends + 1) - coverage_integral(coords, coverage, integral, te_starts)
+	return np.bincount(te_fams, weights=te_sum, minlength=num_families)
+
+# Copies whose start is in [read_start - longest copy, read_end] for some read: the union
+# of these index ranges (all copies when it is most of them)
+def nearby_copies(te_chr, read_starts, read_ends):
+	te_starts, te_ends, te_fams, te_span = te_chr
+	lo = np.searchsorted(te_starts, read_starts - te_span, side="left")
+	hi = np.searchsorted(te_starts, read_ends, side="right")
+	order = np.argsort(lo, kind="stable")
+	lo = lo[order]
+	hi = np.maximum.accumulate(hi[order])
+	first = np.ones(len(lo), dtype=bool)
+	first[1:] = lo[1:] > hi[:-1]
+	range_starts = lo[first]
+	range_ends = hi[np.append(np.flatnonzero(first)[1:] - 1, len(lo) - 1)]
+	lengths = np.maximum(range_ends - range_starts, 0)
+	total = int(lengths.sum())
+	if (total * 2 > len(te_starts)):
+		return te_starts, te_ends, te_fams
+	copies = np.repeat(range_starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+	return te_starts[copies], te_ends[copies], te_fams[copies]
+
+# F(x) for the piecewise-constant coverage defined by sorted event coordinates
+def coverage_integral(coords, coverage, integral, x):
+	k = np.searchsorted(coords, x, side="right") - 1
+	inside = k >= 0
+	k = np.maximum(k, 0)
+	return np.where(inside, integral[k] + coverage[k] * (x - coords[k]), 0.0)
+
+# Intervals [lo, hi] (inclusive) overlapping at least one TE copy of one chromosome,
+# from the union of the copies (sorted, disjoint)
+def overlaps_copies(te_chr, lo, hi):
+	te_starts, te_ends, te_fams, te_span = te_chr
+	union_ends = np.maximum.accumulate(te_ends)
+	first = np.ones(len(te_starts), dtype=bool)
+	first[1:] = te_starts[1:] > union_ends[:-1]
+	union_starts = te_starts[first]
+	union_ends = union_ends[np.append(np.flatnonzero(first)[1:] - 1, len(te_starts) - 1)]
+	k = np.searchsorted(union_ends, lo, side="left")
+	inside = k < len(union_starts)
+	inside[inside] = union_starts[k[inside]] <= hi[inside]
+	return inside
@@ -0,0 +1,381 @@
+###########################################################################
+# Python (v3.8.5) script pipeline.py (v1.0) to run the T3E pipeline
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import sys
+import argparse
+import os
+import re
+import json
+import time
+import glob
+import shutil
+import hashlib
+import subprocess
+
+## Set parameters
+CODEDIR = os.path.dirname(os.path.abspath(__file__))
+parser = argparse.ArgumentParser(description='T3E: Run the whole pipeline (ingest, filter, subsample, count, probabilities, simulations and enrichment) as a graph of cached tasks')
+parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+parser.add_argument('--workdir', action='store', metavar = 'workdir', default=os.path.dirname(CODEDIR), help='T3E folder with bam/, references/, repeats/ and results/ [default: the folder of this script\'s parent]')
+parser.add_argument('--cpus', action='store', metavar = 'cpus', default=str(os.cpu_count()), help='CPUs used by the tasks running at the same time [default: all CPUs]')
+parser.add_argument('--memory', action='store', metavar = 'memory', help='memory in GB used by the tasks running at the same time (estimated from their inputs) [default: physical memory]')
+parser.add_argument('--keep', action='store_true', help='keep the intermediate read tables (before filtering and subsampling)')
+parser.add_argument('--dry-run', action='store_true', help='print the tasks that would run, without running them')
+args = parser.parse_args()
+
+WORKDIR = os.path.abspath(args.workdir)
+DATASET = os.path.join(WORKDIR, "bam")
+OUTDIR = os.path.join(WORKDIR, "results")
+STATE = os.path.join(OUTDIR, ".pipeline")
+PARAMETERS = os.path.join(WORKDIR, "references", "parameters.txt")
+INFO = os.path.join(WORKDIR, "references", "control_sample.txt")
+PATH_FILE = os.path.join(WORKDIR, "references", "path_dataset.csv")
+cpus = int(args.cpus)
+memory = float(args.memory) * 1e9 if args.memory else os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+## Libraries with more reads are subsampled to this number of reads
+NR_READS_TO_SUBSAMPLE = 20000000
+## High signal filter: window, step and percentile
+WINDOWS = 100
+STEPS = 50
+PERCENTILE = 0.99997
+## Memory of a Python process with NumPy loaded
+BASE_MEMORY = 200e6
+
+## Define functions
+# key<TAB>value lines of the parameters file
+def read_parameters(path):
+	parameters = {}
+	with open(path, "r") as f:
+		for line in f:
+			fields = line.rstrip("\n").split("\t")
+			if (len(fields) >= 2 and not line.startswith("#")):
+				parameters[fields[0]] = fields[1]
+	return parameters
+
+# Parameters of the run, checked as main.sh does (workers, seed and exceedances are
+# optional)
+def check_parameters(parameters):
+	def value(key, pattern, optional=False):
+		v = parameters.get(key, "")
+		if (optional and v == ""):
+			return None
+		if not re.match(pattern + "$", v):
+			sys.exit(f'[ERROR] Parameter {key} is missing or not valid ({v}) in {PARAMETERS}!')
+		return v
+	return {
+		"species": value("species", "[A-Za-z0-9_.-]+"),
+		"iterations": int(value("iterations", "[0-9]+")),
+		"alpha": value("alpha", "[0-9]+\\.?[0-9]*"),
+		"enrichment": value("enrichment", "[0-9]+\\.?[0-9]*"),
+		"filter": value("filter", "(0|1)") == "1",
+		"workers": int(value("workers", "[0-9]+", True) or 1),
+		"seed": value("seed", "[0-9]+", True),
+		"exceedances": value("exceedances", "[0-9]+", True),
+	}
+
+# Controls and their samples (control<TAB>sample1,sample2,... lines)
+def read_control_samples(path):
+	pairs = []
+	with open(path, "r") as f:
+		for line in f:
+			fields = line.rstrip("\n").split("\t")
+			if (len(fields) >= 2 and not line.startswith("#")):
+				pairs.append((fields[0], fields[1].split(",")))
+	return pairs
+
+# Content hash (SHA-1) of a file or of all the files of a folder, cached by path, size
+# and modification time so that large BAM files are only read when they change
+def content_hash(path):
+	if os.path.isdir(path):
+		h = hashlib.sha1()
+		for name in sorted(os.listdir(path)):
+			h.update(name.encode() + b"\0" + content_hash(os.path.join(path, name)).encode())
+		return h.hexdigest()
+	stat = os.stat(path)
+	cached = hash_cache.get(path)
+	if (cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns):
+		return cached[2]
+	h = hashlib.sha1()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			h.update(chunk)
+	hash_cache[path] = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+	return h.hexdigest()
+
+# Hash of a script and of the scripts it imports from this folder (a change of the code
+# of a stage makes its results stale)
+def script_hash(script, seen=None):
+	seen = set() if seen is None else seen
+	seen.add(script)
+	h = hashlib.sha1(content_hash(os.path.join(CODEDIR, script)).encode())
+	with open(os.path.join(CODEDIR, script), "r") as f:
+		for line in f:
+			match = re.match(r'^(?:from|import) (\w+)', line)
+			if (match and os.path.isfile(os.path.join(CODEDIR, match.group(1) + ".py")) and match.group(1) + ".py" not in seen):
+				h.update(script_hash(match.group(1) + ".py", seen).encode())
+	return h.hexdigest()
+
+# Value of a key of the info.txt file of a read table
+def table_info(table, key):
+	with open(os.path.join(table, "info.txt"), "r") as f:
+		for line in f:
+			(name, value) = line.rstrip("\n").split("\t")
+			if (name == key):
+				return int(value)
+	sys.exit(f'[ERROR] No {key} in {table}!')
+
+# Size in bytes of a file or of the files of a folder
+def disk_size(path):
+	if os.path.isdir(path):
+		return sum(disk_size(os.path.join(path, name)) for name in os.listdir(path))
+	return os.path.getsize(path) if os.path.exists(path) else 0
+
+# A step of the pipeline: a script run with arguments (a function, called when the
+# task starts, so that it can read the outputs of the tasks it depends on). Its key
+# hashes the stage, the code, the parameters, the keys of the tasks it depends on and
+# the content of its other input files: the outputs of a task with the same key as in
+# an earlier run are reused. Temporary outputs (intermediate read tables) are deleted
+# once the tasks using them are done, and rebuilt only if one of them has to run again.
+class Task:
+	def __init__(self, name, script, arguments, outputs, depends=(), files=(), params=None, cpu=1, memory=lambda: BASE_MEMORY, temporary=(), folders=()):
+		self.name = name
+		self.script = script
+		self.arguments = arguments
+		self.outputs = list(outputs)
+		self.depends = list(depends)
+		self.files = list(files)
+		self.params = params if params else {}
+		self.cpu = cpu
+		self.memory = memory
+		self.temporary = list(temporary)
+		self.folders = list(folders)
+		self.users = []
+		self.cached_key = None
+		for task in self.depends:
+			task.users.append(self)
+
+	def key(self):
+		if self.cached_key is None:
+			h = hashlib.sha1()
+			h.update(json.dumps([self.name, script_hash(self.script) if self.script else None, self.params], sort_keys=True).encode())
+			for task in self.depends:
+				h.update(task.key().encode())
+			for path in self.files:
+				h.update(content_hash(path).encode())
+			self.cached_key = h.hexdigest()
+		return self.cached_key
+
+	def manifest(self):
+		return os.path.join(STATE, self.name.replace(":", "_") + ".json")
+
+	def log(self):
+		return os.path.join(STATE, "logs", self.name.replace(":", "_") + ".log")
+
+	# Done in an earlier run with the same key, and all outputs still there
+	def up_to_date(self):
+		if not os.path.isfile(self.manifest()):
+			return False
+		with open(self.manifest(), "r") as f:
+			manifest = json.load(f)
+		return manifest.get("key") == self.key() and all(os.path.exists(output) for output in self.outputs)
+
+	# Remove old outputs (a half-written output is never reused) and start the script
+	def start(self):
+		if os.path.isfile(self.manifest()):
+			os.remove(self.manifest())
+		for output in self.outputs:
+			if os.path.isdir(output):
+				shutil.rmtree(output)
+			elif os.path.exists(output):
+				os.remove(output)
+		for folder in self.folders:
+			os.makedirs(folder, exist_ok=True)
+		for output in self.outputs:
+			os.makedirs(os.path.dirname(output), exist_ok=True)
+		self.started = time.time()
+		self.log_file = open(self.log(), "w")
+		command = self.arguments()
+		print(" ".join(command), file=self.log_file, flush=True)
+		self.process = subprocess.Popen(command, stdout=self.log_file, stderr=subprocess.STDOUT)
+
+	def finish(self):
+		self.log_file.close()
+		if (self.process.returncode != 0):
+			return False
+		with open(self.manifest(), "w") as f:
+			json.dump({"key": self.key(), "outputs": self.outputs, "seconds": round(time.time() - self.started, 1), "date": time.strftime("%Y-%m-%d %H:%M:%S")}, f, indent=1)
+		return True
+
+# Python script of the T3E folder
+def python(script, *arguments):
+	return [sys.executable, "-u", os.path.join(CODEDIR, script)] + [str(argument) for argument in arguments]
+
+# Tasks of one library (BAM file): read table, high signal filter, subsampling, counts
+def library_tasks(name, bam):
+	folder = os.path.join(OUTDIR, name)
+	pre_table = os.path.join(folder, name + "_pre.reads")
+	filtered_table = os.path.join(folder, name + "_filtered.reads")
+	table = os.path.join(folder, name + ".reads")
+	tasks = {}
+	tasks["ingest"] = Task(f'ingest:{name}', "ingest.py", lambda: python("ingest.py", "--input", bam, "--output", pre_table), [pre_table], files=[bam], memory=lambda: BASE_MEMORY + min(2 * disk_size(bam), 1.5e9), temporary=[pre_table])
+	last, last_table = tasks["ingest"], pre_table
+	if parameters["filter"]:
+		high_signal = os.path.join(folder, "high_signal")
+		regions = os.path.join(high_signal, f'{name}_high_signal_region_{WINDOWS}_{STEPS}.bed')
+		tasks["filter"] = Task(f'filter:{name}', "filter.py", lambda: python("filter.py", "--input", pre_table, "--genome", genome, "--window", WINDOWS, "--step", STEPS, "--percentile", PERCENTILE, "--output", filtered_table, "--regions", regions), [filtered_table, regions], depends=[last], files=[genome], params={"window": WINDOWS, "step": STEPS, "percentile": PERCENTILE}, memory=lambda: BASE_MEMORY + disk_size(pre_table) + 0.4e9, temporary=[filtered_table])
+		if (shutil.which("bedmap") and shutil.which("sort-bed")):
+			annotation = regions[:-len(".bed")] + "_final_annotation.bed"
+			shell = f'sort-bed "{regions}" | bedmap --echo --echo-map --echo-overlap-size "{repeats}" - | (grep "|chr" || true) > "{annotation}"'
+			tasks["annotate"] = Task(f'annotate:{name}', None, lambda: ["bash", "-o", "pipefail", "-c", shell], [annotation], depends=[tasks["filter"]], files=[repeats])
+		last, last_table = tasks["filter"], filtered_table
+	source = last_table
+	tasks["subsample"] = Task(f'subsample:{name}', "subsample.py", lambda: python("subsample.py", "--input", source, "--reads", NR_READS_TO_SUBSAMPLE, "--seed", parameters["seed"] or 0, "--output", table), [table], depends=[last], params={"reads": NR_READS_TO_SUBSAMPLE, "seed": parameters["seed"]}, memory=lambda: BASE_MEMORY + 0.5 * disk_size(source))
+	counts = os.path.join(folder, name + "_counts.txt")
+	tasks["count"] = Task(f'count:{name}', "count.py", lambda: python("count.py", "--bed", table, "--repeat", repeats, "--readlen", table_info(table, "read_len"), "--output", counts), [counts], depends=[tasks["subsample"]], files=[repeats], memory=lambda: BASE_MEMORY + 3 * disk_size(table) + 2 * disk_size(repeats))
+	return tasks, table, counts
+
+# Tasks of one control and its samples: probabilities and control index, one simulation
+# per sample (a new sample only needs its own simulation) and the enrichments
+def control_tasks(control, samples):
+	control_table = libraries[control]["table"]
+	control_counts = libraries[control]["counts"]
+	probability = os.path.join(OUTDIR, control, "probabilities")
+	control_index = os.path.join(OUTDIR, control, "control_index")
+	tasks = [Task(f'probabilities:{control}', "probabilities.py", lambda: python("probabilities.py", "--control", control_table, "--readlen", table_info(control_table, "read_len"), "--genome", genome, "--outputfolder", probability, "--controlindex", control_index), [probability, control_index], depends=[libraries[control]["tasks"]["subsample"]], files=[genome], params={"species": parameters["species"]}, folders=[probability], memory=lambda: BASE_MEMORY + 4 * disk_size(control_table))]
+	backgrounds = []
+	for sample in samples:
+		sample_table = libraries[sample]["table"]
+		background = os.path.join(OUTDIR, sample, sample + "_background.npz")
+		options = ["--seed", parameters["seed"]] if parameters["seed"] else []
+		if parameters["exceedances"]:
+			options = options + ["--signal", libraries[sample]["counts"], "--alpha", parameters["alpha"], "--exceedances", parameters["exceedances"]]
+		trace = os.path.join(STATE, "logs", f'simulate_{control}_{sample}.trace.jsonl')
+		arguments = lambda sample=sample, sample_table=sample_table, options=options, trace=trace: python("t3e.py", "--repeat", repeats, "--sample", sample_table, "--readlen", table_info(sample_table, "read_len"), "--control", control_table, "--controlcounts", control_counts, "--probability", probability, "--controlindex", control_index, "--iter", parameters["iterations"], "--genome", genome, "--workers", parameters["workers"], *options, "--trace", trace, "--outputfolder", os.path.join(OUTDIR, sample), "--outputprefix", sample)
+		params = {"iterations": parameters["iterations"], "species": parameters["species"], "seed": parameters["seed"], "exceedances": parameters["exceedances"], "alpha": parameters["alpha"] if parameters["exceedances"] else None}
+		depends = [libraries[sample]["tasks"]["subsample"], libraries[control]["tasks"]["subsample"], libraries[control]["tasks"]["count"], tasks[0]] + ([libraries[sample]["tasks"]["count"]] if parameters["exceedances"] else [])
+		tasks.append(Task(f'simulate:{control}:{sample}', "t3e.py", arguments, [background], depends=depends, files=[repeats, genome], params=params, cpu=parameters["workers"], memory=lambda: BASE_MEMORY + 4 * disk_size(control_table) + disk_size(sample_table) + 2 * disk_size(repeats)))
+		backgrounds.append(tasks[-1])
+	combined = os.path.join(OUTDIR, control, control + "_enrichment_combined.txt")
+	arguments = lambda: python("enrichment.py", "--background", ",".join(task.outputs[0] for task in backgrounds), "--signal", ",".join(libraries[sample]["counts"] for sample in samples), "--iter", parameters["iterations"], "--alpha", parameters["alpha"], "--enrichment", parameters["enrichment"], *(["--exceedances", parameters["exceedances"]] if parameters["exceedances"] else []), "--combined", combined, "--outputfolder", ",".join(os.path.join(OUTDIR, sample) for sample in samples), "--outputprefix", ",".join(samples))
+	outputs = [os.path.join(OUTDIR, sample, sample + "_enrichment.txt") for sample in samples] + [combined]
+	params = {"iterations": parameters["iterations"], "alpha": parameters["alpha"], "enrichment": parameters["enrichment"], "exceedances": parameters["exceedances"]}
+	tasks.append(Task(f'enrichment:{control}', "enrichment.py", arguments, outputs, depends=backgrounds + [libraries[sample]["tasks"]["count"] for sample in samples], params=params))
+	return tasks
+
+# Tasks to run: the final tasks that are not up to date, and the tasks they need whose
+# outputs are missing (e.g. deleted intermediate read tables)
+def tasks_to_run(tasks):
+	needed = []
+	def need(task):
+		if task in needed:
+			return
+		for dependency in task.depends:
+			if not dependency.up_to_date():
+				need(dependency)
+		needed.append(task)
+	for task in tasks:
+		if not task.temporary and not task.up_to_date():
+			need(task)
+	return needed
+
+# Delete the temporary outputs of a task once no task still to run needs them
+def clean_temporary(task, remaining):
+	if (args.keep or any(user in remaining for user in task.users)):
+		return
+	for output in task.temporary:
+		if os.path.isdir(output):
+			shutil.rmtree(output)
+
+# Run the tasks as their dependencies finish, in order, as long as the CPUs and the
+# estimated memory of the running tasks fit in the budget (a task always runs alone)
+def run_tasks(needed):
+	remaining = list(needed)
+	running = []
+	failed = []
+	while remaining or running:
+		started = True
+		while started and not failed:
+			started = False
+			for task in remaining:
+				if any(dependency in remaining or dependency in running for dependency in task.depends):
+					continue
+				task.estimated = task.memory()
+				if running and (sum(t.cpu for t in running) + task.cpu > cpus or sum(t.estimated for t in running) + task.estimated > memory):
+					continue
+				print(f'[PIPELINE] Start {task.name} ({task.cpu} CPU(s), {task.estimated / 1e9:.1f} GB estimated)')
+				task.start()
+				running.append(task)
+				remaining.remove(task)
+				started = True
+				break
+		if not running:
+			break
+		time.sleep(0.1)
+		for task in [t for t in running if t.process.poll() is not None]:
+			running.remove(task)
+			if task.finish():
+				print(f'[PIPELINE] Done {task.name}: {time.time() - task.started:.2f}s')
+				for dependency in task.depends:
+					clean_temporary(dependency, remaining + running)
+				clean_temporary(task, remaining + running)
+			else:
+				print(f'[PIPELINE] [ERROR] {task.name} failed (exit code {task.process.returncode}), see {task.log()}')
+				with open(task.log(), "r") as f:
+					for line in f.readlines()[-10:]:
+						print(f'[PIPELINE]   {line.rstrip()}')
+				failed.append(task)
+	return failed
+
+## Main code
+start_time = time.time()
+parameters = check_parameters(read_parameters(PARAMETERS))
+genome = os.path.join(WORKDIR, "references", parameters["species"] + ".genome")
+repeats = os.path.join(WORKDIR, "repeats", "rmsk_" + parameters["species"] + ".bed")
+for path in (genome, repeats):
+	if not os.path.isfile(path):
+		sys.exit(f'[ERROR] Cannot find {path}!')
+os.makedirs(os.path.join(STATE, "logs"), exist_ok=True)
+hash_file = os.path.join(STATE, "hashes.json")
+hash_cache = {}
+if os.path.isfile(hash_file):
+	with open(hash_file, "r") as f:
+		hash_cache = json.load(f)
+
+## Graph of tasks: every BAM file of bam/, then every control of control_sample.txt
+libraries = {}
+for bam in sorted(glob.glob(os.path.join(DATASET, "*.bam"))):
+	name = os.path.basename(bam)[:-len(".bam")]
+	tasks, table, counts = library_tasks(name, bam)
+	libraries[name] = {"bam": bam, "tasks": tasks, "table": table, "counts": counts}
+all_tasks = [task for library in libraries.values() for task in library["tasks"].values()]
+for control, samples in read_control_samples(INFO):
+	for name in [control] + samples:
+		if name not in libraries:
+			sys.exit(f'[ERROR] Cannot find {os.path.join(DATASET, name + ".bam")}!')
+	all_tasks = all_tasks + control_tasks(control, samples)
+needed = tasks_to_run(all_tasks)
+print(f'[PIPELINE] {len(all_tasks)} tasks, {len(all_tasks) - len(needed)} up to date, {len(needed)} to run ({cpus} CPU(s), {memory / 1e9:.1f} GB)')
+with open(hash_file, "w") as f:
+	json.dump(hash_cache, f)
+if args.dry_run:
+	for task in needed:
+		print(f'[PIPELINE] Would run {task.name}')
+	sys.exit(0)
+failed = run_tasks(needed)
+with open(hash_file, "w") as f:
+	json.dump(hash_cache, f)
+if failed:
+	sys.exit(f'[ERROR] {len(failed)} task(s) failed: {", ".join(task.name for task in failed)}')
+
+## Dataset file (BAM file;number of reads;read length), as written by earlier versions
+with open(PATH_FILE, "w") as o:
+	for name, library in libraries.items():
+		print(f'{library["bam"]};{table_info(library["table"], "num_reads")};{table_info(library["table"], "read_len")}', file=o)
+print(f'[PIPELINE] Completed in {time.time() - start_time:.2f}s')
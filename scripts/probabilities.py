@@ -1,6 +1,6 @@
 ###########################################################################
-# Python (v3.8.5) script probabilities.py (v1.0) for input-based probabilities
-# Last update: 2022_06_07
+# Python (v3.8.5) script probabilities.py (v1.1) for input-based probabilities
+# Last update: 2026_10_18
 # Author: Michelle Almeida da Paz
 ###########################################################################
 
@@ -9,14 +9,23 @@
 import sys
 import argparse
 import os
-import time
+import numpy as np
+from readtable import load_reads, index_dtype
+from metrics import Metrics
+from control_index import load_control_index
+from genome import load_chromosomes
 
 parser = argparse.ArgumentParser(description='Calculate input-basd background probability distribution')
-parser.add_argument('--version', action='version', version='%(prog)s 1.0')
-parser.add_argument('--control', action='store', metavar = 'control_file', help='ChIP-seq input control experiment [BED format]')
+parser.add_argument('--version', action='version', version='%(prog)s 1.1')
+parser.add_argument('--control', action='store', metavar = 'control_file', help='ChIP-seq input control experiment [BED format or read table folder]')
 parser.add_argument('--readlen', action='store', metavar = 'readlen', help='ChIP-seq input control experiment read length in base pairs [Example --readlen 36]')
-parser.add_argument('--species', action='store', metavar = 'species', help='hg38 (Homo sapiens) or mm10 (Mus musculus) [Example --species hg38]')
+parser.add_argument('--species', action='store', metavar = 'species', help='assembly with a .genome file in the references folder, e.g. hg38 (Homo sapiens) or mm10 (Mus musculus) [Example --species hg38]')
+parser.add_argument('--genome', action='store', metavar = 'genome', help='chromosome sizes of the assembly [.genome file; default: references/<species>.genome, or all chromosomes of the control without --species]')
 parser.add_argument('--outputfolder', action='store', metavar = 'outputfolder', help='output folder path [Example: /probabilities]')
+parser.add_argument('--text', action='store_true', help='also export the probabilities as <chr>_prob.txt text files')
+parser.add_argument('--controlindex', action='store', metavar = 'control_index_folder', help='also build the binary control index of t3e.py in this folder (if it does not exist yet) [Example: /control/control_index]')
+parser.add_argument('--trace', action='store', metavar = 'trace', help='write wall time, CPU time, items and peak memory of every phase and chromosome [.jsonl: JSON lines, .json: Chrome trace format]')
+parser.add_argument('--profile', action='store', metavar = 'profile', help='profile the probabilities of every chromosome with cProfile and write the statistics to this file [read with: python -m pstats <file>]')
 args = parser.parse_args()
 
 if (len(sys.argv) == 1):
@@ -27,73 +36,78 @@ control = args.control
 read_len = int(args.readlen)
 species = args.species
 outputfolder = args.outputfolder
+metrics = Metrics("probabilities", args.trace, args.profile)
 
-def read_frequency():
-	time_point_a = time.time()
-	previous_start = 0
-	previous_end = 0
-	with open(control, "r") as f:
-		for line in f:
-			line = line.replace("\n", "")
-			(chrom, start, end, read) = line.split("\t")
-			if (read not in freq_reads):
-				freq_reads[read] = 1
-			else:
-				freq_reads[read] += 1
-			chr_reads[chrom].append(read)
-	time_point_b = time.time()
-	print(f'#Time for read freq: {time_point_b - time_point_a:.5f}s')
+## Number of positions written at once
+BLOCK_SIZE = 1 << 22
 
-	return freq_reads
+# Covered segments of one chromosome: each alignment adds (1/freq)/(read_len*num_reads)
+# to every base in [start, end). Returns the segment starts, lengths and per-base values.
+def coverage_segments(starts, ends, weights):
+	coords, inverse = np.unique(np.concatenate((starts, ends)), return_inverse=True)
+	n = len(starts)
+	value_diff = np.bincount(inverse, weights=np.concatenate((weights, -weights)), minlength=len(coords))
+	count_diff = np.bincount(inverse, weights=np.concatenate((np.ones(n), -np.ones(n))), minlength=len(coords))
+	values = np.cumsum(value_diff)[:-1]
+	covered = np.cumsum(count_diff)[:-1] > 0
+	lengths = np.diff(coords)
+	return coords[:-1][covered], lengths[covered], values[covered]
 
-def calculate_probability(c):
-	time_point_a = time.time()
-	with open(control, "r") as f:
-		for line in f:
-			line = line.replace("\n", "")
-			(chrom, start, end, read) = line.split("\t")
-			if (chrom == c):
-				for i in range(int(start), int(end)):
-					if (i not in pos_prob):
-						pos_prob[i] = (1/freq_reads[read])/(read_len*num_reads[chrom])
-					else:
-						pos_prob[i] += (1/freq_reads[read])/(read_len*num_reads[chrom])
-	time_point_b = time.time()
-	print(f'#Time for calculate probability: {time_point_b - time_point_a:.5f}s')
+# Write positions and cumulative probabilities block by block (bounded memory); returns
+# the number of positions written
+def write_probability(chromosome, seg_starts, seg_lengths, seg_values):
+	seg_ends = np.cumsum(seg_lengths)
+	seg_begins = seg_ends - seg_lengths
+	seg_mass = seg_values * seg_lengths
+	seg_cumprob = np.cumsum(seg_mass) - seg_mass
+	total = int(seg_ends[-1])
+	pos_out = np.lib.format.open_memmap(outputfolder + os.path.sep + chromosome + '_pos.npy', mode="w+", dtype=index_dtype(int(seg_starts[-1] + seg_lengths[-1])), shape=(total,))
+	cumprob_out = np.lib.format.open_memmap(outputfolder + os.path.sep + chromosome + '_cumprob.npy', mode="w+", dtype=np.float64, shape=(total,))
+	text_out = open(outputfolder + os.path.sep + chromosome + '_prob.txt', "w") if args.text else None
+	for written in range(0, total, BLOCK_SIZE):
+		idx = np.arange(written, min(written + BLOCK_SIZE, total))
+		k = np.searchsorted(seg_ends, idx, side="right")
+		within = idx - seg_begins[k]
+		positions = seg_starts[k] + within
+		cumprob = seg_cumprob[k] + seg_values[k] * (within + 1)
+		pos_out[written:written + len(idx)] = positions
+		cumprob_out[written:written + len(idx)] = cumprob
+		if text_out is not None:
+			for pos, value in zip(positions.tolist(), cumprob.tolist()):
+				text_out.write(f'{pos} \t {value}\n')
+	pos_out.flush()
+	cumprob_out.flush()
+	if text_out is not None:
+		text_out.close()
+	return total
 
-	return pos_prob
+# Probabilities of one chromosome (alignments [first, last) of the control)
+def chromosome_probability(chromosome, c, first, last):
+	weights = inv_freq[first:last] / (read_len * num_reads[c])
+	seg_starts, seg_lengths, seg_values = coverage_segments(starts[first:last], ends[first:last], weights)
+	return write_probability(chromosome, seg_starts, seg_lengths, seg_values)
 
-if (species == "hg19" or species == "hg38"):
-	chromosomes = ["chr1", "chr2", "chr3", "chr4", "chr5", "chr6", "chr7", "chr8", "chr9", "chr10", "chr11", "chr12", "chr13", "chr14", "chr15", "chr16", "chr17", "chr18", "chr19", "chr20", "chr21", "chr22", "chrX", "chrY"]
-elif (species == "mm10"):
-	chromosomes = ["chr1", "chr2", "chr3", "chr4", "chr5", "chr6", "chr7", "chr8", "chr9", "chr10", "chr11", "chr12", "chr13", "chr14", "chr15", "chr16", "chr17", "chr18", "chr19", "chrX", "chrY"]
-else:
-	sys.exit("[ERROR] Species not defined correctly!")
+phase = metrics.start()
+chrom_names, chroms, starts, ends, reads, num_control_reads = load_reads(control)
+freq_reads = np.bincount(reads, minlength=num_control_reads)
+inv_freq = 1 / freq_reads[reads]
+num_reads = np.bincount(chroms, weights=inv_freq, minlength=len(chrom_names))
+metrics.stop("read_control", phase, len(starts), reads=num_control_reads)
+chromosomes = load_chromosomes(args.genome, species, chrom_names)
 
-pos_prob = {}
-num_reads = {}
-chr_reads = {}
-freq_reads = {}
-
-for chromosome in chromosomes:
-	num_reads[chromosome] = 0
-	chr_reads[chromosome] = []
-
-freq_reads= read_frequency()
-
-for chromosome in chromosomes:
-	for elem in chr_reads[chromosome]:
-		num_reads[chromosome] = num_reads[chromosome] + 1/freq_reads[elem]
-	pos_prob = calculate_probability(chromosome)
-	first_pos = int(list(pos_prob.keys())[0])
-	file_out = args.outputfolder + os.path.sep + chromosome + '_prob.txt'
-	with open(file_out, "w") as o:
-		for pos in pos_prob:
-			if(pos == first_pos):
-				print(pos, "\t", pos_prob[pos], file=o)
-				last_cumprob = pos_prob[pos]
-			else:
-				cumprob = pos_prob[pos] + last_cumprob
-				print(pos, "\t", cumprob, file=o)
-				last_cumprob = cumprob
-	pos_prob = {}
+chrom_offsets = np.searchsorted(chroms, np.arange(len(chrom_names) + 1))
+for chromosome in chromosomes.names:
+	c = chrom_names.index(chromosome) if (chromosome in chrom_names) else -1
+	if (c < 0 or chrom_offsets[c] == chrom_offsets[c + 1]):
+		print(f'[WARNING] No reads in {chromosome}, no probabilities written')
+		continue
+	phase = metrics.start()
+	first = chrom_offsets[c]
+	last = chrom_offsets[c + 1]
+	positions = metrics.call(chromosome_probability, chromosome, c, first, last)
+	metrics.stop("probability", phase, positions, chromosome, alignments=int(last - first))
+if args.controlindex:
+	phase = metrics.start()
+	control_chromosomes, control_arrays = load_control_index(control, read_len, args.controlindex)
+	metrics.stop("control_index", phase, len(control_arrays["positions"]))
+metrics.report()
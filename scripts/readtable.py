@@ -0,0 +1,163 @@
+###########################################################################
+# Python (v3.8.5) script readtable.py (v1.0) to load read alignments as arrays
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import os
+import sys
+import shutil
+from array import array
+import numpy as np
+
+## Read table: a folder with chromosomes.txt, info.txt and one .npy file per column
+## (chroms, starts, reads), sorted by chromosome and start; ends are start + read_len
+TABLE_COLUMNS = ["chroms", "starts", "reads"]
+
+## Define functions
+# Dense read ids (0, 1, ... in order of first appearance) from two independent 64-bit
+# hashes of the read name of each alignment. Only typed arrays are kept, instead of a
+# dictionary holding every read name (128 bits make collisions negligible).
+def intern_reads(hash_a, hash_b):
+	hash_a = np.frombuffer(hash_a, dtype=np.int64)
+	hash_b = np.frombuffer(hash_b, dtype=np.int64)
+	if (len(hash_a) == 0):
+		return np.zeros(0, dtype=np.int64), 0
+	order = np.lexsort((hash_b, hash_a))
+	new_read = np.ones(len(order), dtype=bool)
+	new_read[1:] = (np.diff(hash_a[order]) != 0) | (np.diff(hash_b[order]) != 0)
+	group = np.cumsum(new_read) - 1
+	num_reads = int(group[-1]) + 1
+	# Renumber the groups by their first alignment (the lexsort is stable)
+	first = order[new_read]
+	rank = np.empty(num_reads, dtype=np.int64)
+	rank[np.argsort(first, kind="stable")] = np.arange(num_reads)
+	reads = np.empty(len(order), dtype=np.int64)
+	reads[order] = rank[group]
+	return reads, num_reads
+
+# Read a BED file (chrom, start, end, read_id) sorted by chromosome into typed arrays.
+# Chromosomes and reads are numbered in order of first appearance.
+def read_bed(bed_file):
+	chrom_names = []
+	chrom_idx = {}
+	chroms = array('i')
+	starts = array('q')
+	ends = array('q')
+	hash_a = array('q')
+	hash_b = array('q')
+	last_chrom = None
+	with open(bed_file, "r") as f:
+		for line in f:
+			if line.startswith("#"):
+				continue
+			(chrom, start, end, read_id) = line.rstrip("\n").split("\t")[:4]
+			if (chrom != last_chrom):
+				if (chrom in chrom_idx):
+					sys.exit(f'[ERROR] {bed_file} is not sorted by chromosome ({chrom})')
+				chrom_idx[chrom] = len(chrom_names)
+				chrom_names.append(chrom)
+				last_chrom = chrom
+			chroms.append(chrom_idx[chrom])
+			starts.append(int(start))
+			ends.append(int(end))
+			hash_a.append(hash(read_id))
+			hash_b.append(hash(read_id[::-1]))
+	reads, num_reads = intern_reads(hash_a, hash_b)
+	return chrom_names, np.frombuffer(chroms, dtype=np.int32), np.frombuffer(starts, dtype=np.int64), np.frombuffer(ends, dtype=np.int64), reads, num_reads
+
+# Smallest signed integer type able to hold values up to max_value
+def index_dtype(max_value):
+	if (max_value < 2 ** 31):
+		return np.int32
+	return np.int64
+
+# Save a read table (written in a temporary folder and renamed when complete)
+def save_read_table(path, chrom_names, columns, info):
+	tmp = path + f'.tmp{os.getpid()}'
+	os.makedirs(tmp, exist_ok=True)
+	write_table_header(tmp, chrom_names, info)
+	for name in TABLE_COLUMNS:
+		np.save(os.path.join(tmp, name + ".npy"), columns[name])
+	finish_read_table(tmp, path)
+
+# Chromosome names and info (key<TAB>value lines) of a read table
+def write_table_header(path, chrom_names, info):
+	with open(os.path.join(path, "chromosomes.txt"), "w") as o:
+		for chrom in chrom_names:
+			print(chrom, file=o)
+	with open(os.path.join(path, "info.txt"), "w") as o:
+		for key, value in info.items():
+			print(f'{key}\t{value}', file=o)
+
+# Move a completed read table in place, replacing an older one
+def finish_read_table(tmp, path):
+	if os.path.isdir(path):
+		shutil.rmtree(path)
+	os.rename(tmp, path)
+
+# Open a read table with memory mapping: returns chromosome names, columns and info
+def open_read_table(path):
+	with open(os.path.join(path, "chromosomes.txt"), "r") as f:
+		chrom_names = [line.rstrip("\n") for line in f]
+	info = {}
+	with open(os.path.join(path, "info.txt"), "r") as f:
+		for line in f:
+			(key, value) = line.rstrip("\n").split("\t")
+			info[key] = int(value)
+	columns = {}
+	for name in TABLE_COLUMNS:
+		columns[name] = np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+	return chrom_names, columns, info
+
+# Rows [first, last) of a .npy file, read from their byte offset (without memory
+# mapping, so only these rows are ever in memory)
+def read_rows(npy_file, first, last):
+	with open(npy_file, "rb") as f:
+		version = np.lib.format.read_magic(f)
+		if (version == (1, 0)):
+			shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+		else:
+			shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+		last = min(last, shape[0])
+		f.seek(f.tell() + first * dtype.itemsize)
+		return np.fromfile(f, dtype=dtype, count=max(last - first, 0))
+
+# Number of rows of a .npy file
+def count_rows(npy_file):
+	with open(npy_file, "rb") as f:
+		version = np.lib.format.read_magic(f)
+		if (version == (1, 0)):
+			return np.lib.format.read_array_header_1_0(f)[0][0]
+		return np.lib.format.read_array_header_2_0(f)[0][0]
+
+# Cut a .npy column to its first rows in place: the header is rewritten with the new
+# shape (padded to its old length) and the file truncated
+def trim_rows(npy_file, rows):
+	with open(npy_file, "r+b") as f:
+		version = np.lib.format.read_magic(f)
+		if (version == (1, 0)):
+			shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+		else:
+			shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+		offset = f.tell()
+		start = np.lib.format.MAGIC_LEN + (2 if (version == (1, 0)) else 4)
+		header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": fortran_order, "shape": (rows,)})
+		f.seek(start)
+		f.write((header.ljust(offset - start - 1) + "\n").encode("latin1"))
+		f.truncate(offset + rows * dtype.itemsize)
+
+# Read tables are folders, BED files are plain files
+def is_read_table(path):
+	return os.path.isdir(path)
+
+# Alignments of a read table or of a BED file, as returned by read_bed
+def load_reads(path):
+	if not is_read_table(path):
+		return read_bed(path)
+	chrom_names, columns, info = open_read_table(path)
+	starts = np.asarray(columns["starts"], dtype=np.int64)
+	return chrom_names, np.asarray(columns["chroms"], dtype=np.int32), starts, starts + info["read_len"], np.asarray(columns["reads"], dtype=np.int64), info["num_reads"]
@@ -0,0 +1,94 @@
+###########################################################################
+# Python (v3.8.5) script sampler.py (v1.0) to sample random read positions
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import os
+import numpy as np
+from readtable import read_rows, count_rows
+
+## Define functions
+# Independent random stream for one unit of work (e.g. one chromosome and iteration),
+# derived from the run seed only: results do not depend on how units are scheduled
+def stream_rng(seed, *key):
+	return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=key))
+
+# Read the positions and cumulative probabilities of a <chr>_prob.txt file
+def read_probabilities(prob_file):
+	position_list = []
+	cumprob_list = []
+	with open(prob_file, "r") as infile:
+		for line in infile:
+			line = line.rstrip()
+			(pos, value) = line.split("\t")
+			position_list.append(int(pos))
+			cumprob_list.append(float(value))
+	return np.array(position_list, dtype=np.int64), np.array(cumprob_list, dtype=np.float64)
+
+# Load the probabilities of one chromosome: the binary <chr>_pos.npy/<chr>_cumprob.npy
+# files are memory-mapped, the <chr>_prob.txt text file is parsed if they are missing
+def load_probabilities(prob_path, chromosome):
+	pos_file = prob_path + os.path.sep + chromosome + "_pos.npy"
+	cumprob_file = prob_path + os.path.sep + chromosome + "_cumprob.npy"
+	if (os.path.isfile(pos_file) and os.path.isfile(cumprob_file)):
+		return np.load(pos_file, mmap_mode="r"), np.load(cumprob_file, mmap_mode="r")
+	return read_probabilities(prob_path + os.path.sep + chromosome + "_prob.txt")
+
+# Draw 'times' random positions for each of 'num_iter' iterations (one row per iteration)
+# by inverse-CDF lookup: a uniform number u is mapped to the first position whose
+# cumulative probability is strictly greater than u
+def draw_positions(rng, position_list, cumprob_list, times, num_iter):
+	randnum = rng.uniform(cumprob_list[0], cumprob_list[-1], size=(num_iter, times))
+	randnum.sort(axis=1)
+	idx = np.searchsorted(cumprob_list, randnum, side="right")
+	np.minimum(idx, len(position_list) - 1, out=idx)
+	return position_list[idx]
+
+# Find, for each random position, the slice [lo, hi) of control reads (sorted by start)
+# starting between random - read_len and random
+def candidate_ranges(read_starts, random_pos, read_len):
+	lo = np.searchsorted(read_starts, random_pos - read_len, side="left")
+	hi = np.searchsorted(read_starts, random_pos, side="right")
+	return lo, hi
+
+# Cumulative candidate weights of the control reads of one chromosome (sorted by start):
+# a read with k alignments has weight 1/k
+def candidate_weights(map_counts):
+	cand_cum = np.zeros(len(map_counts) + 1)
+	np.cumsum(1 / map_counts, out=cand_cum[1:])
+	return cand_cum
+
+# Choose one control read in each slice [lo, hi) with probability proportional to its weight
+def choose_candidates(rng, cand_cum, lo, hi):
+	low = cand_cum[lo]
+	high = cand_cum[hi]
+	selected = np.searchsorted(cand_cum, low + rng.random(len(lo)) * (high - low), side="right") - 1
+	return np.minimum(np.maximum(selected, lo), hi - 1)
+
+# draw_positions for one iteration, without the probabilities in memory: the <chr>_pos.npy
+# and <chr>_cumprob.npy files are read chunk by chunk (chunk rows at once). The sorted
+# uniform numbers below the last cumulative probability of a chunk (and not below that of
+# the chunk before) are looked up in it, so the positions are those of draw_positions.
+def draw_positions_streamed(rng, pos_file, cumprob_file, times, chunk):
+	num_pos = count_rows(cumprob_file)
+	randnum = rng.uniform(read_rows(cumprob_file, 0, 1)[0], read_rows(cumprob_file, num_pos - 1, num_pos)[0], size=(1, times))[0]
+	randnum.sort()
+	last_pos = read_rows(pos_file, num_pos - 1, num_pos)
+	random_pos = np.empty(times, dtype=last_pos.dtype)
+	done = 0
+	for first in range(0, num_pos, chunk):
+		if (done == times):
+			break
+		cumprob = read_rows(cumprob_file, first, first + chunk)
+		found = done + int(np.searchsorted(randnum[done:], cumprob[-1], side="left"))
+		if (found > done):
+			idx = np.searchsorted(cumprob, randnum[done:found], side="right")
+			random_pos[done:found] = read_rows(pos_file, first, first + len(cumprob))[idx]
+			done = found
+	# Numbers at or above the last cumulative probability take the last position
+	random_pos[done:] = last_pos[0]
+	return random_pos
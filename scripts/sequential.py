@@ -0,0 +1,30 @@
+###########################################################################
+# Python (v3.8.5) script sequential.py (v1.0) for sequential Monte Carlo p-values
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import numpy as np
+
+## Define functions
+# Number of exceedances (background > observed) after which a family is decided
+# (Besag & Clifford, 1991): 'exceedances', but never more than needed to show that
+# the p-value is above alpha after all the requested iterations
+def stop_exceedances(alpha, num_iter, exceedances):
+	return max(1, min(exceedances, int(alpha * num_iter) + 1))
+
+# Sequential p-values of the families in 'background' (iterations x families, in
+# iteration order) given the observed counts: a family stops at the iteration of its
+# stop_k-th exceedance. Returns the exceedances counted, the effective number of
+# iterations of each family and which families are decided.
+def sequential_counts(background, observed, stop_k):
+	exceed = background > observed
+	seen = np.cumsum(exceed, axis=0)
+	decided = seen[-1] >= stop_k if len(seen) else np.zeros(len(observed), dtype=bool)
+	effective = np.full(len(observed), len(background), dtype=np.int64)
+	effective[decided] = np.argmax(seen[:, decided] >= stop_k, axis=0) + 1
+	qt = np.where(decided, stop_k, seen[-1] if len(seen) else 0)
+	return qt, effective, decided
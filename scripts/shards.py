@@ -0,0 +1,89 @@
+###########################################################################
+# Python (v3.8.5) script shards.py (v1.0) to plan and merge chromosome shards of T3E
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import sys
+import argparse
+import numpy as np
+from readtable import load_reads
+from background import write_background, find_shards, merge_shards
+from genome import load_chromosomes, chromosome_costs, cost_order
+
+## Set parameters
+parser = argparse.ArgumentParser(description='T3E: Plan chromosome shards of t3e.py and merge their partial backgrounds')
+parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+commands = parser.add_subparsers(dest='command', metavar='command')
+plan = commands.add_parser('plan', help='split the chromosomes into shards of similar cost, largest first (one line of chromosomes per shard, for t3e.py --chromosomes)')
+plan.add_argument('--genome', action='store', metavar = 'genome', help='chromosome sizes [references/hg38.genome or references/mm10.genome]')
+plan.add_argument('--sample', action='store', metavar = 'sample_file', help='ChIP-seq sample experiment(s) of the run [BED format or read table folder], separated by commas')
+plan.add_argument('--control', action='store', metavar = 'control_file', help='ChIP-seq input control experiment of the run [BED format or read table folder]')
+plan.add_argument('--shards', action='store', metavar = 'shards', help='number of shards [Example: 4]')
+plan.add_argument('--output', action='store', metavar = 'output', help='shard file, one line per shard [default: standard output]')
+merge = commands.add_parser('merge', help='merge the shards of a background into <background>.npz')
+merge.add_argument('--background', action='store', metavar = 'background', help='background of the shards, as written by t3e.py without the extension, one per sample separated by commas [Example: /results/sample001_background]')
+merge.add_argument('--text', action='store_true', help='also write the background as a text file (iter<TAB>family<TAB>count lines)')
+args = parser.parse_args()
+
+if (len(sys.argv) == 1 or args.command is None):
+	parser.print_help()
+	parser.exit()
+
+## Define functions
+# Expected sample reads per chromosome (by id) of the largest sample (each read counts
+# once, split over its alignments), as the reads simulated by t3e.py
+def sample_reads(samples, chromosomes):
+	reads_per_chr = np.zeros(len(chromosomes))
+	for sample in samples:
+		chrom_names, chroms, starts, ends, reads, num_reads = load_reads(sample)
+		freq = np.bincount(reads, minlength=num_reads)
+		per_chr = np.bincount(chroms, weights=1 / freq[reads], minlength=len(chrom_names))
+		ids = chromosomes.lookup(chrom_names)
+		reads_per_chr[ids[ids >= 0]] = np.maximum(reads_per_chr[ids[ids >= 0]], per_chr[ids >= 0])
+	return reads_per_chr
+
+# Control alignments per chromosome (by id), as in the control index of t3e.py
+def control_alignments(control, chromosomes):
+	chrom_names, chroms, starts, ends, reads, num_reads = load_reads(control)
+	per_chr = np.bincount(chroms, minlength=len(chrom_names))
+	ids = chromosomes.lookup(chrom_names)
+	alignments = np.zeros(len(chromosomes), dtype=np.int64)
+	alignments[ids[ids >= 0]] = per_chr[ids >= 0]
+	return alignments
+
+# Largest-first assignment with the cost of t3e.py: the share of the control alignments
+# of a chromosome (probabilities and control positions) plus its share of the sample
+# reads (sampling and counting); each chromosome goes to the shard with the lowest
+# total so far
+def plan_shards(chromosomes, alignments, reads_per_chr, num_shards):
+	cost = chromosome_costs(alignments, reads_per_chr)
+	shards = [[] for shard in range(num_shards)]
+	loads = np.zeros(num_shards)
+	for c in cost_order(cost):
+		shard = int(np.argmin(loads))
+		shards[shard].append(chromosomes.names[c])
+		loads[shard] += cost[c]
+	return [shard for shard in shards if shard], loads
+
+## Main code
+if (args.command == "plan"):
+	if not (args.genome and args.sample and args.control and args.shards):
+		sys.exit("[ERROR] Give --genome, --sample, --control and --shards!")
+	chromosomes = load_chromosomes(args.genome)
+	shards, loads = plan_shards(chromosomes, control_alignments(args.control, chromosomes), sample_reads(args.sample.split(","), chromosomes), int(args.shards))
+	out = open(args.output, "w") if args.output else sys.stdout
+	for shard in shards:
+		print(",".join(shard), file=out)
+	if args.output:
+		out.close()
+	print(f'[SHARDS] {len(shards)} shard(s), relative cost from {loads.min() / max(loads.mean(), 1e-12):.2f} to {loads.max() / max(loads.mean(), 1e-12):.2f} of the mean', file=sys.stderr)
+else:
+	for background in args.background.split(","):
+		paths = find_shards(background)
+		matrix, families = merge_shards(paths)
+		write_background(background, matrix, families, args.text)
+		print(f'[SHARDS] Merged {len(paths)} shard(s) into {background}.npz ({len(matrix)} iterations, {len(families)} families)')
@@ -0,0 +1,117 @@
+###########################################################################
+# Python (v3.8.5) script subsample.py (v1.0) to downsample ChIP-seq libraries
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import sys
+import argparse
+import os
+import time
+import numpy as np
+from readtable import TABLE_COLUMNS, open_read_table, index_dtype, write_table_header, finish_read_table, trim_rows
+from sampler import stream_rng
+
+## Set parameters
+parser = argparse.ArgumentParser(description='T3E: Downsample a library to a number of reads (all alignments of the chosen reads are kept)')
+parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+parser.add_argument('--input', action='store', metavar = 'input', help='read table folder (created by ingest.py or filter.py)')
+parser.add_argument('--reads', action='store', metavar = 'reads', help='number of reads to keep [Example: 20000000]')
+parser.add_argument('--seed', action='store', metavar = 'seed', default='0', help='seed of the random number generator, runs with the same seed keep the same reads [default: 0]')
+parser.add_argument('--output', action='store', metavar = 'output', help='subsampled read table folder')
+args = parser.parse_args()
+
+if (len(sys.argv) == 1):
+	parser.print_help()
+	parser.exit()
+
+input_table = args.input
+num_keep = int(args.reads)
+seed = int(args.seed)
+output = args.output
+
+## Reads (or alignments) handled at once
+BLOCK_SIZE = 1 << 22
+
+## Define functions
+# Uniform sample of n of the reads 0..num_reads-1 (without replacement), block by block:
+# the number of sampled reads of each block is hypergeometric given the reads still to
+# sample and the reads left, and the reads of the block are then chosen uniformly.
+# Returns a mask of the sampled reads.
+def sample_reads(num_reads, n, rng):
+	sampled = np.zeros(num_reads, dtype=bool)
+	left = num_reads
+	for first in range(0, num_reads, BLOCK_SIZE):
+		size = min(BLOCK_SIZE, num_reads - first)
+		k = int(rng.hypergeometric(size, left - size, n)) if (left > size) else n
+		sampled[first + rng.choice(size, k, replace=False)] = True
+		n = n - k
+		left = left - size
+	return sampled
+
+# Output columns of capacity rows (memory-mapped .npy files in folder)
+def open_columns(folder, dtypes, capacity):
+	return {name: np.lib.format.open_memmap(os.path.join(folder, name + ".npy"), mode="w+", dtype=dtypes[name], shape=(capacity,)) for name in TABLE_COLUMNS}
+
+# Output columns grown to capacity rows, keeping their first 'written' rows
+def grow_columns(folder, out, dtypes, written, capacity):
+	for name in TABLE_COLUMNS:
+		out[name].flush()
+		os.rename(os.path.join(folder, name + ".npy"), os.path.join(folder, name + ".old.npy"))
+	old = {name: np.load(os.path.join(folder, name + ".old.npy"), mmap_mode="r") for name in TABLE_COLUMNS}
+	out = open_columns(folder, dtypes, capacity)
+	for name in TABLE_COLUMNS:
+		for first in range(0, written, BLOCK_SIZE):
+			out[name][first:min(written, first + BLOCK_SIZE)] = old[name][first:min(written, first + BLOCK_SIZE)]
+	old = None
+	for name in TABLE_COLUMNS:
+		os.remove(os.path.join(folder, name + ".old.npy"))
+	return out
+
+## Main code
+start_time = time.time()
+chrom_names, columns, info = open_read_table(input_table)
+num_reads = info["num_reads"]
+if (num_keep >= num_reads):
+	print(f'[SUBSAMPLE] {num_reads} reads, no more than {num_keep}: all reads kept', file=sys.stderr)
+	num_keep = num_reads
+sampled = sample_reads(num_reads, num_keep, stream_rng(seed, 2))
+new_ids = (np.cumsum(sampled, dtype=np.int64) - 1).astype(index_dtype(num_keep))
+
+## Alignments of the sampled reads, block by block in one pass, with the reads numbered
+## densely in their original order. The columns are written with room for the expected
+## number of alignments (and grown to all the alignments if a library has more), then
+## cut to the alignments written.
+tmp = output + f'.tmp{os.getpid()}'
+os.makedirs(tmp, exist_ok=True)
+dtypes = {name: index_dtype(num_keep) if (name == "reads") else columns[name].dtype for name in TABLE_COLUMNS}
+capacity = min(info["num_alignments"], int(1.05 * info["num_alignments"] * num_keep / max(num_reads, 1)) + BLOCK_SIZE)
+out = open_columns(tmp, dtypes, capacity)
+written = 0
+for first in range(0, len(columns["reads"]), BLOCK_SIZE):
+	reads = np.asarray(columns["reads"][first:first + BLOCK_SIZE])
+	keep = sampled[reads]
+	kept = int(np.sum(keep))
+	if (written + kept > capacity):
+		capacity = info["num_alignments"]
+		out = grow_columns(tmp, out, dtypes, written, capacity)
+	out["chroms"][written:written + kept] = columns["chroms"][first:first + BLOCK_SIZE][keep]
+	out["starts"][written:written + kept] = columns["starts"][first:first + BLOCK_SIZE][keep]
+	out["reads"][written:written + kept] = new_ids[reads[keep]]
+	written = written + kept
+for name in TABLE_COLUMNS:
+	out[name].flush()
+out = None
+for name in TABLE_COLUMNS:
+	trim_rows(os.path.join(tmp, name + ".npy"), written)
+num_aln = written
+info = {"read_len": info["read_len"], "num_reads": num_keep, "num_alignments": num_aln}
+write_table_header(tmp, chrom_names, info)
+finish_read_table(tmp, output)
+end_time = time.time()
+print(f'[SUBSAMPLE] {num_aln} alignments of {num_keep} reads (of {num_reads}), seed {seed}: {end_time - start_time:.2f}s', file=sys.stderr)
+for key, value in info.items():
+	print(f'{key}\t{value}')
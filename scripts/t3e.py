@@ -1,6 +1,6 @@
 ###########################################################################
 # Python (v3.8.5) script t3e.py (v1.1) to run T3E algorithm
-# Last update: 2022_08_25
+# Last update: 2026_10_18
 # Author: Michelle Almeida da Paz
 ###########################################################################
 
@@ -10,23 +10,45 @@
 import sys
 import argparse
 import os
+import hashlib
 import numpy as np
 import time
-import random
+import multiprocessing
+from sampler import stream_rng, load_probabilities, read_probabilities, draw_positions, draw_positions_streamed, candidate_ranges, candidate_weights, choose_candidates
+from control_index import default_index_folder, load_control_index, read_alignments_of, index_rows, reachable_chromosomes, BlockCache
+from overlap import read_te_index, family_subset, read_families, family_overlaps, overlaps_copies
+from readtable import load_reads
+from sequential import stop_exceedances, sequential_counts
+from metrics import Metrics, phase_start, phase_record
+from background import write_background, shard_file, save_shard
+from genome import load_chromosomes, chromosome_costs, cost_order
 
 ## Set parameters
 parser = argparse.ArgumentParser(description='T3E: Transposable Element Enrichment Estimator. Description: A tool for characterising the epigenetic profile of transposable elements using ChIP-seq data')
 parser.add_argument('--version', action='version', version='%(prog)s 1.0')
 parser.add_argument('--repeat', action='store', metavar = 'repeat_file', help='transposable elements annotation [rmsk_hg38.bed (Homo sapiens) or rmsk_mm10.bed (Mus musculus)]')
-parser.add_argument('--sample', action='store', metavar = 'sample_file', help='ChIP-seq sample experiment [BED format]')
+parser.add_argument('--sample', action='store', metavar = 'sample_file', help='ChIP-seq sample experiment [BED format or read table folder]; several samples of the same control and read length can be given separated by commas')
 parser.add_argument('--readlen', action='store', metavar = 'readlen', help='ChIP-seq input control experiment read length in base pairs [Example --readlen 36]')
-parser.add_argument('--control', action='store', metavar = 'control_file', help='ChIP-seq input control experiment [BED format]')
+parser.add_argument('--control', action='store', metavar = 'control_file', help='ChIP-seq input control experiment [BED format or read table folder]')
 parser.add_argument('--controlcounts', action='store', metavar = 'control_counts', help='ChIP-seq input control experiment counts [.txt format]')
 parser.add_argument('--probability', action='store', metavar = 'probability_folder', help='probability folder path [Example: /control/probability/]')
+parser.add_argument('--controlindex', action='store', metavar = 'control_index_folder', help='folder for the binary control index, reused across samples of the same control [default: control_index next to the probability folder]')
 parser.add_argument('--iter', action='store', metavar = 'iter', help='number of interations [Example: 100]')
-parser.add_argument('--species', action='store', metavar = 'species', help='hg38 (Homo sapiens) or mm10 (Mus musculus) [Example --species hg38]')
-parser.add_argument('--outputfolder', action='store', metavar = 'outputfolder', help='output folder path [Example: /probabilities]')
-parser.add_argument('--outputprefix', action='store', metavar = 'outputprefix', help='prefix name of your analysis [Example: sample001]')
+parser.add_argument('--species', action='store', metavar = 'species', help='assembly with a .genome file in the references folder, e.g. hg38 (Homo sapiens) or mm10 (Mus musculus) [Example --species hg38]')
+parser.add_argument('--genome', action='store', metavar = 'genome', help='chromosome sizes of the assembly [.genome file; default: references/<species>.genome, or all chromosomes of the control without --species]')
+parser.add_argument('--seed', action='store', metavar = 'seed', help='seed of the random number generator, runs with the same seed give identical backgrounds [default: random]')
+parser.add_argument('--workers', action='store', metavar = 'workers', default='1', help='number of processes running (chromosome, iteration) units in parallel [default: 1]')
+parser.add_argument('--signal', action='store', metavar = 'signal', help='ChIP-seq sample experiment counts [.txt format], one per sample separated by commas; stops the simulations once every family is decided at --alpha [default: run all iterations]')
+parser.add_argument('--alpha', action='store', metavar = 'alpha', default='0.05', help='level of significance for stopping the simulations early (with --signal) [default: 0.05]')
+parser.add_argument('--exceedances', action='store', metavar = 'exceedances', default='10', help='background counts above the sample count after which a family is decided (with --signal) [default: 10]')
+parser.add_argument('--chromosomes', action='store', metavar = 'chromosomes', help='simulate only these chromosomes (separated by commas) and write partial backgrounds (<outputprefix>_background.<first chromosome>.shard.npz) to merge with shards.py merge; needs --seed [default: all chromosomes]')
+parser.add_argument('--families', action='store', metavar = 'families', help='simulate only these TE families/subfamilies, separated by commas or in a file with one family per line (the other families are left out of the background) [default: all families]')
+parser.add_argument('--max-memory', action='store', metavar = 'max_memory', help='low-memory mode: keep only the multimapper table of the control in memory and load the control reads and probabilities of each chromosome on demand, caching up to this many megabytes of chromosomes (split between the workers); same results as the default mode [default: whole control index memory-mapped]')
+parser.add_argument('--text', action='store_true', help='also write the background as a text file (iter<TAB>family<TAB>count lines)')
+parser.add_argument('--trace', action='store', metavar = 'trace', help='write wall time, CPU time, items and peak memory of every phase (per chromosome for the simulations) [.jsonl: JSON lines, .json: Chrome trace format]')
+parser.add_argument('--profile', action='store', metavar = 'profile', help='profile the simulations with cProfile (all worker processes) and write the statistics to this file [read with: python -m pstats <file>]')
+parser.add_argument('--outputfolder', action='store', metavar = 'outputfolder', help='output folder path, one for all samples or one per sample separated by commas [Example: /probabilities]')
+parser.add_argument('--outputprefix', action='store', metavar = 'outputprefix', help='prefix name of your analysis, one per sample separated by commas [Example: sample001]')
 args = parser.parse_args()
 
 if (len(sys.argv) == 1):
@@ -34,364 +56,470 @@ if (len(sys.argv) == 1):
 	parser.exit()
 
 repeats = args.repeat
-sample = args.sample
+samples = args.sample.split(",")
 read_len = int(args.readlen)
 control = args.control
 control_counts = args.controlcounts
 prob_path = args.probability
+control_index = args.controlindex if args.controlindex else default_index_folder(prob_path)
 num_iter = int(args.iter)
 species = args.species
-outputprefix = args.outputprefix
-backup = args.outputfolder + os.path.sep + outputprefix + '_backup.txt'
-background = args.outputfolder + os.path.sep + outputprefix + '_background.txt'
+seed = int(args.seed) if args.seed is not None else np.random.SeedSequence().entropy
+workers = int(args.workers)
+outputprefixes = args.outputprefix.split(",")
+outputfolders = args.outputfolder.split(",")
+if (len(outputfolders) == 1):
+	outputfolders = outputfolders * len(samples)
+if (len(outputprefixes) != len(samples) or len(outputfolders) != len(samples)):
+	sys.exit("[ERROR] Give one output prefix (and one output folder or a single one) per sample!")
+signals = args.signal.split(",") if args.signal else None
+if (signals is not None and len(signals) != len(samples)):
+	sys.exit("[ERROR] Give one signal file per sample!")
+alpha = float(args.alpha)
+exceedances = int(args.exceedances)
+if (args.chromosomes and (args.seed is None or signals is not None)):
+	sys.exit("[ERROR] --chromosomes needs the same --seed in every shard, and cannot stop early with --signal!")
+max_memory = int(float(args.max_memory) * 2 ** 20) if args.max_memory else None
+backgrounds = [outputfolders[s] + os.path.sep + outputprefixes[s] + '_background' for s in range(len(samples))]
+metrics = Metrics("t3e", args.trace, args.profile)
 
 ## Define functions
-def create_chr_dict(sample):
-	with open(sample, "r") as s:
-		read_list = {}
-		for line in s:
-			line = line.rstrip()
-			(chrom, start, end, read) = line.split("\t")
-			read_list.setdefault(read, []).append(chrom)
-	for key, value in read_list.items():
-		random_chr = random.choice(value)
-		if (random_chr not in chrs_dict):
-			chrs_dict[random_chr] = 1
-		else:
-			chrs_dict[random_chr] += 1
-	return chrs_dict
+# Content hash (SHA-1, as an integer) of the alignments of a sample: chromosome names,
+# chromosome of each alignment and read ids
+def sample_key(chrom_names, chroms, reads):
+	h = hashlib.sha1("\t".join(chrom_names).encode())
+	h.update(np.ascontiguousarray(chroms, dtype=np.int32))
+	h.update(np.ascontiguousarray(reads, dtype=np.int64))
+	return int(h.hexdigest(), 16)
 
-def read_control_file(control_file):
-	array1 = []
-	array2 = []
-	array3 = []
-	id_idx_dict = {}
-	end_dict = {}
-	chr_pos = ""
-	first_id_seen = []
-	last_seen = {}
+# Number of sample reads per chromosome (by id), each read assigned to one of its
+# alignments at random; reads assigned to a chromosome out of the registry are left out.
+# The random stream is keyed by the content of the sample, so a sample gets the same
+# assignment with the same seed whatever the other samples of the run and their order.
+def sample_chr_reads(sample):
+	chrom_names, chroms, starts, ends, reads, num_reads = load_reads(sample)
+	rng = stream_rng(seed, 0, sample_key(chrom_names, chroms, reads))
+	order = np.argsort(reads, kind="stable")
+	counts = np.bincount(reads, minlength=num_reads)
+	first = np.cumsum(counts) - counts
+	random_chr = chroms[order[first + rng.integers(0, counts)]]
+	num_chr = np.bincount(random_chr, minlength=len(chrom_names))
+	ids = chromosomes.lookup(chrom_names)
+	chr_reads = np.zeros(len(chromosomes), dtype=np.int64)
+	chr_reads[ids[ids >= 0]] = num_chr[ids >= 0]
+	return chr_reads
 
-	with open(control_file, "r") as f:
-		x = 0
-		value = 0
-		for line in f:
-			line = line.rstrip()
-			(chr, pos, end, read_id) = line.split("\t")
-			array2.append(pos)
-			end_dict[chr] = x
-			if read_id in last_seen:
-				array1.append(last_seen[read_id])
-				read_idx = id_idx_dict[read_id]
-				array3.append(read_idx)
-				map_dict[read_idx] += 1
-			else:
-				array1.append("-1")
-				first_id_seen.append(read_id)
-				id_idx_dict[read_id] = value
-				read_idx = value
-				value += 1
-				array3.append(read_idx)
-				map_dict[read_idx] = 1
-			last_seen[read_id] = x
-			x = x + 1
-	y = 0
-	for i in range(len(array1)):
-		if array1[i] == "-1":
-			array1[i] = last_seen[first_id_seen[y]]
-			y = y + 1
-		else:
-			pass
-	return end_dict, array1, array2, array3
+# Alignments [first, last) of the control index on a chromosome (by id)
+def control_range(c):
+	return int(chrom_offsets[control_of[c]]), int(chrom_offsets[control_of[c] + 1])
+
+# Control reads that can reach a copy of the selected families: a simulated alignment
+# starts at the control alignment shifted by -read_len/2 to read_len - read_len/2, so a
+# read is kept if any of its alignments can overlap a copy after any shift. The other
+# reads add nothing to the background of these families, and a chromosome is simulated
+# only if one of its control alignments belongs to a kept read (reachable control
+# chromosomes).
+def family_reads():
+	relevant = np.zeros(len(control_map_counts), dtype=bool)
+	for c, te_chr in enumerate(te_by_control_chr):
+		if te_chr is None:
+			continue
+		first = int(chrom_offsets[c])
+		last = int(chrom_offsets[c + 1])
+		lo = np.asarray(control_positions[first:last], dtype=np.int64) - int(read_len/2)
+		near = overlaps_copies(te_chr, lo, lo + 2 * read_len - 1)
+		relevant[control_read_ids[first:last][near]] = True
+	reachable = np.unique(control_aln_chroms[relevant[control_read_ids]])
+	return relevant, reachable.tolist()
 
-def list_construction(times):
-	randnum_list=[]
-	rand_cumprob_list=[]
-	sorted_index_prob=[]
-	sorted_index_pos_list=[]
-	for j in range(times):
-		random = np.random.uniform(cumprob_list[0],cumprob_list[-1])
-		randnum_list.append(random)
-	rand_cumprob_list = list(np.append(cumprob_list, randnum_list))
-	sorted_index_prob = np.argsort(rand_cumprob_list, kind="mergesort")
-	sorted_index_pos_list = [index_pos_list[i] for i in sorted_index_prob]
-	return sorted_index_pos_list
+# family_reads for the low-memory mode, one chromosome at a time: returns whether each
+# read of the multimapper table is kept, the number of reads kept and the reachable
+# control chromosomes (the reads with one alignment are kept by chromosome_block)
+def family_reads_streamed():
+	relevant_multi = np.zeros(len(multi_counts), dtype=bool)
+	num_unique = 0
+	reachable = set()
+	for c, te_chr in enumerate(te_by_control_chr):
+		if te_chr is None:
+			continue
+		first = int(chrom_offsets[c])
+		last = int(chrom_offsets[c + 1])
+		lo = index_rows(control_arrays, "positions", first, last).astype(np.int64) - int(read_len/2)
+		slots = index_rows(control_arrays, "multi_slots", first, last)
+		near = overlaps_copies(te_chr, lo, lo + 2 * read_len - 1)
+		relevant_multi[slots[near & (slots >= 0)]] = True
+		if np.any(near & (slots < 0)):
+			num_unique = num_unique + int(np.sum(near & (slots < 0)))
+			reachable.add(c)
+	relevant_slots = np.flatnonzero(relevant_multi)
+	first = multi_offsets[relevant_slots]
+	owner = np.repeat(np.arange(len(relevant_slots)), multi_counts[relevant_slots])
+	within = np.arange(len(owner)) - np.repeat(np.cumsum(multi_counts[relevant_slots]) - multi_counts[relevant_slots], multi_counts[relevant_slots])
+	reachable.update(np.unique(multi_chroms[first[owner] + within]).tolist())
+	return relevant_multi, num_unique + len(relevant_slots), sorted(reachable)
 
-def rand_pos_selection():
-	random_pos_list=[]
-	for idx, elem in enumerate(sorted_index_pos_list):
-		if (idx+1 < len(sorted_index_pos_list) and idx-1 >= 0):
-			if (elem == -1):
-				next_idx = idx+1
+# Control reads placed and control chromosomes in reach of the indexed copies: every read
+# with all the families, else only the reads that can reach a copy (family_reads).
+# Returns the kept reads (relevant_reads, or relevant_multi in low-memory mode), the
+# number of reads kept and the reachable control chromosomes.
+def reads_in_reach(all_families):
+	if all_families:
+		return None, None, None, reachable_chromosomes(control_arrays, [te_chr is not None for te_chr in te_by_control_chr])
+	if max_memory is not None:
+		relevant_multi, num_relevant, reachable = family_reads_streamed()
+		return None, relevant_multi, num_relevant, reachable
+	relevant_reads, reachable = family_reads()
+	return relevant_reads, None, int(np.sum(relevant_reads)), reachable
 
-				while sorted_index_pos_list[next_idx] == -1:
-					next_idx = next_idx + 1
+# Chromosomes simulated (by id): those of the run with sample reads, control reads and
+# control reads that can reach a TE copy, in run order
+def simulated_chromosomes(reachable):
+	reachable_ids = control_ids[np.array(reachable, dtype=np.int64)]
+	with_copies = np.zeros(len(chromosomes), dtype=bool)
+	with_copies[reachable_ids[reachable_ids >= 0]] = True
+	return with_copies, [c for c in run_order if in_run[c] and chrs_max[c] > 0 and control_alignments[c] > 0 and with_copies[c]]
+
+# Probabilities, control read starts and candidate weights of one chromosome (by id),
+# from the memory-mapped control index
+def mapped_block(c):
+	chromosome = chromosomes.names[c]
+	first, last = control_range(c)
+	position_list, cumprob_list = load_probabilities(prob_path, chromosome)
+	return {"positions": position_list, "cumprob": cumprob_list, "starts": np.array(control_positions[first:last], dtype=np.int64), "cand_cum": candidate_weights(control_map_counts[control_read_ids[first:last]])}
+
+# The same for the low-memory mode (loaded into the block cache), read from the index
+# files, with for each control read the row of its read in the multimapper table, its
+# number of alignments and whether it is kept with --families. The probabilities are
+# loaded if they take at most half of the cache, or else streamed at each draw.
+def chromosome_block(c):
+	chromosome = chromosomes.names[c]
+	first, last = control_range(c)
+	block = {"starts": index_rows(control_arrays, "positions", first, last).astype(np.int64), "slots": index_rows(control_arrays, "multi_slots", first, last)}
+	multi = block["slots"] >= 0
+	block["counts"] = np.ones(last - first, dtype=multi_counts.dtype)
+	block["counts"][multi] = multi_counts[block["slots"][multi]]
+	block["cand_cum"] = candidate_weights(block["counts"])
+	if relevant_multi is not None:
+		te_chr = te_by_control_chr[control_of[c]]
+		block["relevant"] = np.zeros(last - first, dtype=bool)
+		if te_chr is not None:
+			lo = block["starts"] - int(read_len/2)
+			block["relevant"] = overlaps_copies(te_chr, lo, lo + 2 * read_len - 1)
+		block["relevant"][multi] = relevant_multi[block["slots"][multi]]
+	pos_file = prob_path + os.path.sep + chromosome + "_pos.npy"
+	cumprob_file = prob_path + os.path.sep + chromosome + "_cumprob.npy"
+	if not (os.path.isfile(pos_file) and os.path.isfile(cumprob_file)):
+		block["positions"], block["cumprob"] = read_probabilities(prob_path + os.path.sep + chromosome + "_prob.txt")
+	elif (os.path.getsize(pos_file) + os.path.getsize(cumprob_file) <= cache_size / 2):
+		block["positions"], block["cumprob"] = np.load(pos_file), np.load(cumprob_file)
+	else:
+		block["positions"], block["cumprob"] = None, None
+	return block
 
-				next_elem = sorted_index_pos_list[next_idx]
-				random_pos_list.append(next_elem)
-	return random_pos_list
+# Place the simulated reads: for each random position choose a control read starting in
+# [random - read_len, random] (weighted by 1/number of mappings) and shift all of its
+# alignments by the same offset. Returns chromosome, start and read number of every
+# simulated alignment, and the number of alignments of each simulated read.
+def access_mappings(c, random_pos_list, lo_list, hi_list, cand_cum, rng):
+	if np.any(hi_list <= lo_list):
+		sys.exit("[ERROR] An error occurred with the list of reads")
+	selected = choose_candidates(rng, cand_cum, lo_list, hi_list) + control_range(c)[0]
+	reads = control_read_ids[selected].astype(np.int64)
+	shift = (random_pos_list.astype(np.int64) - int(read_len/2)) - control_positions[selected]
+	if relevant_reads is None:
+		alignments, read_index = read_alignments_of(control_read_offsets, control_read_alignments, reads)
+	else:
+		# Only the reads that can reach a selected family are placed
+		placed = np.flatnonzero(relevant_reads[reads])
+		alignments, read_index = read_alignments_of(control_read_offsets, control_read_alignments, reads[placed])
+		read_index = placed[read_index]
+	read_chroms = control_aln_chroms[alignments]
+	read_pos = control_positions[alignments] + shift[read_index]
+	return read_chroms, read_pos, read_index, control_map_counts[reads]
 
-def extract_combine_list():
-	index_rand = []
-	for l in range(len(random_pos_list)):
-		index_rand.append(-1)
-	array_comb = list(np.append(array2_2, random_pos_list))
-	array_index = list(np.append(index_array2_2, index_rand))
-	sorted_comb = np.argsort(array_comb, kind="mergesort")
-	sorted_index = [array_index[m] for m in sorted_comb]
-	return sorted_index
+# access_mappings for the low-memory mode: a read with one alignment is placed at its
+# candidate alignment, the alignments of the others come from the multimapper table (in
+# the order of the control index, so the simulated reads are those of access_mappings)
+def access_mappings_streamed(c, block, random_pos_list, lo_list, hi_list, rng):
+	if np.any(hi_list <= lo_list):
+		sys.exit("[ERROR] An error occurred with the list of reads")
+	selected = choose_candidates(rng, block["cand_cum"], lo_list, hi_list)
+	shift = (random_pos_list.astype(np.int64) - int(read_len/2)) - block["starts"][selected]
+	if relevant_multi is not None:
+		# Only the reads that can reach a selected family are placed
+		placed = np.flatnonzero(block["relevant"][selected])
+	else:
+		placed = np.arange(len(selected))
+	counts = block["counts"][selected[placed]]
+	slots = block["slots"][selected[placed]]
+	owner = np.repeat(np.arange(len(placed)), counts)
+	within = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+	multi = np.flatnonzero(slots[owner] >= 0)
+	alignments = multi_offsets[slots[owner[multi]]] + within[multi]
+	read_chroms = np.full(len(owner), control_of[c], dtype=multi_chroms.dtype)
+	read_chroms[multi] = multi_chroms[alignments]
+	read_pos = block["starts"][selected[placed]][owner]
+	read_pos[multi] = multi_positions[alignments]
+	read_index = placed[owner]
+	return read_chroms, read_pos + shift[read_index], read_index, block["counts"][selected]
 
-def access_mappings(n):
-	ind_rand = 0
-	list_read = []
-	list_read2 = []
-	read_pos = {}
-	read_index = {}
-	for chrom in chromosomes:
-		read_pos[chrom] = []
-		read_index[chrom] = []
-	time_point_a = time.time()
-	for i in sorted_index:
-		if (i != -1):
-			last = i
-			list_read.append(int(last))
+# Simulate the reads of one chromosome for a range of iterations. Each iteration draws
+# from its own random stream, so the counts do not depend on the number of workers.
+# Positions are drawn once for the largest sample; the other samples count a uniform
+# random subset (nested subsets of one random permutation) of the same simulated reads.
+def simulate_unit(task):
+	(chrom_id, iterations) = task
+	chromosome = chromosomes.names[chrom_id]
+	stats = {"sampling": [0.0, 0.0, 0], "access_mappings": [0.0, 0.0, 0], "counting": [0.0, 0.0, 0]}
+	unit_start = phase_start()
+	block = blocks.get(chrom_id) if blocks is not None else mapped_block(chrom_id)
+	times = int(chrs_max[chrom_id])
+	counts = np.zeros((len(iterations), len(samples), len(groups)))
+	for row, iteration in enumerate(iterations):
+		rng = stream_rng(seed, 1, chrom_id, iteration)
+		point_0 = phase_start()
+		if block["positions"] is None:
+			random_pos_list = draw_positions_streamed(rng, prob_path + os.path.sep + chromosome + "_pos.npy", prob_path + os.path.sep + chromosome + "_cumprob.npy", times, PROB_CHUNK)
+		else:
+			random_pos_list = draw_positions(rng, block["positions"], block["cumprob"], times, 1)[0]
+		lo_list, hi_list = candidate_ranges(block["starts"], random_pos_list, read_len)
+		point_1 = phase_start()
+		if blocks is not None:
+			read_chroms, read_pos, read_index, times_array = access_mappings_streamed(chrom_id, block, random_pos_list, lo_list, hi_list, rng)
 		else:
-			random = random_pos_list[ind_rand]
-			adj_random = random - int(read_len/2)
+			read_chroms, read_pos, read_index, times_array = access_mappings(chrom_id, random_pos_list, lo_list, hi_list, block["cand_cum"], rng)
+		point_2 = phase_start()
+		if (len(samples) > 1):
+			read_rank = rng.permutation(times)
+		read_weights = 1 / (times_array[read_index] * read_len)
+		order = np.argsort(read_chroms, kind="stable")
+		bounds = np.searchsorted(read_chroms[order], np.arange(len(control_chromosomes) + 1))
+		for c in range(len(control_chromosomes)):
+			if (te_by_control_chr[c] is None or bounds[c] == bounds[c + 1]):
+				continue
+			chr_reads = order[bounds[c]:bounds[c + 1]]
+			read_starts = read_pos[chr_reads]
+			for s in range(len(samples)):
+				if (sample_reads[s, chrom_id] < times):
+					keep = chr_reads[read_rank[read_index[chr_reads]] < sample_reads[s, chrom_id]]
+					counts[row, s] += family_overlaps(te_by_control_chr[c], read_pos[keep], read_pos[keep] + read_len - 1, read_weights[keep], len(groups))
+				else:
+					counts[row, s] += family_overlaps(te_by_control_chr[c], read_starts, read_starts + read_len - 1, read_weights[chr_reads], len(groups))
+		point_3 = phase_start()
+		# Items: positions drawn, candidate control reads scanned, alignments counted
+		for phase, begin, end, items in (("sampling", point_0, point_1, times), ("access_mappings", point_1, point_2, int(np.sum(hi_list - lo_list))), ("counting", point_2, point_3, len(read_pos))):
+			stats[phase][0] += end[0] - begin[0]
+			stats[phase][1] += end[1] - begin[1]
+			stats[phase][2] += items
+	# One record per phase, laid end to end from the start of the unit in the trace
+	records = []
+	offset = unit_start[0]
+	for phase, (wall, cpu, items) in stats.items():
+		record = phase_record(phase, unit_start, items, chromosome, iterations=len(iterations))
+		record.update(start=offset, wall=wall, cpu=cpu)
+		records.append(record)
+		offset = offset + wall
+	return chrom_id, iterations, counts, records
+
+# Simulation unit run through the metrics (profiled with --profile)
+def run_unit(task):
+	return metrics.call(simulate_unit, task)
+
+# Units of work: one chromosome (by id) and a range of iterations (within [first, last)),
+# the most costly chromosomes first
+def make_tasks(first_iter, last_iter):
+	if (workers > 1):
+		chunk = max(1, (last_iter - first_iter) // (workers * 4))
+	else:
+		chunk = last_iter - first_iter
+	tasks = []
+	for c in simulated:
+		for first in range(first_iter, last_iter, chunk):
+			tasks.append((c, range(first, min(first + chunk, last_iter))))
+	return tasks
 
-			ind_rand = ind_rand + 1
-			for j in list_read:
-				if int(array2_2[j]) >= int(random-read_len):
-					list_read2.append(int(j))
-				j += 1
-			list_read = list_read2
-			list_read2 = []
+# Observed counts of the families in the background output (control counts), per sample
+def read_signals():
+	monitored = []
+	for signal in signals:
+		observed = {}
+		with open(signal, "r") as f:
+			for line in f:
+				(repeat, counts) = line.rstrip("\n").split("\t")
+				observed[repeat] = float(counts)
+		fams = [groups[repeat] for repeat in control_families if repeat in observed and repeat in groups]
+		values = [observed[repeat] for repeat in control_families if repeat in observed and repeat in groups]
+		monitored.append((np.array(fams, dtype=np.int64), np.array(values)))
+	return monitored
+
+# Number of families still undecided after 'done' iterations (sequential p-values), over
+# all samples, and the families (one boolean per family number) undecided in a sample
+def undecided_families(done):
+	undecided = 0
+	needed = np.zeros(len(groups), dtype=bool)
+	for s, (fams, observed) in enumerate(monitored):
+		qt, effective, decided = sequential_counts(background_matrix[:done, s][:, fams], observed, stop_k)
+		undecided = undecided + int(np.sum(~decided))
+		needed[fams[~decided]] = True
+	return undecided, needed
 
-			if (len(list_read) == 1):
-				selected = list_read[0]
-			
-			elif (len(list_read) > 1):
-				total_conf = 0
-				read_probs = []
-				read_conf = []
-				for elem in list_read:
-					idx = int(elem) + int(start_dict[chromosome])
-					read_idx = array3[idx]
-					read_map = map_dict[read_idx]
-					inv_map = 1/read_map
-					read_conf.append(inv_map) 
-					total_conf = total_conf + inv_map
-				for conf in read_conf:
-					read_probs.append(conf/total_conf)
-				selected = np.random.choice(list_read, 1, p=read_probs)
-				selected = selected[0]
-			else:
-				sys.exit("[ERROR] An error occurred with the list of reads")
+## Iterations of the first round with --signal (then doubled at each round)
+ROUND_SIZE = 100
 
-			index = int(selected) + int(start_dict[chromosome])
-			index2 = int(index)
-			actual_read_pos = int(array2[index])
-			diff = int(actual_read_pos) - int(adj_random)
-			shift = -1 * diff
-			adj_read_pos = actual_read_pos + shift
-			x = 0
-			while True:
-				index = int(array1[index])
-				for c in start_dict:
-					if (index >= start_dict[c]) and (index <= end_dict[c]):
-						actual_read_pos = int(array2[index])
-						adj_read_pos = actual_read_pos + shift
-						x = x + 1
-						end_pos = int(adj_read_pos) + read_len - 1
-						read_pos[c].append(int(adj_read_pos))
-						read_pos[c].append(int(end_pos))
-						read_index[c].append(n * (-1))
-						read_index[c].append(n)
-				if index == index2:
-					break
-			times_dict[n] = x
-			n = n + 1
-	return read_pos, read_index
+## Rows of the probability files read at once when they are streamed (low-memory mode)
+PROB_CHUNK = 1 << 20
 
 ## Main code
 start_time = time.time()
 print("T3E is running...")
+print(f'[SEED] Random seed: {seed}')
 
-## Global variables
-if (species == "hg19" or species == "hg38"):
-	chromosomes = ["chr1", "chr2", "chr3", "chr4", "chr5", "chr6", "chr7", "chr8", "chr9", "chr10", "chr11", "chr12", "chr13", "chr14", "chr15", "chr16", "chr17", "chr18", "chr19", "chr20", "chr21", "chr22", "chrX", "chrY"]
-elif (species == "mm10"):
-	chromosomes = ["chr1", "chr2", "chr3", "chr4", "chr5", "chr6", "chr7", "chr8", "chr9", "chr10", "chr11", "chr12", "chr13", "chr14", "chr15", "chr16", "chr17", "chr18", "chr19", "chrX", "chrY"]
+## Control index and chromosome registry: the chromosomes of --genome (else of
+## references/<species>.genome, else of the control) numbered in natural order. The
+## random streams are keyed by these ids, so shards draw as a single run would.
+phase = metrics.start()
+control_chromosomes, control_arrays = load_control_index(control, read_len, control_index)
+chrom_offsets = np.array(control_arrays["chrom_offsets"])
+control_positions = control_arrays["positions"]
+control_aln_chroms = control_arrays["aln_chroms"]
+control_read_ids = control_arrays["read_ids"]
+control_map_counts = control_arrays["map_counts"]
+control_read_offsets = control_arrays["read_offsets"]
+control_read_alignments = control_arrays["read_alignments"]
+## Low-memory mode: the multimapper table is loaded, the rest of the index is read one
+## chromosome at a time into a cache of max_memory bytes (per worker process)
+if max_memory is not None:
+	multi_offsets = np.array(control_arrays["multi_offsets"])
+	multi_counts = np.diff(multi_offsets).astype(np.int32)
+	multi_chroms = np.array(control_arrays["multi_chroms"])
+	multi_positions = np.array(control_arrays["multi_positions"])
+	cache_size = max_memory // workers
+	table_size = multi_offsets.nbytes + multi_counts.nbytes + multi_chroms.nbytes + multi_positions.nbytes
+	print(f'[MEMORY] Multimapper table of {len(multi_counts)} reads: {table_size / 2 ** 20:.1f} MB, chromosome cache of {cache_size / 2 ** 20:.1f} MB per worker')
+chromosomes = load_chromosomes(args.genome, species, control_chromosomes)
+control_ids = chromosomes.lookup(control_chromosomes)
+control_of = np.full(len(chromosomes), -1, dtype=np.int64)
+control_of[control_ids[control_ids >= 0]] = np.flatnonzero(control_ids >= 0)
+control_alignments = np.zeros(len(chromosomes), dtype=np.int64)
+control_alignments[control_ids[control_ids >= 0]] = np.diff(chrom_offsets)[control_ids >= 0]
+metrics.stop("control_index", phase, len(control_positions))
+## Chromosomes of this run (a shard with --chromosomes)
+if args.chromosomes:
+	shard_chromosomes = args.chromosomes.split(",")
+	unknown = [chromosome for chromosome in shard_chromosomes if chromosome not in chromosomes.ids]
+	if unknown:
+		sys.exit(f'[ERROR] Unknown chromosome(s): {",".join(unknown)}')
 else:
-	sys.exit("[ERROR] Species not defined correctly!")
-start_dict={}
-map_dict = {}
-times_dict = {}
-group_iter = {}
-count_in_index = {}
-group_start_chr = {}
-group_end_chr = {}
-group_pos = []
-groups = {}
-group_index = []
-chrs_dict={}
-chrs_dict = create_chr_dict(sample)
-time_point_a = time.time()
-print(f'[SAMPLE] Define the number of reads to shuffle for each chromosome: {time_point_a - start_time:.2f}s')
-end_dict, array1, array2, array3 = read_control_file(control)
-for elem in end_dict:
-	if not start_dict:
-		start_dict[elem] = 0
-	else:
-		start_dict[elem] = end_dict[last_chr] + 1
-	last_chr = elem
-time_point_b = time.time()
-print(f'[CONTROL] Allocate matrix in the memory: {time_point_b - time_point_a:.2f}s')
-time_point_1 = time.time()
-with open(repeats, "r") as f:
-	group_count = 1
-	i = 0
-	e = 0
-	for line in f:
-		line = line.replace("\n", "")
-		(te_chr, te_start, te_end, repeat) = line.split("\t")
-		if (te_chr not in group_start_chr):
-			group_start_chr[te_chr] = i
-			e = i + 1
-		group_end_chr[te_chr] = e
-		i = i + 2
-		e = e + 2
-		group_pos.append(int(te_start))
-		group_pos.append(int(te_end))
-		if (repeat not in groups):
-			groups[repeat] = group_count
-			group_index.append(group_count * (-1))
-			group_index.append(group_count)
-			group_count = group_count + 1
-		else:
-			group_index.append(groups[repeat] * (-1))
-			group_index.append(groups[repeat])
-time_point_2 = time.time()
-print(f'[REPEATS] Read Repeat annotation: {time_point_2 - time_point_1:.2f}s')
-for group in groups.values():
-	count_in_index[group] = 0
-for group in groups.keys():
-	group_iter[group] = np.zeros(num_iter)
-for chromosome in chromosomes:
-	position_list = []
-	cumprob_list = []
-	index_list=[]
-	index_pos_list=[]
-	array2_2 = []
-	index_array2_2 = []
-	random_pos_list=[]
-	sorted_index_pos_list=[]
-	open_group = {}
-	open_read = {}
-	read_group_pos = {}
-	read_group_index = {}
-	sorted_read_group = {}
-	sorted_read_group_pos = {}
-	sorted_read_group_index = {}
-	sorted_index = []
-	read_pos = {}
-	read_index = {}
-	time_point_a = time.time()
-	prob_file = prob_path + os.path.sep + chromosome + "_prob.txt"
-	with open(prob_file, "r") as infile:
-		for line in infile:
-			line = line.rstrip()
-			(pos, value) = line.split("\t")
-			position_list.append(int(pos))
-			cumprob_list.append(float(value))
-
-	for t in range(chrs_dict[chromosome]):
-		index_list.append(-1)
-	index_pos_list = list(np.append(position_list, index_list))
-	for l in array2[start_dict[chromosome]:end_dict[chromosome]+1]:
-		array2_2.append(int(l))
-	for l in range(len(array2_2)):
-		index_array2_2.append(l)
-	time_point_b = time.time()
-	print(f'[PROBABILITY] Read probabilities: {time_point_b - time_point_a:.2f}s')
-	for iteration in range(num_iter):
-		time_sorted_index_pos_list_start = time.time()
-		sorted_index_pos_list = list_construction(chrs_dict[chromosome])
-		random_pos_list = rand_pos_selection()
-		sorted_index = extract_combine_list()
-		time_extract_combine_list_end = time.time()
-		print(f'[RANDOM POSITIONS] Sample random positions: {time_extract_combine_list_end - time_sorted_index_pos_list_start:.2f}s')
-		time_access_mappings_start = time.time()
-		read_pos, read_index = access_mappings(group_count)
-		time_access_mappings_end = time.time()
-		print(f'[ACCESS MAPPINGS] Access mappings: {time_access_mappings_end - time_access_mappings_start:.2f}s')
-		time_1 = time.time()
-		for chromosome2 in chromosomes:
-			read_group_pos[chromosome2] = []
-			read_group_index[chromosome2] = []
-			sorted_read_group[chromosome2] = []
-			sorted_read_group_pos[chromosome2] = []
-			sorted_read_group_index[chromosome2] = []
-			read_group_pos[chromosome2] = list(np.append(read_pos[chromosome2], group_pos[group_start_chr[chromosome2]:group_end_chr[chromosome2]+1]))
-			read_group_index[chromosome2] = list(np.append(read_index[chromosome2], group_index[group_start_chr[chromosome2]:group_end_chr[chromosome2]+1]))
-			pos_index_comb = np.array(list(zip(read_group_pos[chromosome2], read_group_index[chromosome2])), dtype=[('coord', 'int32'), ('openclose', 'int32')])
-			sorted_read_group[chromosome2] = np.argsort(pos_index_comb, order=['coord', 'openclose'])
-			sorted_read_group_pos[chromosome2] = [read_group_pos[chromosome2][i] for i in sorted_read_group[chromosome2]]
-			sorted_read_group_index[chromosome2] = [read_group_index[chromosome2][i] for i in sorted_read_group[chromosome2]]
-			read_group_pos[chromosome2] = []
-			read_group_index[chromosome2] = []
-			sorted_read_group[chromosome2] = []
-			for idx, elem in enumerate(sorted_read_group_index[chromosome2]):
-				if (elem < 0):
-					elem = abs(elem)
-					if elem >= group_count:
-						open_read.setdefault(elem, []).append(sorted_read_group_pos[chromosome2][idx])
-					else:
-						open_group.setdefault(elem, []).append(sorted_read_group_pos[chromosome2][idx])
-				elif (elem > 0):
-					elem = abs(elem)
-					if (elem >= group_count):
-						read_start = int(open_read[elem][0])
-						read_end = sorted_read_group_pos[chromosome2][idx]
-						for group in open_group.keys():
-							for k_g in range(len(open_group[group])):
-								group_start = int(open_group[group][k_g])
-								if (open_group[group][k_g] >= read_start):	
-									count_in_index[group] = count_in_index[group] + (read_end - group_start + 1) / (times_dict[elem] * read_len)
-								elif (open_group[group][k_g] < read_start):
-									count_in_index[group] = count_in_index[group] + (read_end - read_start + 1) / (times_dict[elem] * read_len)
+	shard_chromosomes = chromosomes.names
+shard_ids = chromosomes.lookup(shard_chromosomes)
+phase = metrics.start()
+sample_reads = np.array([sample_chr_reads(sample) for sample in samples])
+chrs_max = sample_reads.max(axis=0)
+metrics.stop("sample_reads", phase, int(sample_reads.sum()), samples=len(samples))
+phase = metrics.start()
+selected_families = read_families(args.families) if args.families else None
+groups, te_index = read_te_index(repeats, selected_families)
+if selected_families is not None:
+	unknown = sorted(selected_families - set(groups))
+	if unknown:
+		sys.exit(f'[ERROR] Families not in {repeats}: {",".join(unknown)}')
+te_by_control_chr = [te_index.get(c) if c in chromosomes.ids else None for c in control_chromosomes]
+metrics.stop("repeats", phase, sum(len(te_chr[0]) for te_chr in te_index.values()))
+## With --families, only the control reads that can reach a copy of the selected
+## families are placed (the others add nothing to their background); the random
+## streams stay those of a full run
+phase = metrics.start()
+relevant_reads, relevant_multi, num_relevant, reachable = reads_in_reach(selected_families is None)
+if selected_families is not None:
+	metrics.stop("families", phase, num_relevant, families=len(groups))
+	print(f'[FAMILIES] {len(groups)} families, {sum(len(te_chr[0]) for te_chr in te_index.values())} copies, {num_relevant} control reads')
+## Chromosomes simulated: those of the run with sample reads, control reads and control
+## reads that can reach a TE copy, the most costly first (results are added in this
+## order, also by shards.py merge)
+in_run = np.zeros(len(chromosomes), dtype=bool)
+in_run[shard_ids] = True
+for c in np.flatnonzero(in_run & (chrs_max > 0) & (control_alignments == 0)):
+	print(f'[WARNING] {chrs_max[c]} sample reads in {chromosomes.names[c]} but no control reads, not simulated')
+run_order = cost_order(chromosome_costs(control_alignments, chrs_max))
+with_copies, simulated = simulated_chromosomes(reachable)
+print(f'[CHROMOSOMES] {len(simulated)} of {len(shard_ids)} chromosomes simulated ({int(np.sum(in_run & (chrs_max == 0)))} without sample reads, {int(np.sum(in_run & (chrs_max > 0) & (control_alignments > 0) & ~with_copies))} without TE copies in reach)')
+blocks = BlockCache(chromosome_block, cache_size) if max_memory is not None else None
+if args.chromosomes:
+	shard_matrix = np.zeros((len(shard_chromosomes), num_iter, len(samples), len(groups)))
+else:
+	background_matrix = np.zeros((num_iter, len(samples), len(groups)))
 
-						if (len(open_read[elem]) > 1):
-							open_read[elem].pop(0)
-						elif (len(open_read[elem]) == 1):
-							open_read.pop(elem)
+control_families = []
+with open(control_counts, "r") as f:
+	for line in f:
+		control_families.append(line.replace("\n", "").split("\t")[0])
+control_families = [family for family in control_families if family in groups]
 
-					elif (elem < group_count):
-						group_start = int(open_group[elem][0])
-						group_end = (sorted_read_group_pos[chromosome2][idx])
-						for read in open_read.keys():
-							for k_r in range(len(open_read[read])):
-								read_start = int(open_read[read][k_r])
-								if(open_group[elem][0] >= read_start):
-									count_in_index[elem] = count_in_index[elem] +  (group_end - group_start + 1) / (times_dict[read] * read_len)
-								elif(open_group[elem][0] < read_start):
-									count_in_index[elem] = count_in_index[elem] + (group_end - read_start + 1) / (times_dict[read] * read_len)
-						if (len(open_group[elem]) > 1):
-							open_group[elem].pop(0)
-						elif (len(open_group[elem]) == 1):
-							open_group.pop(elem)
-		time_2 = time.time()
-		print(f'[COUNT] Count for {chromosome} - iter {iteration + 1}: {time_2 - time_1:.2f}s')
-		for g_name, g_index in groups.items():
-			for g_code in count_in_index:
-				if (g_code == g_index):
-					group_iter[g_name][iteration] = group_iter[g_name][iteration] + count_in_index[g_code]
-					count_in_index[g_code] = 0
-	for iteration in range(num_iter):
-		with open(background, "a") as backg, open(control_counts, "r") as f:
-			for line in f:
-				line = line.replace("\n", "")
-				(control_group_name, control_count) = line.split("\t")
-				if (chromosome == "chrY"):
-					print(f'iter{iteration + 1}\t{control_group_name}\t{group_iter[control_group_name][iteration]}', file=backg)
+## Simulations: the read-only structures above are shared with the worker processes
+## (fork + memory mapping); results are added in task order, whatever the number of workers.
+## With --signal the iterations run in rounds of growing size, and the simulations stop
+## once every family is decided; each iteration has its own random stream, so the
+## backgrounds do not depend on the rounds. After a round, the next rounds only index
+## the copies of the undecided families and place the control reads that can reach
+## them (as with --families): the decided families are not simulated any more, and
+## their counts in the later iterations are NaN.
+if (signals is not None):
+	monitored = read_signals()
+	stop_k = stop_exceedances(alpha, num_iter, exceedances)
+	first_round = min(num_iter, ROUND_SIZE)
+else:
+	first_round = num_iter
+counted = np.ones(len(groups), dtype=bool)
+pool = None
+phase = metrics.start()
+done = 0
+last = first_round
+while (done < num_iter):
+	if (workers > 1 and pool is None):
+		pool = multiprocessing.get_context("fork").Pool(workers)
+	run_units = pool.imap if pool is not None else map
+	for (c, iterations, counts, unit_records) in run_units(run_unit, make_tasks(done, last)):
+		if args.chromosomes:
+			shard_matrix[shard_chromosomes.index(chromosomes.names[c]), iterations.start:iterations.stop] += counts
+		else:
+			background_matrix[iterations.start:iterations.stop] += counts
+		metrics.add(unit_records)
+	if not np.all(counted):
+		background_matrix[done:last, :, ~counted] = np.nan
+	done = last
+	last = min(num_iter, 2 * done)
+	if (signals is not None):
+		undecided, needed = undecided_families(done)
+		print(f'[SEQUENTIAL] {done} iterations: {undecided} undecided families (stop at {stop_k} exceedances)')
+		if (undecided == 0):
+			break
+		if (done < num_iter and np.any(counted & ~needed)):
+			# Workers are forked again to see the index of the undecided families
+			counted = counted & needed
+			te_subset = family_subset(te_index, counted)
+			te_by_control_chr = [te_subset.get(c) if c in chromosomes.ids else None for c in control_chromosomes]
+			relevant_reads, relevant_multi, num_relevant, reachable = reads_in_reach(False)
+			with_copies, simulated = simulated_chromosomes(reachable)
+			blocks = BlockCache(chromosome_block, cache_size) if max_memory is not None else None
+			if pool is not None:
+				pool.close()
+				pool.join()
+				pool = None
+			print(f'[SEQUENTIAL] Next rounds: {int(np.sum(counted))} families, {len(simulated)} chromosomes, {num_relevant} control reads')
+if pool is not None:
+	pool.close()
+	pool.join()
+metrics.stop("simulations", phase, done, workers=workers)
+## Background of each sample: iterations x families (control counts order) matrix, or
+## one such matrix per chromosome for a shard
+phase = metrics.start()
+control_fams = np.array([groups[control_group_name] for control_group_name in control_families], dtype=np.int64)
+for s, background in enumerate(backgrounds):
+	if args.chromosomes:
+		save_shard(shard_file(background, shard_chromosomes), shard_matrix[:, :done, s][:, :, control_fams], shard_chromosomes, [chromosomes.names[c] for c in run_order], control_families, seed)
+	else:
+		write_background(background, background_matrix[:done, s][:, control_fams], control_families, args.text)
+metrics.stop("aggregation", phase, done * len(control_families) * len(backgrounds))
+metrics.report()
 end_time = time.time()
 print(end_time - start_time, " second(s)")
@@ -0,0 +1,74 @@
+###########################################################################
+# Python (v3.8.5) script test_enrichment.py (v1.0) to test enrichment.py
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import os
+import sys
+import subprocess
+import numpy as np
+import pytest
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS)
+from background import write_background
+
+## Set parameters
+num_iter = 400
+num_simulated = 100
+
+## Define functions
+# Background of t3e.py --signal: TE1 (count 5) was decided after 100 iterations, with
+# its 10 exceedances in iterations 91-100, and its later iterations are NaN; TE2 (count
+# 5) was simulated in all iterations and never exceeded
+def sequential_background(tmp_path):
+	matrix = np.full((num_iter, 2), np.nan)
+	matrix[:num_simulated, 0] = 4
+	matrix[num_simulated - 10:num_simulated, 0] = 6
+	matrix[:, 1] = 2
+	background = str(tmp_path / "sample_background")
+	write_background(background, matrix, ["TE1", "TE2"], text=True)
+	signal = str(tmp_path / "sample_counts.txt")
+	with open(signal, "w") as s:
+		s.write("TE1\t5\nTE2\t5\n")
+	return background, signal
+
+# Rows (family -> pvalue, mean, iterations) of the combined table of enrichment.py
+def run_enrichment(tmp_path, background, signal, options):
+	combined = str(tmp_path / "combined.txt")
+	subprocess.run([sys.executable, os.path.join(SCRIPTS, "enrichment.py"), "--background", background, "--signal", signal, "--alpha", "0.05", "--enrichment", "1.0", "--combined", combined, "--outputfolder", str(tmp_path), "--outputprefix", "sample"] + options, check=True, stdout=subprocess.DEVNULL)
+	rows = {}
+	with open(combined, "r") as c:
+		header = c.readline().rstrip("\n").split("\t")
+		for line in c:
+			row = dict(zip(header, line.rstrip("\n").split("\t")))
+			rows[row["family"]] = (float(row["pvalue"]), float(row["mean"]), int(row["iterations"]))
+	return rows
+
+# Decided families are tested over their simulated iterations, with and without
+# --exceedances, from the binary and the text background
+@pytest.mark.parametrize("extension", [".npz", ".txt"])
+@pytest.mark.parametrize("options", [[], ["--exceedances", "10"]])
+def test_sequential_background(tmp_path, extension, options):
+	background, signal = sequential_background(tmp_path)
+	rows = run_enrichment(tmp_path, background + extension, signal, options)
+	assert rows["TE1"] == (pytest.approx(0.1), pytest.approx(4.2), num_simulated)
+	assert rows["TE2"] == (0.0, 2.0, num_iter)
+
+# Background of t3e.py --signal with every family decided in the first round: fewer
+# iterations than --iter and no NaN, the p-values and means use the iterations run
+@pytest.mark.parametrize("options", [[], ["--exceedances", "10"]])
+def test_stopped_background(tmp_path, options):
+	background, signal = sequential_background(tmp_path)
+	matrix = np.zeros((num_simulated, 2))
+	matrix[:, 0] = 4
+	matrix[num_simulated - 10:, 0] = 6
+	matrix[:, 1] = 6
+	write_background(background, matrix, ["TE1", "TE2"])
+	rows = run_enrichment(tmp_path, background + ".npz", signal, ["--iter", "10000"] + options)
+	assert rows["TE1"] == (pytest.approx(0.1), pytest.approx(4.2), num_simulated)
+	assert rows["TE2"][:2] == (1.0, 6.0)
@@ -0,0 +1,83 @@
+###########################################################################
+# Python (v3.8.5) script test_ingest.py (v1.0) to test ingest.py
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import os
+import sys
+import gzip
+import struct
+import subprocess
+import numpy as np
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS)
+from readtable import open_read_table
+
+## Define functions
+# BAM record of a mapped read (no CIGAR operations beyond one match, empty sequence bytes)
+def bam_record(ref_id, pos, name, l_seq):
+	read_name = name.encode() + b"\0"
+	body = struct.pack('<iiBBHHHiiii', ref_id, pos, len(read_name), 255, 0, 1, 0, l_seq, -1, -1, 0)
+	body = body + read_name + struct.pack('<I', l_seq << 4) + bytes((l_seq + 1) // 2) + bytes([30]) * l_seq
+	return struct.pack('<i', len(body)) + body
+
+# Uncompressed BAM header with the given references
+def bam_header(references):
+	text = b"@HD\tVN:1.6\n"
+	header = b"BAM\1" + struct.pack('<i', len(text)) + text + struct.pack('<i', len(references))
+	for reference in references:
+		name = reference.encode() + b"\0"
+		header = header + struct.pack('<i', len(name)) + name + struct.pack('<i', 10 ** 8)
+	return header
+
+# Records of 100 bytes, which do not divide the 4 MiB chunks of ingest.py: a partial
+# record of 4 bytes is left at the end of the first chunk
+def test_records_across_chunks(tmp_path):
+	num_reads = 60000
+	records = [bam_record(r % 2, 1000 + r, f'r{r:07d}', 34) for r in range(num_reads)]
+	assert len(records[0]) == 100
+	bam = str(tmp_path / "reads.bam")
+	with gzip.open(bam, "wb") as f:
+		f.write(bam_header(["chr1", "chr2"]) + b"".join(records))
+	output = str(tmp_path / "reads.reads")
+	subprocess.run([sys.executable, os.path.join(SCRIPTS, "ingest.py"), "--input", bam, "--output", output], check=True, stdout=subprocess.DEVNULL)
+	chrom_names, columns, info = open_read_table(output)
+	assert info["num_reads"] == num_reads
+	assert info["num_alignments"] == num_reads
+	assert chrom_names == ["chr1", "chr2"]
+	assert np.array_equal(np.bincount(columns["chroms"]), [num_reads // 2, num_reads // 2])
+
+# Read ids of a BAM file spilled in many runs (read names and chromosome buckets) are
+# those of the same file interned in memory: dense, in order of first appearance
+def test_spilled_read_names(tmp_path):
+	rng = np.random.default_rng(5)
+	num_records = 20000
+	names = rng.integers(0, 6000, num_records)
+	records = [bam_record(int(rng.integers(0, 3)), int(rng.integers(0, 10 ** 6)), f'r{name}', 34) for name in names]
+	bam = str(tmp_path / "reads.bam")
+	with gzip.open(bam, "wb") as f:
+		f.write(bam_header(["chr1", "chr2", "chr3"]) + b"".join(records))
+	tables = []
+	for buffer in ["1000", "50000000"]:
+		output = str(tmp_path / f'reads_{buffer}.reads')
+		subprocess.run([sys.executable, os.path.join(SCRIPTS, "ingest.py"), "--input", bam, "--output", output, "--buffer", buffer], check=True, stdout=subprocess.DEVNULL)
+		tables.append(open_read_table(output))
+	(chrom_names, columns, info) = tables[0]
+	assert info == tables[1][2]
+	assert info["num_reads"] == len(np.unique(names))
+	for name in columns:
+		assert np.array_equal(columns[name], tables[1][1][name])
+	# Rows sorted by chromosome and start (ties in record order), reads numbered by first
+	# appearance
+	chroms = np.array([struct.unpack_from('<i', record, 4)[0] for record in records])
+	starts = np.array([struct.unpack_from('<i', record, 8)[0] for record in records])
+	order = np.lexsort((starts, chroms))
+	first_seen = np.sort(np.unique(names, return_index=True)[1])
+	expected = np.empty(names.max() + 1, dtype=np.int64)
+	expected[names[first_seen]] = np.arange(len(first_seen))
+	assert np.array_equal(columns["reads"], expected[names][order])
@@ -0,0 +1,147 @@
+###########################################################################
+# Python (v3.8.5) script test_overlap.py (v1.0) to test overlap.py
+# Last update: 2026_10_18
+# Author: Michelle Almeida da Paz
+###########################################################################
+
+#!/usr/bin/env python
+
+## Import libraries
+import os
+import sys
+import numpy as np
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS)
+from overlap import read_te_index, family_overlaps
+
+## Set parameters
+read_len = 50
+chromosomes = ["chr1", "chr2", "chr3"]
+
+## Define functions
+# Original counting of t3e.py (v1.0): sweep over the sorted TE and read boundaries of one
+# chromosome, with the open copies of each family (group ids from 1) and the open
+# alignments of each read (ids from group_count)
+def original_overlaps(read_pos, read_index, group_pos, group_index, group_count, times_dict, count_in_index):
+	open_group = {}
+	open_read = {}
+	read_group_pos = list(np.append(read_pos, group_pos))
+	read_group_index = list(np.append(read_index, group_index))
+	pos_index_comb = np.array(list(zip(read_group_pos, read_group_index)), dtype=[('coord', 'int32'), ('openclose', 'int32')])
+	sorted_read_group = np.argsort(pos_index_comb, order=['coord', 'openclose'])
+	sorted_read_group_pos = [read_group_pos[i] for i in sorted_read_group]
+	sorted_read_group_index = [read_group_index[i] for i in sorted_read_group]
+	for idx, elem in enumerate(sorted_read_group_index):
+		if (elem < 0):
+			elem = abs(elem)
+			if elem >= group_count:
+				open_read.setdefault(elem, []).append(sorted_read_group_pos[idx])
+			else:
+				open_group.setdefault(elem, []).append(sorted_read_group_pos[idx])
+		elif (elem > 0):
+			elem = abs(elem)
+			if (elem >= group_count):
+				read_start = int(open_read[elem][0])
+				read_end = sorted_read_group_pos[idx]
+				for group in open_group.keys():
+					for k_g in range(len(open_group[group])):
+						group_start = int(open_group[group][k_g])
+						if (open_group[group][k_g] >= read_start):
+							count_in_index[group] = count_in_index[group] + (read_end - group_start + 1) / (times_dict[elem] * read_len)
+						elif (open_group[group][k_g] < read_start):
+							count_in_index[group] = count_in_index[group] + (read_end - read_start + 1) / (times_dict[elem] * read_len)
+				if (len(open_read[elem]) > 1):
+					open_read[elem].pop(0)
+				elif (len(open_read[elem]) == 1):
+					open_read.pop(elem)
+			elif (elem < group_count):
+				group_start = int(open_group[elem][0])
+				group_end = sorted_read_group_pos[idx]
+				for read in open_read.keys():
+					for k_r in range(len(open_read[read])):
+						read_start = int(open_read[read][k_r])
+						if (open_group[elem][0] >= read_start):
+							count_in_index[elem] = count_in_index[elem] + (group_end - group_start + 1) / (times_dict[read] * read_len)
+						elif (open_group[elem][0] < read_start):
+							count_in_index[elem] = count_in_index[elem] + (group_end - read_start + 1) / (times_dict[read] * read_len)
+				if (len(open_group[elem]) > 1):
+					open_group[elem].pop(0)
+				elif (len(open_group[elem]) == 1):
+					open_group.pop(elem)
+
+# Random TE annotation: scattered copies, plus copies nested in a copy of the same family
+# and copies adjacent to (or touching) a copy of the same family
+def random_annotation(rng, num_copies, num_families, span):
+	copies = []
+	for chrom in chromosomes:
+		for i in range(num_copies):
+			family = f'TE{rng.integers(num_families)}'
+			start = int(rng.integers(0, span))
+			end = start + int(rng.integers(1, 400))
+			copies.append((chrom, start, end, family))
+			shape = rng.random()
+			if (shape < 0.2):
+				inner = start + int(rng.integers(0, end - start))
+				copies.append((chrom, inner, inner + int(rng.integers(0, end - inner + 1)), family))
+			elif (shape < 0.3):
+				copies.append((chrom, end + 1, end + 1 + int(rng.integers(1, 200)), family))
+			elif (shape < 0.4):
+				copies.append((chrom, end, end + int(rng.integers(1, 200)), family))
+	return copies
+
+def check_equivalence(tmp_path, seed, num_reads, num_copies, num_families, span):
+	rng = np.random.default_rng(seed)
+	copies = random_annotation(rng, num_copies, num_families, span)
+	repeats = str(tmp_path / f'repeats{seed}.bed')
+	with open(repeats, "w") as f:
+		for copy in copies:
+			f.write("\t".join(map(str, copy)) + "\n")
+	families, te_index = read_te_index(repeats)
+	# Group ids of the original code: families from 1, copies as -id (start) and id (end)
+	groups = {family: f + 1 for family, f in families.items()}
+	group_count = len(groups) + 1
+	group_pos = {chrom: [] for chrom in chromosomes}
+	group_index = {chrom: [] for chrom in chromosomes}
+	for (chrom, start, end, family) in copies:
+		group_pos[chrom] += [start, end]
+		group_index[chrom] += [-groups[family], groups[family]]
+	# Reads with one to four alignments (ids from group_count in the original code)
+	times = rng.choice([1, 1, 1, 2, 3, 4], num_reads)
+	read_pos = {chrom: [] for chrom in chromosomes}
+	read_index = {chrom: [] for chrom in chromosomes}
+	read_ids = {chrom: [] for chrom in chromosomes}
+	for r in range(num_reads):
+		for a in range(times[r]):
+			chrom = chromosomes[rng.integers(len(chromosomes))]
+			start = int(rng.integers(0, span + 400))
+			read_pos[chrom] += [start, start + read_len - 1]
+			read_index[chrom] += [-(group_count + r), group_count + r]
+			read_ids[chrom].append(r)
+	times_dict = {group_count + r: int(times[r]) for r in range(num_reads)}
+	count_in_index = {g: 0 for g in groups.values()}
+	new = np.zeros(len(families))
+	for chrom in chromosomes:
+		original_overlaps(read_pos[chrom], read_index[chrom], group_pos[chrom], group_index[chrom], group_count, times_dict, count_in_index)
+		starts = np.array(read_pos[chrom][0::2], dtype=np.int64)
+		weights = 1.0 / (times[np.array(read_ids[chrom], dtype=np.int64)] * read_len)
+		new = new + family_overlaps(te_index.get(chrom), starts, starts + read_len - 1, weights, len(families))
+	old = np.array([count_in_index[groups[family]] for family in families])
+	assert old.sum() > 0
+	assert np.allclose(new, old, rtol=1e-12, atol=1e-12)
+
+# family_overlaps gives the per-family overlaps of the original sweep
+def test_family_overlaps_dense(tmp_path):
+	check_equivalence(tmp_path, 1, 400, 150, 6, 20000)
+
+def test_family_overlaps_sparse(tmp_path):
+	for seed in range(2, 6):
+		check_equivalence(tmp_path, seed, 300, 60, 12, 200000)
+
+# No copies on the chromosome, or no reads
+def test_family_overlaps_empty():
+	starts = np.array([10, 500], dtype=np.int64)
+	assert np.array_equal(family_overlaps(None, starts, starts + read_len - 1, np.ones(2), 3), np.zeros(3))
+	te_chr = (np.array([100], dtype=np.int64), np.array([200], dtype=np.int64), np.array([1], dtype=np.int32), 100)
+	empty = np.zeros(0, dtype=np.int64)
+	assert np.array_equal(family_overlaps(te_chr, empty, empty, np.zeros(0), 3), np.zeros(3))